@@ -0,0 +1,76 @@
+"""
+Select-to-paint latency benchmark for the details panel.
+
+Fills a throwaway database, then walks the selection through it the way
+arrow-key navigation does and times each show_connection() call up to
+the point where Tk has processed the resulting redraws.
+
+Usage: python benchmarks/bench_details.py [--connections N] [--selections N]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import customtkinter as ctk
+
+from core import database as db
+from ui.details import DetailsPanel
+
+
+def seed(count: int) -> list[dict]:
+    cat_ids = [db.add_category(f"Site {i}") for i in range(10)]
+    for i in range(count):
+        db.add_connection(
+            name=f"server-{i:05d}", hostname=f"10.0.{i // 256}.{i % 256}",
+            username=f"admin{i % 7}", category_id=cat_ids[i % len(cat_ids)],
+            notes="Patched monthly." if i % 3 == 0 else "",
+        )
+    return db.get_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--selections", type=int, default=300)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="rdpmanager-bench-"))
+    db.DB_DIR = tmp
+    db.DB_PATH = tmp / "connections.db"
+    db.init_db()
+    connections = seed(args.connections)
+
+    root = ctk.CTk()
+    root.geometry("900x700")
+    panel = DetailsPanel(root)
+    panel.pack(fill="both", expand=True)
+    root.update()
+
+    samples = []
+    for i in range(args.selections):
+        conn = connections[i % len(connections)]
+        start = time.perf_counter()
+        panel.show_connection(conn["id"], conn)
+        root.update_idletasks()
+        samples.append((time.perf_counter() - start) * 1000)
+    root.destroy()
+
+    samples.sort()
+    print(json.dumps({
+        "connections": args.connections,
+        "selections": args.selections,
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "max_ms": round(samples[-1], 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Reachability probe load benchmark against a fake fleet on loopback.
+
+A separate process starts asyncio listeners on 127.0.0.1, in four kinds:
+
+  healthy  answers the X.224 connection request at once
+  slow     answers after --slow-ms
+  stall    accepts the connection and never answers
+  refused  a port with nothing listening
+
+The probe engine then checks every one of them, either with probe_many on
+one event loop ("async", what the CLI uses) or with tcp_probe on a thread
+pool ("threads", what the sidebar uses). Prints a JSON summary with
+completion time, p50/p99 probe latency, misclassified hosts, and the peak
+thread count, open file descriptors and memory of the probing process.
+
+Usage: python benchmarks/bench_probe.py [--hosts N] [--mode async|threads]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from core import rdp  # noqa: E402
+
+# Enough of an X.224 Connection Confirm for the probe: a TPKT header.
+REPLY = bytes.fromhex("0300000b06d00000123400")
+KINDS = ("healthy", "slow", "stall", "refused")
+
+
+def _raise_fd_limit(wanted: int):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+
+def _refused_port() -> int:
+    # Bind and release: nothing listens there afterwards.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_fleet(plan: list, slow: float, ready, stop):
+    # Runs in its own process so its sockets and threads do not count
+    # against the prober.
+    _raise_fd_limit(len(plan) * 3 + 256)
+
+    async def serve():
+        async def answer(reader, writer, delay):
+            try:
+                await reader.read(64)
+                if delay is None:
+                    await asyncio.sleep(3600)
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write(REPLY)
+                await writer.drain()
+            except (OSError, asyncio.CancelledError):
+                pass
+            finally:
+                writer.close()
+
+        ports, servers = [None] * len(plan), []
+        for i, kind in enumerate(plan):
+            if kind == "refused":
+                continue
+            delay = {"healthy": 0, "slow": slow, "stall": None}[kind]
+            server = await asyncio.start_server(
+                lambda r, w, d=delay: answer(r, w, d), "127.0.0.1", 0, backlog=64)
+            servers.append(server)
+            ports[i] = server.sockets[0].getsockname()[1]
+        # Refused ports are picked last so no listener can reuse one.
+        taken = set(ports)
+        for i in range(len(plan)):
+            while ports[i] is None:
+                port = _refused_port()
+                if port not in taken:
+                    ports[i] = port
+                    taken.add(port)
+        ready.send(ports)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop.wait)
+        for server in servers:
+            server.close()
+
+    asyncio.run(serve())
+
+
+class Sampler:
+    # Polls the probing process's thread count and open descriptors.
+    def __init__(self, interval: float = 0.005):
+        self.peak_threads = threading.active_count()
+        self.peak_fds = _open_fds()
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            fds = _open_fds()
+            if fds is not None:
+                self.peak_fds = max(self.peak_fds, fds)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _open_fds() -> int | None:
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def probe_async(targets, timeout, concurrency, latencies):
+    return rdp.probe_many(targets, timeout=timeout, concurrency=concurrency,
+                          on_result=lambda key, alive, seconds: latencies.append(seconds))
+
+
+def probe_threads(targets, timeout, workers, latencies):
+    def one(target):
+        key, host, port = target
+        start = time.perf_counter()
+        alive = rdp.tcp_probe(host, port, timeout)
+        latencies.append(time.perf_counter() - start)
+        return key, alive
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(one, targets))
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", type=int, default=2000)
+    parser.add_argument("--mix", default="70,10,10,10",
+                        help="percent healthy,slow,stall,refused (default: 70,10,10,10)")
+    parser.add_argument("--slow-ms", type=float, default=300.0)
+    parser.add_argument("--timeout", type=float, default=rdp.PROBE_TIMEOUT)
+    parser.add_argument("--mode", choices=["async", "threads"], default="async")
+    parser.add_argument("--concurrency", type=int,
+                        help="probes in flight (default: 256 async, 16 threads as in the sidebar)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    weights = [float(w) for w in args.mix.split(",")]
+    rng = random.Random(args.seed)
+    plan = rng.choices(KINDS, weights=weights, k=args.hosts)
+    concurrency = args.concurrency or (rdp.PROBE_CONCURRENCY if args.mode == "async" else 16)
+    _raise_fd_limit(concurrency * 2 + 256)
+
+    ctx = multiprocessing.get_context("spawn")
+    ready_recv, ready_send = ctx.Pipe(duplex=False)
+    stop = ctx.Event()
+    fleet = ctx.Process(target=run_fleet, args=(plan, args.slow_ms / 1000, ready_send, stop), daemon=True)
+    fleet.start()
+    ports = ready_recv.recv()
+
+    targets = [(i, "127.0.0.1", port) for i, port in enumerate(ports)]
+    latencies = []
+    probe = probe_async if args.mode == "async" else probe_threads
+    with Sampler() as sampler:
+        started = time.perf_counter()
+        results = probe(targets, args.timeout, concurrency, latencies)
+        elapsed = time.perf_counter() - started
+    stop.set()
+    fleet.join(timeout=10)
+
+    expected_up = {"healthy": True, "slow": args.slow_ms / 1000 < args.timeout,
+                   "stall": False, "refused": False}
+    wrong = {kind: 0 for kind in KINDS}
+    for i, kind in enumerate(plan):
+        if results.get(i) != expected_up[kind]:
+            wrong[kind] += 1
+    latencies.sort()
+
+    summary = {
+        "mode": args.mode,
+        "hosts": args.hosts,
+        "fleet": {kind: plan.count(kind) for kind in KINDS},
+        "concurrency": concurrency,
+        "timeout_s": args.timeout,
+        "completion_s": round(elapsed, 3),
+        "probes_per_second": round(args.hosts / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "misclassified": wrong,
+        "peak_threads": sampler.peak_threads,
+        "peak_open_fds": sampler.peak_fds,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if any(wrong.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Time-to-first-paint regression benchmark.
+
+Launches the app repeatedly with --profile-startup --exit-after-first-paint
+and reads back the profile each run writes. Prints a JSON summary and
+exits non-zero when the median time to first paint exceeds --max-ms.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--max-ms MS]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_once(output: Path) -> dict:
+    subprocess.run(
+        [sys.executable, str(ROOT / "main.py"), "--multi-instance", "--profile-startup",
+         "--exit-after-first-paint", "--profile-output", str(output)],
+        cwd=str(ROOT), check=True, capture_output=True, timeout=120,
+    )
+    return json.loads(output.read_text(encoding="utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=1500.0,
+                        help="fail if the median time to first paint exceeds this")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="rdpmanager-startup-"))
+    reports = [run_once(tmp / f"run{i}.json") for i in range(args.runs)]
+
+    first_paint = sorted(r["marks"]["first_paint"] for r in reports)
+    phases = {}
+    for r in reports:
+        for p in r["phases"]:
+            phases.setdefault(p["name"], []).append(p["duration_ms"])
+
+    median = statistics.median(first_paint)
+    summary = {
+        "runs": args.runs,
+        "first_paint_ms": {
+            "min": first_paint[0],
+            "median": round(median, 2),
+            "max": first_paint[-1],
+        },
+        "phases_median_ms": {name: round(statistics.median(v), 2) for name, v in phases.items()},
+        "slowest_imports": reports[-1]["imports"][:10],
+        "max_ms": args.max_ms,
+        "passed": median <= args.max_ms,
+    }
+    print(json.dumps(summary, indent=2))
+    sys.exit(0 if summary["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
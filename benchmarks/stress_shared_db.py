@@ -0,0 +1,170 @@
+"""
+Shared-database stress test.
+
+Starts N writer processes against one database file. Each reads a random
+connection, waits a moment as a user would, then saves it with
+update_connection(expected_version=...). Prints a JSON summary of
+throughput, conflict and busy-error rates and write latency, and checks
+that no successful update was lost: every one of them must have bumped a
+row_version exactly once.
+
+Alongside the writers, one more process imports a CSV file of
+--import-rows connections, spending --encrypt-ms on each password as key
+derivation would. The writers must not see a busy error while it runs.
+
+Usage: python benchmarks/stress_shared_db.py [--writers N] [--seconds S] [--rows R]
+                                             [--import-rows I] [--encrypt-ms E]
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from core import database as db  # noqa: E402
+from core.importers import import_path  # noqa: E402
+
+
+def writer(job: tuple) -> dict:
+    path, wal, seconds, ids, think, seed = job
+    db.use_database(path, wal=wal)
+    rng = random.Random(seed)
+    ok = conflicts = busy = 0
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        conn_id = rng.choice(ids)
+        row = db.get_connection_by_id(conn_id)
+        time.sleep(rng.uniform(0, think))
+        start = time.perf_counter()
+        try:
+            db.update_connection(conn_id, expected_version=row["row_version"],
+                                 notes=f"writer {seed} edit {ok}")
+            ok += 1
+        except db.ConflictError:
+            conflicts += 1
+        except sqlite3.OperationalError:
+            busy += 1
+        latencies.append(time.perf_counter() - start)
+    retries = sum(child.value for _, child in db.BUSY_RETRY_COUNT.children())
+    return {"ok": ok, "conflicts": conflicts, "busy_errors": busy, "retries": retries,
+            "latencies": latencies}
+
+
+def importer(job: tuple) -> dict:
+    path, wal, csv_path, encrypt_seconds = job
+    db.use_database(path, wal=wal)
+
+    def encrypt(password: str) -> str:
+        time.sleep(encrypt_seconds)
+        return password[::-1]
+
+    start = time.perf_counter()
+    report = import_path(Path(csv_path), "csv", encrypt=encrypt, policy="keep")
+    return {"imported": report.imported, "errors": len(report.errors),
+            "seconds": time.perf_counter() - start}
+
+
+def write_import_file(path: Path, rows: int):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        out = csv.writer(f)
+        out.writerow(["name", "hostname", "username", "password"])
+        for i in range(rows):
+            out.writerow([f"import-{i}", f"import-{i}.test", "admin", f"secret-{i}"])
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--rows", type=int, default=200,
+                        help="rows the writers pick from; fewer rows means more conflicts")
+    parser.add_argument("--think-ms", type=float, default=5.0,
+                        help="longest pause between reading a row and saving it")
+    parser.add_argument("--import-rows", type=int, default=2000,
+                        help="connections imported while the writers run (0: no import)")
+    parser.add_argument("--encrypt-ms", type=float, default=1.0,
+                        help="time spent encrypting each imported password")
+    parser.add_argument("--db", help="database file to use (default: a fresh temporary one)")
+    parser.add_argument("--no-wal", action="store_true")
+    args = parser.parse_args()
+
+    path = Path(args.db) if args.db else Path(tempfile.mkdtemp(prefix="rdpmanager-stress-")) / "shared.db"
+    wal = not args.no_wal
+    db.use_database(path, wal=wal)
+    db.init_db()
+    db.bulk_insert({"name": f"stress-{i}", "hostname": f"stress-{i}.test"} for i in range(args.rows))
+    ids = [c["id"] for c in db.get_connections() if c["name"].startswith("stress-")][:args.rows]
+    versions_before = sum(c["row_version"] for c in db.get_connections() if c["id"] in set(ids))
+
+    jobs = [(str(path), wal, args.seconds, ids, args.think_ms / 1000, seed)
+            for seed in range(args.writers)]
+    import_file = path.with_name(path.stem + "-import.csv")
+    write_import_file(import_file, args.import_rows)
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(args.writers + 1) as pool:
+        pending = pool.apply_async(
+            importer, ((str(path), wal, str(import_file), args.encrypt_ms / 1000),)
+        ) if args.import_rows else None
+        results = pool.map(writer, jobs)
+        imported = pending.get() if pending else None
+    elapsed = time.perf_counter() - started
+
+    ok = sum(r["ok"] for r in results)
+    conflicts = sum(r["conflicts"] for r in results)
+    busy = sum(r["busy_errors"] for r in results)
+    attempts = ok + conflicts + busy
+    latencies = sorted(x for r in results for x in r["latencies"])
+    id_set = set(ids)
+    versions_after = sum(c["row_version"] for c in db.get_connections() if c["id"] in id_set)
+
+    summary = {
+        "database": str(path),
+        "wal": wal,
+        "writers": args.writers,
+        "rows": len(ids),
+        "seconds": round(elapsed, 2),
+        "attempts": attempts,
+        "committed": ok,
+        "commits_per_second": round(ok / elapsed, 1),
+        "conflicts": conflicts,
+        "conflict_rate": round(conflicts / attempts, 4) if attempts else 0.0,
+        "busy_errors": busy,
+        "busy_retries": sum(r["retries"] for r in results),
+        "write_latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "lost_updates": ok - (versions_after - versions_before),
+    }
+    if imported:
+        summary["import"] = {
+            "rows": args.import_rows,
+            "imported": imported["imported"],
+            "errors": imported["errors"],
+            "seconds": round(imported["seconds"], 2),
+        }
+    summary["passed"] = (summary["lost_updates"] == 0 and busy == 0
+                         and (not imported or imported["imported"] == args.import_rows))
+    print(json.dumps(summary, indent=2))
+    sys.exit(0 if summary["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import sys
+
+from core.cli import main
+
+# Guarded so spawned worker processes (the .rdp importer's process pool)
+# can re-import this module without running the command again.
+if __name__ == "__main__":
+    sys.exit(main())
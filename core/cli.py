@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import sys
+
+from core import database as db
+from core import tracing
+
+# This module must never import from ui: it is the entry point for scripts
+# and shell pipelines, where pulling in Tk would cost most of the runtime.
+
+TABLE_COLUMNS = [("id", 6), ("name", 32), ("hostname", 28), ("port", 6), ("username", 20), ("category", 20)]
+HIDDEN_FIELDS = {"encrypted_password"}
+
+
+class _Writer:
+    def __init__(self, fmt: str, columns=TABLE_COLUMNS):
+        self.fmt = fmt
+        self.columns = columns
+        self._header_done = False
+
+    def write(self, record: dict):
+        if self.fmt == "jsonl":
+            out = {k: v for k, v in record.items() if k not in HIDDEN_FIELDS}
+            sys.stdout.write(json.dumps(out, default=str) + "\n")
+        else:
+            if not self._header_done:
+                sys.stdout.write(self._line({name: name.upper() for name, _ in self.columns}))
+                self._header_done = True
+            sys.stdout.write(self._line(record))
+        sys.stdout.flush()
+
+    def _line(self, record: dict) -> str:
+        cells = []
+        for name, width in self.columns:
+            value = record.get(name)
+            text = "" if value is None else str(value)
+            if len(text) > width:
+                text = text[:width - 1] + "…"
+            cells.append(text.ljust(width))
+        return "  ".join(cells).rstrip() + "\n"
+
+
+def _with_category(record: dict, names: dict) -> dict:
+    record["category"] = names.get(record.get("category_id"), "")
+    return record
+
+
+def _resolve(target: str) -> list[dict]:
+    if target.isdigit():
+        found = db.get_connection_by_id(int(target))
+        return [found] if found else []
+    return db.find_connections(target)
+
+
+def _resolve_one(target: str) -> dict | None:
+    matches = _resolve(target)
+    if not matches:
+        print(f"error: no connection matches '{target}'", file=sys.stderr)
+        return None
+    if len(matches) > 1:
+        ids = ", ".join(str(m["id"]) for m in matches)
+        print(f"error: '{target}' is ambiguous (ids {ids}); use an id", file=sys.stderr)
+        return None
+    return matches[0]
+
+
+# --- Commands ---
+
+def cmd_list(args) -> int:
+    names = db.get_category_names()
+    category_id = None
+    if args.category:
+        category_id = next((cid for cid, name in names.items() if name == args.category), None)
+        if category_id is None:
+            print(f"error: unknown category '{args.category}'", file=sys.stderr)
+            return 1
+    writer = _Writer(args.format)
+    for record in db.iter_connections(category_id):
+        writer.write(_with_category(record, names))
+    return 0
+
+
+def cmd_search(args) -> int:
+    names = db.get_category_names()
+    writer = _Writer(args.format)
+    if args.exact:
+        for record in db.search_connections(args.query)[:args.limit]:
+            writer.write(_with_category(record, names))
+        return 0
+
+    from core.fuzzy import FuzzyIndex
+
+    connections = {c["id"]: c for c in db.iter_connections()}
+    index = FuzzyIndex()
+    index.rebuild(list(connections.values()))
+    for conn_id in index.rank(args.query, limit=args.limit):
+        writer.write(_with_category(connections[conn_id], names))
+    return 0
+
+
+def cmd_connect(args) -> int:
+    from core.encryption import DEFAULT_PASSPHRASE
+    from core.rdp import connect
+
+    conn = _resolve_one(args.target)
+    if conn is None:
+        return 1
+    cleanup = connect(
+        db.resolve_connection(conn), DEFAULT_PASSPHRASE, db.get_encryption_salt(),
+        progress=lambda stage: print(f"{conn['name']}: {stage}", file=sys.stderr),
+    )
+    db.update_last_connected(conn["id"])
+    _Writer(args.format).write(_with_category(conn, db.get_category_names()))
+    # The cleanup timer is a daemon thread; exiting now would leave the
+    # temporary .rdp file, and any staged credentials in the Windows
+    # credential store, behind.
+    staged = conn.get("username") and conn.get("encrypted_password")
+    print("Waiting to remove staged credentials..." if staged else
+          "Waiting to remove the temporary .rdp file...", file=sys.stderr)
+    cleanup.join()
+    return 0
+
+
+def cmd_probe(args) -> int:
+    from core.rdp import PROBE_TIMEOUT, probe_many
+
+    status = 0
+    if args.targets:
+        targets = []
+        for target in args.targets:
+            matches = _resolve(target)
+            if not matches:
+                print(f"error: no connection matches '{target}'", file=sys.stderr)
+                status = 1
+            targets.extend(matches)
+    else:
+        targets = list(db.iter_connections())
+
+    columns = [("id", 6), ("name", 32), ("hostname", 28), ("reachable", 9)]
+    writer = _Writer(args.format, columns)
+    by_id = {c["id"]: c for c in targets}
+
+    def report(conn_id, alive, seconds):
+        conn = by_id[conn_id]
+        writer.write({
+            "id": conn["id"], "name": conn["name"],
+            "hostname": conn["hostname"], "reachable": alive,
+        })
+
+    with tracing.span("cli.probe_batch", cat="probe", hosts=len(targets)):
+        probe_many(((c["id"], c["hostname"], c["port"]) for c in by_id.values()),
+                   timeout=args.timeout or PROBE_TIMEOUT, concurrency=args.workers, on_result=report)
+    return status
+
+
+DIFF_COLUMNS = [("action", 10), ("id", 6), ("name", 32), ("key", 40), ("changes", 60)]
+
+
+def _print_diff(diff: dict, fmt: str):
+    writer = _Writer(fmt, DIFF_COLUMNS)
+    for action, entries in diff.items():
+        for entry in entries:
+            record = dict(entry, action=action)
+            if fmt == "table" and "changes" in entry:
+                record["changes"] = "; ".join(f"{k}: {a} -> {b}" for k, (a, b) in entry["changes"].items())
+            writer.write(record)
+    summary = ", ".join(f"{len(entries)} {action}" for action, entries in diff.items())
+    print(f"Dry run: {summary}.", file=sys.stderr)
+
+
+def cmd_import(args) -> int:
+    policy = None if args.on_conflict == "append" else args.on_conflict
+    if args.file == "-":
+        data = json.load(sys.stdin)
+        if data.get("delta") and not args.dry_run:
+            count = db.apply_delta(data)
+            print(f"Applied {count} changes up to seq {data['seq']}.", file=sys.stderr)
+            return 0
+        if args.dry_run:
+            _print_diff(db.diff_import(db.json_records(data), policy or "keep"), args.format)
+            return 0
+        count = db.import_connections(data, policy=policy)
+        print(f"Imported {count} connections.", file=sys.stderr)
+        return 0
+
+    from core.encryption import DEFAULT_PASSPHRASE, make_encryptor
+    from core.importers import import_path
+
+    report = import_path(
+        args.file, fmt=args.type,
+        encrypt=make_encryptor(DEFAULT_PASSPHRASE, db.get_encryption_salt()),
+        policy=policy, dry_run=args.dry_run,
+    )
+    for source, message in report.errors:
+        print(f"{source}: {message}", file=sys.stderr)
+    if args.dry_run:
+        _print_diff(report.diff, args.format)
+    else:
+        print(f"Imported {report.imported} connections, {len(report.errors)} errors.", file=sys.stderr)
+    return 1 if report.errors else 0
+
+
+def cmd_export(args) -> int:
+    data = db.export_connections(since=args.since)
+    if args.output == "-":
+        json.dump(data, sys.stdout, indent=2, default=str)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, default=str)
+        print(f"Exported {len(data['connections'])} connections to {args.output}.", file=sys.stderr)
+    print(f"seq {data['seq']}", file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m core", description="RDP Manager command line")
+    parser.add_argument("--db", metavar="PATH",
+                        help="database file (default: $RDPMANAGER_DB or ~/.rdpmanager/connections.db)")
+    parser.add_argument("--no-wal", action="store_true",
+                        help="use SQLite's rollback journal instead of WAL (for files on a network share)")
+    parser.add_argument("--trace", metavar="PATH", help="write a Chrome trace of the command to PATH")
+    parser.add_argument("--metrics", metavar="PATH", help="write Prometheus metrics for the run to PATH")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_format(p):
+        p.add_argument("--format", choices=["jsonl", "table"], default="jsonl")
+
+    p = sub.add_parser("list", help="list connections")
+    p.add_argument("--category", help="only connections in this category")
+    add_format(p)
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("search", help="search connections, best match first")
+    p.add_argument("query")
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--exact", action="store_true", help="substring match instead of fuzzy ranking")
+    add_format(p)
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("connect", help="launch an RDP session")
+    p.add_argument("target", help="connection id, name or hostname")
+    add_format(p)
+    p.set_defaults(func=cmd_connect)
+
+    p = sub.add_parser("probe", help="check host reachability")
+    p.add_argument("targets", nargs="*", help="connection ids, names or hostnames (default: all)")
+    p.add_argument("--workers", type=int, default=256, help="probes in flight at once")
+    p.add_argument("--timeout", type=float, help="seconds before a host counts as down (default: 1.5)")
+    add_format(p)
+    p.set_defaults(func=cmd_probe)
+
+    p = sub.add_parser("import", help="import connections from a file or directory")
+    p.add_argument("file", help="JSON export, CSV, mRemoteNG confCons.xml, .rdp file or "
+                                "directory of .rdp files; - reads JSON from stdin")
+    p.add_argument("--type", choices=["json", "csv", "mremoteng", "rdp"],
+                   help="input format (default: from the file extension)")
+    p.add_argument("--on-conflict", choices=["keep", "overwrite", "newest", "append"], default="keep",
+                   help="when a host/port/user already exists: keep it, overwrite it, keep the more "
+                        "recently used one, or append a copy (default: keep)")
+    p.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    add_format(p)
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="export connections as JSON")
+    p.add_argument("--output", "-o", default="-", help="output path (default: stdout)")
+    p.add_argument("--since", type=int, metavar="SEQ",
+                   help="only changes and deletions after SEQ (the seq printed by an earlier export)")
+    p.set_defaults(func=cmd_export)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        tracing.enable()
+    if args.db or args.no_wal:
+        db.use_database(args.db or db.DB_PATH, wal=not args.no_wal)
+    db.init_db()
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # Downstream closed the pipe (e.g. `| head`); that is not an error.
+        # Point stdout at devnull so the flush at exit does not fail again.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 0
+    finally:
+        if args.trace:
+            tracing.dump(args.trace)
+        if args.metrics:
+            from core.metrics import write_textfile
+            write_textfile(args.metrics)
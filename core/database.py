@@ -2,28 +2,202 @@ import sqlite3
 import os
 import json
 import base64
+import random
+import time
+import functools
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 
+from core.encryption import generate_salt
+from core.smart import compile_folder
+from core.tags import normalize_tags
+from core.templates import SETTINGS, TemplateTree
+from core import metrics
+from core.tracing import traced
+
 
 DB_DIR = Path.home() / ".rdpmanager"
-DB_PATH = DB_DIR / "connections.db"
+DB_PATH = Path(os.environ.get("RDPMANAGER_DB") or DB_DIR / "connections.db")
+
+# Several processes (instances on other machines, the CLI, scripts) may
+# share one database file. A writer that finds it locked waits up to
+# BUSY_TIMEOUT seconds, and a call that still fails is retried from the
+# start BUSY_RETRIES times with jittered backoff.
+BUSY_TIMEOUT = 10.0
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+# WAL lets readers and one writer proceed together, but needs shared
+# memory on one machine. The default local database keeps SQLite's
+# rollback journal unless WAL is asked for; a shared file set through
+# RDPMANAGER_DB or use_database() runs in WAL.
+USE_WAL = bool(os.environ.get("RDPMANAGER_DB"))
+# How many of this process's recent write transactions are remembered so
+# the watcher can leave them out (see own_changes()).
+OWN_WRITES_KEPT = 256
+
+
+QUERY_SECONDS = metrics.histogram(
+    "rdpmanager_db_query_seconds", "Latency of core.database calls", ["query"],
+)
+CACHE_REQUESTS = metrics.counter(
+    "rdpmanager_cache_requests_total", "Lookups served by in-process caches", ["cache", "result"],
+)
+
+BUSY_RETRY_COUNT = metrics.counter(
+    "rdpmanager_db_busy_retries_total", "Calls retried because the database was locked", ["query"],
+)
+CONFLICTS = metrics.counter(
+    "rdpmanager_db_conflicts_total", "Updates rejected because the row changed underneath them",
+)
+
+
+class ConflictError(Exception):
+    # Raised by update_connection when the row's row_version is no longer
+    # the one the caller read. current is the row as it is now, or None if
+    # it was deleted.
+    def __init__(self, conn_id: int, current: dict | None):
+        self.conn_id = conn_id
+        self.current = current
+        what = "deleted" if current is None else "changed"
+        super().__init__(f"connection {conn_id} was {what} by another writer")
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _retrying(fn, retries_metric):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(BUSY_RETRIES):
+            try:
+                return fn(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e):
+                    raise
+            retries_metric.inc()
+            time.sleep(BUSY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def _query(fn=None, *, retry: bool = True):
+    # Every public query is traced and timed into QUERY_SECONDS. Calls are
+    # retried while the database is locked unless they consume an iterator
+    # that a second attempt could not replay (retry=False). A function that
+    # only calls other queries is just @traced: its queries retry and time
+    # themselves, and retrying the whole could repeat a committed step.
+    def decorate(fn):
+        timed = metrics.timed(QUERY_SECONDS.labels(query=fn.__name__))(fn)
+        if retry:
+            timed = _retrying(timed, BUSY_RETRY_COUNT.labels(query=fn.__name__))
+        return traced(cat="db")(timed)
+    return decorate(fn) if fn is not None else decorate
+
+
+def use_database(path, wal: bool = True):
+    # Points this process at another database file, e.g. a shared one;
+    # wal=False keeps it in rollback journal mode, e.g. on a network share.
+    global DB_PATH, USE_WAL
+    DB_PATH = Path(path).expanduser()
+    USE_WAL = wal
+    # Change sequence numbers belong to one database file.
+    _own_writes.clear()
+    invalidate_category_cache()
+    invalidate_template_cache()
+    _touch_all()
 
 
 def get_db_path() -> Path:
-    DB_DIR.mkdir(parents=True, exist_ok=True)
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     return DB_PATH
 
 
+# (before, after] ranges of change_seq used by write transactions this
+# process committed, oldest first.
+_own_writes = deque(maxlen=OWN_WRITES_KEPT)
+_WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+class _Connection(sqlite3.Connection):
+    # Begins write transactions itself, as isolation_level would, so it can
+    # read change_counter first; once the transaction commits, the range of
+    # change_seq values it used is added to _own_writes. The write lock is
+    # held from BEGIN IMMEDIATE to COMMIT, so nobody else's changes fall in
+    # that range.
+    _seq_before = None
+
+    def execute(self, sql, parameters=(), /):
+        self._begin(sql)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, parameters, /):
+        self._begin(sql)
+        return super().executemany(sql, parameters)
+
+    def _begin(self, sql: str):
+        if self.in_transaction or not sql.lstrip()[:7].upper().startswith(_WRITE_STATEMENTS):
+            return
+        super().execute("BEGIN IMMEDIATE")
+        self._seq_before = self._seq()
+
+    def _seq(self) -> int | None:
+        try:
+            return super().execute("SELECT seq FROM change_counter").fetchone()[0]
+        except sqlite3.OperationalError:
+            # init_db has not created the table yet.
+            return None
+
+    def _written(self) -> tuple | None:
+        before, self._seq_before = self._seq_before, None
+        if before is None or not self.in_transaction:
+            return None
+        after = self._seq()
+        return (before, after) if after is not None and after > before else None
+
+    def commit(self):
+        written = self._written()
+        super().commit()
+        if written:
+            _own_writes.append(written)
+
+    def __exit__(self, exc_type, exc, tb):
+        written = self._written() if exc_type is None else None
+        result = super().__exit__(exc_type, exc, tb)
+        if written:
+            _own_writes.append(written)
+        return result
+
+
+def own_changes(since: int) -> list[tuple[int, int]]:
+    # (before, after] change_seq ranges newer than since that this process
+    # wrote itself and so has already applied.
+    return [(before, after) for before, after in list(_own_writes) if after > since]
+
+
 def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(str(get_db_path()))
+    # IMMEDIATE takes the write lock when a write transaction begins, so
+    # two writers queue on the busy timeout instead of one failing when it
+    # tries to upgrade a read lock.
+    conn = sqlite3.connect(str(get_db_path()), timeout=BUSY_TIMEOUT, isolation_level="IMMEDIATE",
+                           factory=_Connection)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
 
+@_query
 def init_db():
     conn = get_connection()
+    # The journal mode is persistent in the file, so it is set both ways:
+    # a database once switched to WAL would otherwise stay in WAL.
+    # synchronous=NORMAL is durable under WAL.
+    if USE_WAL:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    else:
+        conn.execute("PRAGMA journal_mode = DELETE")
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS settings (
             key TEXT PRIMARY KEY,
@@ -33,7 +207,11 @@ def init_db():
         CREATE TABLE IF NOT EXISTS categories (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL UNIQUE,
-            sort_order INTEGER DEFAULT 0
+            sort_order INTEGER DEFAULT 0,
+            uid TEXT,
+            updated_at TEXT,
+            row_version INTEGER DEFAULT 1,
+            change_seq INTEGER DEFAULT 0
         );
 
         CREATE TABLE IF NOT EXISTS connections (
@@ -53,16 +231,199 @@ def init_db():
             redirect_drives INTEGER DEFAULT 0,
             notes TEXT DEFAULT '',
             last_connected TEXT,
+            connect_count INTEGER DEFAULT 0,
+            identity_key TEXT,
             created_at TEXT DEFAULT (datetime('now')),
+            uid TEXT,
+            updated_at TEXT,
+            row_version INTEGER DEFAULT 1,
+            change_seq INTEGER DEFAULT 0,
             FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL
         );
+
+        CREATE TABLE IF NOT EXISTS change_counter (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO change_counter (id, seq) VALUES (1, 1);
+
+        CREATE TABLE IF NOT EXISTS tombstones (
+            uid TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            change_seq INTEGER NOT NULL,
+            deleted_at TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS connection_tags (
+            connection_id INTEGER NOT NULL REFERENCES connections(id) ON DELETE CASCADE,
+            tag_id INTEGER NOT NULL REFERENCES tags(id) ON DELETE CASCADE,
+            PRIMARY KEY (connection_id, tag_id)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            parent_id INTEGER REFERENCES templates(id) ON DELETE SET NULL,
+            screen_mode INTEGER,
+            desktop_width INTEGER,
+            desktop_height INTEGER,
+            color_depth INTEGER,
+            redirect_clipboard INTEGER,
+            redirect_printers INTEGER,
+            redirect_drives INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS smart_folders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            query TEXT NOT NULL,
+            sort_order INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT (datetime('now'))
+        );
+    """)
+    added = _ensure_columns(conn, "connections", {
+        "connect_count": "INTEGER DEFAULT 0",
+        "identity_key": "TEXT",
+        **CHANGE_LOG_COLUMNS,
+        **TEMPLATE_COLUMN,
+    })
+    if "identity_key" in added:
+        _backfill_identity_keys(conn)
+    _ensure_columns(conn, "categories", {**CHANGE_LOG_COLUMNS, **TEMPLATE_COLUMN})
+    _backfill_change_log(conn)
+    _ensure_triggers(conn, {
+        **_change_log_triggers("connections", CONNECTION_FIELDS),
+        **_change_log_triggers("categories", ["name", "sort_order", "template_id"]),
+    })
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_connections_category ON connections(category_id, name);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_connections_identity ON connections(identity_key);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_connections_uid ON connections(uid);
+        CREATE INDEX IF NOT EXISTS idx_connections_change_seq ON connections(change_seq);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_uid ON categories(uid);
+        CREATE INDEX IF NOT EXISTS idx_tombstones_change_seq ON tombstones(change_seq);
+        CREATE INDEX IF NOT EXISTS idx_connection_tags_tag ON connection_tags(tag_id);
     """)
     conn.commit()
     conn.close()
 
 
+def _ensure_columns(conn: sqlite3.Connection, table: str, columns: dict) -> list[str]:
+    # Databases created by older versions predate some columns; add them in
+    # place so existing data survives upgrades.
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    added = []
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+            added.append(name)
+    return added
+
+
+# --- Change log ---
+#
+# Every row of connections and categories carries a stable uid (ids differ
+# between machines), updated_at, a row_version bumped on each edit and the
+# change_seq of its last edit, drawn from one monotonic counter. Deletes
+# leave a tombstone with their own change_seq. Triggers keep all of this up
+# to date, so "what changed since seq N" is an indexed range scan. Edits
+# that only touch usage fields (last_connected, connect_count) are not
+# logged.
+
+CHANGE_LOG_COLUMNS = {
+    "uid": "TEXT",
+    "updated_at": "TEXT",
+    "row_version": "INTEGER DEFAULT 1",
+    "change_seq": "INTEGER DEFAULT 0",
+}
+
+
+def _backfill_change_log(conn: sqlite3.Connection):
+    # Rows from before the change log get a uid and count as changed at
+    # seq 1, so a delta since 0 is a full export.
+    for table in ("connections", "categories"):
+        conn.execute(f"""
+            UPDATE {table} SET
+                uid = lower(hex(randomblob(16))),
+                updated_at = COALESCE(updated_at, datetime('now')),
+                change_seq = 1
+            WHERE uid IS NULL
+        """)
+
+
+def _change_log_triggers(table: str, columns: list[str]) -> dict[str, str]:
+    # name -> CREATE TRIGGER statement. The insert trigger's own UPDATE
+    # changes change_seq, which the update trigger's WHEN clause uses to
+    # ignore it. Inserts that set change_seq themselves (bulk_insert) are
+    # left alone. A caller that sets updated_at explicitly (applying a
+    # delta) keeps that timestamp.
+    changed = " OR ".join(f"NEW.{c} IS NOT OLD.{c}" for c in columns)
+    return {
+        f"{table}_log_insert": f"""CREATE TRIGGER {table}_log_insert AFTER INSERT ON {table}
+        WHEN NEW.change_seq = 0
+        BEGIN
+            UPDATE change_counter SET seq = seq + 1;
+            DELETE FROM tombstones WHERE uid = NEW.uid;
+            UPDATE {table} SET
+                change_seq = (SELECT seq FROM change_counter),
+                updated_at = COALESCE(NEW.updated_at, datetime('now')),
+                uid = COALESCE(NEW.uid, lower(hex(randomblob(16))))
+            WHERE id = NEW.id;
+        END""",
+        f"{table}_log_update": f"""CREATE TRIGGER {table}_log_update AFTER UPDATE ON {table}
+        WHEN NEW.change_seq IS OLD.change_seq AND ({changed})
+        BEGIN
+            UPDATE change_counter SET seq = seq + 1;
+            UPDATE {table} SET
+                change_seq = (SELECT seq FROM change_counter),
+                row_version = OLD.row_version + 1,
+                updated_at = CASE WHEN NEW.updated_at IS OLD.updated_at
+                                  THEN datetime('now') ELSE NEW.updated_at END
+            WHERE id = NEW.id;
+        END""",
+        f"{table}_log_delete": f"""CREATE TRIGGER {table}_log_delete AFTER DELETE ON {table}
+        BEGIN
+            UPDATE change_counter SET seq = seq + 1;
+            INSERT OR REPLACE INTO tombstones (uid, kind, change_seq, deleted_at)
+            VALUES (OLD.uid, '{table}', (SELECT seq FROM change_counter), datetime('now'));
+        END""",
+    }
+
+
+def _ensure_triggers(conn: sqlite3.Connection, triggers: dict[str, str]):
+    # Recreates only the triggers whose stored SQL differs, e.g. an update
+    # trigger from before a column was added. Leaving the others alone
+    # keeps the file unmodified on a normal start, so the startup snapshot
+    # (see core.snapshot) stays valid after a crash.
+    stored = {r["name"]: r["sql"] for r in conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")}
+    for name, sql in triggers.items():
+        if stored.get(name) != sql:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+            conn.execute(sql)
+
+
+def _backfill_identity_keys(conn: sqlite3.Connection):
+    # The oldest row keeps the key; later duplicates are left NULL so the
+    # unique index can be created over existing data.
+    seen = set()
+    updates = []
+    for row in conn.execute("SELECT id, hostname, port, username FROM connections ORDER BY id"):
+        key = identity_key(row["hostname"], row["port"], row["username"])
+        if key is not None and key not in seen:
+            seen.add(key)
+            updates.append((key, row["id"]))
+    conn.executemany("UPDATE connections SET identity_key = ? WHERE id = ?", updates)
+
+
 # --- Settings ---
 
+@_query
 def get_setting(key: str) -> str | None:
     conn = get_connection()
     row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
@@ -70,6 +431,7 @@ def get_setting(key: str) -> str | None:
     return row["value"] if row else None
 
 
+@_query
 def set_setting(key: str, value: str):
     conn = get_connection()
     conn.execute(
@@ -80,8 +442,85 @@ def set_setting(key: str, value: str):
     conn.close()
 
 
+def get_encryption_salt() -> bytes:
+    salt_b64 = get_setting("encryption_salt")
+    if salt_b64:
+        return base64.b64decode(salt_b64)
+    salt = generate_salt()
+    set_setting("encryption_salt", base64.b64encode(salt).decode())
+    return salt
+
+
+# --- Data versions ---
+
+# Writes made through this module bump a per-category version so callers
+# can tell whether rows they cached for a category are still current.
+# Categories never touched since the last full reset share the reset value.
+_version = 0
+_reset_version = 0
+_category_versions = {}
+
+
+def data_version() -> int:
+    return _version
+
+
+def category_version(category_id: int | None) -> int:
+    return _category_versions.get(category_id, _reset_version)
+
+
+def _touch(*category_ids):
+    global _version
+    _version += 1
+    for cid in category_ids:
+        _category_versions[cid] = _version
+
+
+def _touch_all():
+    global _version, _reset_version
+    _version += 1
+    _reset_version = _version
+    _category_versions.clear()
+
+
+def invalidate_connections(category_ids=None):
+    # For writes that did not go through this module (see core.watcher):
+    # rows cached for category_ids, or for every category when None, are
+    # no longer current.
+    if category_ids is None:
+        invalidate_category_cache()
+        _touch_all()
+    else:
+        _touch(*category_ids)
+
+
+def _category_of(conn: sqlite3.Connection, conn_id: int) -> int | None:
+    row = conn.execute("SELECT category_id FROM connections WHERE id = ?", (conn_id,)).fetchone()
+    return row["category_id"] if row else None
+
+
 # --- Categories ---
 
+# id -> name, loaded on first use and dropped whenever categories change.
+_category_names = None
+
+
+def get_category_names() -> dict[int, str]:
+    global _category_names
+    if _category_names is None:
+        CACHE_REQUESTS.inc(cache="category_names", result="miss")
+        _category_names = {c["id"]: c["name"] for c in get_categories()}
+    else:
+        CACHE_REQUESTS.inc(cache="category_names", result="hit")
+    return _category_names
+
+
+def invalidate_category_cache():
+    global _category_names
+    _category_names = None
+
+
+@_query
 def get_categories() -> list[dict]:
     conn = get_connection()
     rows = conn.execute("SELECT * FROM categories ORDER BY sort_order, name").fetchall()
@@ -89,31 +528,84 @@ def get_categories() -> list[dict]:
     return [dict(r) for r in rows]
 
 
+@_query
 def add_category(name: str) -> int:
     conn = get_connection()
     cur = conn.execute("INSERT INTO categories (name) VALUES (?)", (name,))
     conn.commit()
     cat_id = cur.lastrowid
     conn.close()
+    invalidate_category_cache()
     return cat_id
 
 
+@_query
 def rename_category(cat_id: int, new_name: str):
     conn = get_connection()
     conn.execute("UPDATE categories SET name = ? WHERE id = ?", (new_name, cat_id))
     conn.commit()
     conn.close()
+    invalidate_category_cache()
 
 
+@_query
 def delete_category(cat_id: int):
     conn = get_connection()
     conn.execute("DELETE FROM categories WHERE id = ?", (cat_id,))
     conn.commit()
     conn.close()
+    invalidate_category_cache()
+    _touch(cat_id, None)
+
+
+@_query
+def get_category_counts() -> dict[int | None, int]:
+    # One aggregate query; uncategorized connections are counted under None.
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT category_id, COUNT(*) AS n FROM connections GROUP BY category_id"
+    ).fetchall()
+    conn.close()
+    return {r["category_id"]: r["n"] for r in rows}
 
 
 # --- Connections ---
 
+CONFLICT_POLICIES = ("keep", "overwrite", "newest")
+
+# Binds the identity key only if no other row holds it yet, so a copy of an
+# existing host is stored with a NULL key instead of failing the unique index.
+_FREE_KEY = "(SELECT ? WHERE NOT EXISTS (SELECT 1 FROM connections WHERE identity_key = ? AND id IS NOT ?))"
+
+
+def identity_key(hostname: str | None, port, username: str | None) -> str | None:
+    # Two connections to the same host, port and account are the same entry
+    # regardless of letter case or a trailing dot on the hostname.
+    host = (hostname or "").strip().lower().rstrip(".")
+    if not host:
+        return None
+    try:
+        port = int(port or 3389)
+    except (TypeError, ValueError):
+        port = 3389
+    return f"{host}:{port}:{(username or '').strip().lower()}"
+
+
+BULK_PROGRESS_EVERY = 500
+
+INSERT_FIELDS = [
+    "name", "hostname", "port", "username", "encrypted_password",
+    "category_id", "screen_mode", "desktop_width", "desktop_height",
+    "color_depth", "redirect_clipboard", "redirect_printers",
+    "redirect_drives", "notes",
+]
+# Template ids are local to a database, so they are edited like any other
+# field but not exported or imported; exports carry resolved settings.
+CONNECTION_FIELDS = INSERT_FIELDS + ["template_id"]
+TEMPLATE_COLUMN = {"template_id": "INTEGER REFERENCES templates(id) ON DELETE SET NULL"}
+
+
+@_query
 def get_connections(category_id: int | None = None) -> list[dict]:
     conn = get_connection()
     if category_id is not None:
@@ -126,6 +618,50 @@ def get_connections(category_id: int | None = None) -> list[dict]:
     return [dict(r) for r in rows]
 
 
+def iter_connections(category_id: int | None = None):
+    conn = get_connection()
+    try:
+        if category_id is not None:
+            cur = conn.execute(
+                "SELECT * FROM connections WHERE category_id = ? ORDER BY name", (category_id,)
+            )
+        else:
+            cur = conn.execute("SELECT * FROM connections ORDER BY name")
+        for row in cur:
+            yield dict(row)
+    finally:
+        conn.close()
+
+
+@_query
+def read_snapshot() -> tuple[list, list, list, int]:
+    # Categories, smart folders, every connection and the change_seq they
+    # were read at, all from one read transaction (see core.snapshot).
+    conn = get_connection()
+    try:
+        conn.execute("BEGIN")
+        categories = conn.execute("SELECT * FROM categories ORDER BY sort_order, name").fetchall()
+        folders = conn.execute("SELECT * FROM smart_folders ORDER BY sort_order, name").fetchall()
+        rows = conn.execute("SELECT * FROM connections ORDER BY name").fetchall()
+        seq = conn.execute("SELECT seq FROM change_counter").fetchone()["seq"]
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return [dict(r) for r in categories], [dict(r) for r in folders], [dict(r) for r in rows], seq
+
+
+@_query
+def find_connections(name_or_host: str) -> list[dict]:
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT * FROM connections WHERE name = ? COLLATE NOCASE OR hostname = ? COLLATE NOCASE ORDER BY name",
+        (name_or_host, name_or_host),
+    ).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+@_query
 def get_connections_uncategorized() -> list[dict]:
     conn = get_connection()
     rows = conn.execute(
@@ -135,6 +671,19 @@ def get_connections_uncategorized() -> list[dict]:
     return [dict(r) for r in rows]
 
 
+@_query
+def get_recent_connections() -> list[dict]:
+    # Only what frecency ranking and a launcher menu need.
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT id, name, hostname, category_id, last_connected, connect_count "
+        "FROM connections WHERE last_connected IS NOT NULL"
+    ).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+@_query
 def get_connection_by_id(conn_id: int) -> dict | None:
     conn = get_connection()
     row = conn.execute("SELECT * FROM connections WHERE id = ?", (conn_id,)).fetchone()
@@ -142,66 +691,412 @@ def get_connection_by_id(conn_id: int) -> dict | None:
     return dict(row) if row else None
 
 
+@_query
 def add_connection(**kwargs) -> int:
-    fields = [
-        "name", "hostname", "port", "username", "encrypted_password",
-        "category_id", "screen_mode", "desktop_width", "desktop_height",
-        "color_depth", "redirect_clipboard", "redirect_printers",
-        "redirect_drives", "notes",
-    ]
-    data = {f: kwargs.get(f) for f in fields if f in kwargs}
+    # RDP settings not given are stored as NULL and inherited (see
+    # core.templates) rather than taking the column defaults.
+    data = {**dict.fromkeys(SETTINGS), **{f: kwargs.get(f) for f in CONNECTION_FIELDS if f in kwargs}}
+    key = identity_key(data.get("hostname"), data.get("port"), data.get("username"))
     cols = ", ".join(data.keys())
     placeholders = ", ".join(["?"] * len(data))
     conn = get_connection()
     cur = conn.execute(
-        f"INSERT INTO connections ({cols}) VALUES ({placeholders})",
-        list(data.values()),
+        f"INSERT INTO connections ({cols}, identity_key) VALUES ({placeholders}, {_FREE_KEY})",
+        list(data.values()) + [key, key, None],
     )
     conn.commit()
     conn_id = cur.lastrowid
     conn.close()
+    _touch(data.get("category_id"))
     return conn_id
 
 
-def update_connection(conn_id: int, **kwargs):
-    fields = [
-        "name", "hostname", "port", "username", "encrypted_password",
-        "category_id", "screen_mode", "desktop_width", "desktop_height",
-        "color_depth", "redirect_clipboard", "redirect_printers",
-        "redirect_drives", "notes", "last_connected",
-    ]
-    data = {f: kwargs[f] for f in fields if f in kwargs}
+@_query
+def update_connection(conn_id: int, expected_version: int | None = None, **kwargs):
+    # With expected_version (the row_version read before editing) the
+    # update only applies if nobody else has changed the row since;
+    # otherwise ConflictError is raised and nothing is written.
+    data = {f: kwargs[f] for f in CONNECTION_FIELDS + ["last_connected"] if f in kwargs}
     if not data:
         return
-    set_clause = ", ".join(f"{k} = ?" for k in data)
     conn = get_connection()
-    conn.execute(
-        f"UPDATE connections SET {set_clause} WHERE id = ?",
-        list(data.values()) + [conn_id],
-    )
+    current = conn.execute(
+        "SELECT category_id, hostname, port, username FROM connections WHERE id = ?", (conn_id,)
+    ).fetchone()
+    old_category = current["category_id"] if current else None
+    params = list(data.values())
+    set_clause = ", ".join(f"{k} = ?" for k in data)
+    if current and {"hostname", "port", "username"} & data.keys():
+        merged = {**dict(current), **data}
+        key = identity_key(merged["hostname"], merged["port"], merged["username"])
+        set_clause += f", identity_key = {_FREE_KEY}"
+        params += [key, key, conn_id]
+    where = "id = ?"
+    params.append(conn_id)
+    if expected_version is not None:
+        where += " AND row_version = ?"
+        params.append(expected_version)
+    updated = conn.execute(f"UPDATE connections SET {set_clause} WHERE {where}", params).rowcount
+    if not updated and expected_version is not None:
+        conn.rollback()
+        row = conn.execute("SELECT * FROM connections WHERE id = ?", (conn_id,)).fetchone()
+        conn.close()
+        CONFLICTS.inc()
+        raise ConflictError(conn_id, dict(row) if row else None)
     conn.commit()
     conn.close()
+    _touch(old_category, data.get("category_id", old_category))
 
 
+@_query
 def delete_connection(conn_id: int):
     conn = get_connection()
+    old_category = _category_of(conn, conn_id)
     conn.execute("DELETE FROM connections WHERE id = ?", (conn_id,))
     conn.commit()
     conn.close()
+    _touch(old_category)
+
+
+# --- Tags ---
+
+@_query
+def get_tags() -> dict[str, int]:
+    # Tag name -> number of connections carrying it.
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT t.name, COUNT(*) AS n FROM tags t
+        JOIN connection_tags ct ON ct.tag_id = t.id
+        GROUP BY t.id ORDER BY t.name
+    """).fetchall()
+    conn.close()
+    return {r["name"]: r["n"] for r in rows}
+
+
+@_query
+def get_tag_pairs(ids=None) -> list[tuple[int, str]]:
+    # (connection_id, tag) for every tag, or only for the given connections;
+    # the input for core.tags.TagIndex.
+    conn = get_connection()
+    sql = "SELECT ct.connection_id, t.name FROM connection_tags ct JOIN tags t ON t.id = ct.tag_id"
+    if ids is None:
+        rows = conn.execute(sql).fetchall()
+    else:
+        rows = conn.execute(f"{sql} WHERE ct.connection_id IN {_IDS}", (json.dumps(list(ids)),)).fetchall()
+    conn.close()
+    return [(r[0], r[1]) for r in rows]
+
+
+@traced(cat="db")
+def get_connection_tags(conn_id: int) -> list[str]:
+    return sorted(tag for _, tag in get_tag_pairs([conn_id]))
+
+
+@_query
+def set_connection_tags(conn_id: int, tags) -> list[str]:
+    # Replaces the connection's tags. Tags are not a column of the row, so
+    # the change log entry is made here rather than by the update trigger.
+    tags = normalize_tags(tags)
+    conn = get_connection()
+    try:
+        with conn:
+            current = {r[0] for r in conn.execute(
+                "SELECT t.name FROM connection_tags ct JOIN tags t ON t.id = ct.tag_id "
+                "WHERE ct.connection_id = ?", (conn_id,))}
+            if current == set(tags):
+                return tags
+            conn.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(t,) for t in tags])
+            conn.execute("DELETE FROM connection_tags WHERE connection_id = ?", (conn_id,))
+            conn.execute(
+                "INSERT INTO connection_tags (connection_id, tag_id) "
+                "SELECT ?, id FROM tags WHERE name IN (SELECT value FROM json_each(?))",
+                (conn_id, json.dumps(tags)),
+            )
+            conn.execute("DELETE FROM tags WHERE id NOT IN (SELECT tag_id FROM connection_tags)")
+            conn.execute("UPDATE change_counter SET seq = seq + 1")
+            conn.execute("""
+                UPDATE connections SET
+                    change_seq = (SELECT seq FROM change_counter),
+                    row_version = row_version + 1,
+                    updated_at = datetime('now')
+                WHERE id = ?
+            """, (conn_id,))
+            category = _category_of(conn, conn_id)
+    finally:
+        conn.close()
+    _touch(category)
+    return tags
+
+
+# --- Templates ---
+
+# Loaded on first use; edits made here patch it, other writers drop it
+# (see core.watcher).
+_template_tree = None
+
+
+def invalidate_template_cache():
+    global _template_tree
+    _template_tree = None
+
+
+def template_tree() -> TemplateTree:
+    global _template_tree
+    if _template_tree is None:
+        CACHE_REQUESTS.inc(cache="templates", result="miss")
+        conn = get_connection()
+        templates = [dict(r) for r in conn.execute("SELECT * FROM templates")]
+        categories = {r["id"]: r["template_id"] for r in conn.execute(
+            "SELECT id, template_id FROM categories WHERE template_id IS NOT NULL")}
+        conn.close()
+        _template_tree = TemplateTree(templates, categories)
+    else:
+        CACHE_REQUESTS.inc(cache="templates", result="hit")
+    return _template_tree
+
+
+def effective_settings(connection: dict) -> dict:
+    return template_tree().effective(connection)
+
+
+def resolve_connection(connection: dict) -> dict:
+    # A copy of the row with every inherited setting filled in, as
+    # generate_rdp_file and the details panel need it.
+    return {**connection, **effective_settings(connection)}
+
+
+def inherited_settings(template_id: int | None, category_id: int | None) -> dict:
+    # What a connection with this template and category gets for the
+    # settings it does not set itself.
+    return template_tree().base(template_id, category_id)
+
+
+@_query
+def get_templates() -> list[dict]:
+    conn = get_connection()
+    rows = conn.execute("SELECT * FROM templates ORDER BY name").fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def _check_parent(template_id: int, parent_id: int | None):
+    if parent_id == template_id or template_tree().would_cycle(template_id, parent_id):
+        raise ValueError("A template cannot inherit from itself")
+
+
+@_query
+def add_template(name: str, parent_id: int | None = None, **settings) -> int:
+    # Settings left out or None are inherited from the parent.
+    data = {"name": name, "parent_id": parent_id,
+            **{f: settings.get(f) for f in SETTINGS}}
+    conn = get_connection()
+    cur = conn.execute(
+        f"INSERT INTO templates ({', '.join(data)}) VALUES ({', '.join('?' * len(data))})",
+        list(data.values()),
+    )
+    conn.commit()
+    template_id = cur.lastrowid
+    conn.close()
+    if _template_tree is not None:
+        _template_tree.put({"id": template_id, **data})
+    return template_id
+
+
+@_query
+def update_template(template_id: int, **fields):
+    data = {f: fields[f] for f in ("name", "parent_id", *SETTINGS) if f in fields}
+    if not data:
+        return
+    if "parent_id" in data:
+        _check_parent(template_id, data["parent_id"])
+    conn = get_connection()
+    conn.execute(f"UPDATE templates SET {', '.join(f'{k} = ?' for k in data)} WHERE id = ?",
+                 list(data.values()) + [template_id])
+    conn.commit()
+    row = conn.execute("SELECT * FROM templates WHERE id = ?", (template_id,)).fetchone()
+    conn.close()
+    if _template_tree is not None and row is not None:
+        _template_tree.put(dict(row))
+
+
+@_query
+def delete_template(template_id: int):
+    # Child templates, categories and connections that used it stop
+    # inheriting from it (ON DELETE SET NULL).
+    conn = get_connection()
+    conn.execute("DELETE FROM templates WHERE id = ?", (template_id,))
+    conn.commit()
+    conn.close()
+    if _template_tree is not None:
+        _template_tree.remove(template_id)
+    _touch_all()
+
+
+@_query
+def set_category_template(cat_id: int, template_id: int | None):
+    conn = get_connection()
+    conn.execute("UPDATE categories SET template_id = ? WHERE id = ?", (template_id, cat_id))
+    conn.commit()
+    conn.close()
+    if _template_tree is not None:
+        _template_tree.set_category_template(cat_id, template_id)
+    _touch(cat_id)
+
+
+# --- Smart folders ---
+
+@_query
+def get_smart_folders() -> list[dict]:
+    conn = get_connection()
+    rows = conn.execute("SELECT * FROM smart_folders ORDER BY sort_order, name").fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+@_query
+def add_smart_folder(name: str, query: str) -> int:
+    # Raises core.tags.TagQueryError for a malformed query.
+    compile_folder(query)
+    conn = get_connection()
+    cur = conn.execute("INSERT INTO smart_folders (name, query) VALUES (?, ?)", (name, query.strip()))
+    conn.commit()
+    folder_id = cur.lastrowid
+    conn.close()
+    return folder_id
+
+
+@_query
+def update_smart_folder(folder_id: int, name: str, query: str):
+    compile_folder(query)
+    conn = get_connection()
+    conn.execute("UPDATE smart_folders SET name = ?, query = ? WHERE id = ?",
+                 (name, query.strip(), folder_id))
+    conn.commit()
+    conn.close()
+
+
+@_query
+def delete_smart_folder(folder_id: int):
+    conn = get_connection()
+    conn.execute("DELETE FROM smart_folders WHERE id = ?", (folder_id,))
+    conn.commit()
+    conn.close()
+
 
+# --- Bulk operations ---
 
+# Binds a whole id list as one JSON parameter, which sidesteps SQLite's
+# limit on the number of ? placeholders.
+_IDS = "(SELECT value FROM json_each(?))"
+
+
+def _categories_of(conn: sqlite3.Connection, ids_json: str) -> set:
+    return {r["category_id"] for r in conn.execute(
+        f"SELECT DISTINCT category_id FROM connections WHERE id IN {_IDS}", (ids_json,))}
+
+
+@_query
+def get_connections_by_ids(ids) -> list[dict]:
+    conn = get_connection()
+    rows = conn.execute(
+        f"SELECT * FROM connections WHERE id IN {_IDS} ORDER BY name", (json.dumps(list(ids)),)
+    ).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+@_query
+def bulk_update(ids, **kwargs) -> int:
+    # Sets the same fields on every connection in ids in one transaction.
+    # Changing hostname, port or username recomputes each row's identity
+    # key; rows that would collide with another keep no key, as in
+    # update_connection. Returns the number of rows updated.
+    data = {f: kwargs[f] for f in CONNECTION_FIELDS if f in kwargs}
+    ids = [int(i) for i in ids]
+    if not data or not ids:
+        return 0
+    ids_json = json.dumps(ids)
+    set_clause = ", ".join(f"{k} = ?" for k in data)
+    conn = get_connection()
+    try:
+        with conn:
+            touched = _categories_of(conn, ids_json)
+            if {"hostname", "port", "username"} & data.keys():
+                rows = conn.execute(
+                    f"SELECT id, hostname, port, username FROM connections WHERE id IN {_IDS}",
+                    (ids_json,),
+                ).fetchall()
+                params = []
+                for row in rows:
+                    merged = {**dict(row), **data}
+                    key = identity_key(merged["hostname"], merged["port"], merged["username"])
+                    params.append(list(data.values()) + [key, key, row["id"], row["id"]])
+                updated = conn.executemany(
+                    f"UPDATE connections SET {set_clause}, identity_key = {_FREE_KEY} WHERE id = ?",
+                    params,
+                ).rowcount
+            else:
+                updated = conn.execute(
+                    f"UPDATE connections SET {set_clause} WHERE id IN {_IDS}",
+                    list(data.values()) + [ids_json],
+                ).rowcount
+    finally:
+        conn.close()
+    if "category_id" in data:
+        touched.add(data["category_id"])
+    _touch(*touched)
+    return updated
+
+
+@traced(cat="db")
+def move_to_category(ids, category_id: int | None) -> int:
+    return bulk_update(ids, category_id=category_id)
+
+
+@_query
+def bulk_delete(ids) -> int:
+    ids_json = json.dumps([int(i) for i in ids])
+    conn = get_connection()
+    try:
+        with conn:
+            touched = _categories_of(conn, ids_json)
+            deleted = conn.execute(f"DELETE FROM connections WHERE id IN {_IDS}", (ids_json,)).rowcount
+    finally:
+        conn.close()
+    _touch(*touched)
+    return deleted
+
+
+@_query
 def duplicate_connection(conn_id: int) -> int | None:
-    original = get_connection_by_id(conn_id)
-    if not original:
-        return None
-    data = dict(original)
-    del data["id"]
-    del data["created_at"]
-    del data["last_connected"]
-    data["name"] = f"{data['name']} (Copy)"
-    return add_connection(**data)
+    # The copy and its tags are written in one transaction, so a retry
+    # after a busy error cannot leave a second copy behind. The copy's
+    # identity key stays NULL: the original holds it.
+    cols = ", ".join(CONNECTION_FIELDS)
+    copied = ", ".join("name || ' (Copy)'" if f == "name" else f for f in CONNECTION_FIELDS)
+    conn = get_connection()
+    try:
+        with conn:
+            cur = conn.execute(
+                f"INSERT INTO connections ({cols}) SELECT {copied} FROM connections WHERE id = ?",
+                (conn_id,),
+            )
+            if not cur.rowcount:
+                return None
+            new_id = cur.lastrowid
+            conn.execute(
+                "INSERT INTO connection_tags (connection_id, tag_id) "
+                "SELECT ?, tag_id FROM connection_tags WHERE connection_id = ?",
+                (new_id, conn_id),
+            )
+            category = _category_of(conn, new_id)
+    finally:
+        conn.close()
+    _touch(category)
+    return new_id
 
 
+@_query
 def search_connections(query: str) -> list[dict]:
     conn = get_connection()
     pattern = f"%{query}%"
@@ -213,39 +1108,365 @@ def search_connections(query: str) -> list[dict]:
     return [dict(r) for r in rows]
 
 
+@_query
 def update_last_connected(conn_id: int):
-    update_connection(conn_id, last_connected=datetime.now().isoformat())
+    conn = get_connection()
+    conn.execute(
+        "UPDATE connections SET last_connected = ?, connect_count = COALESCE(connect_count, 0) + 1 WHERE id = ?",
+        (datetime.now().isoformat(), conn_id),
+    )
+    conn.commit()
+    category_id = _category_of(conn, conn_id)
+    conn.close()
+    _touch(category_id)
 
 
 # --- Import / Export ---
 
-def export_connections(master_password: str = None) -> dict:
-    categories = get_categories()
-    connections = get_connections()
-    return {
+@_query
+def export_connections(master_password: str = None, since: int | None = None) -> dict:
+    # With since, only rows changed after that sequence number and the
+    # tombstones of rows deleted after it are exported; feed the returned
+    # "seq" back in as the next since. Connections name their category by
+    # uid as well as id, since ids differ between databases.
+    conn = get_connection()
+    seq = conn.execute("SELECT seq FROM change_counter").fetchone()["seq"]
+    where, params = ("WHERE change_seq > ?", (since,)) if since is not None else ("", ())
+    categories = [dict(r) for r in conn.execute(
+        f"SELECT * FROM categories {where} ORDER BY sort_order, name", params)]
+    connections = [dict(r) for r in conn.execute(
+        f"SELECT c.*, k.uid AS category_uid FROM connections c "
+        f"LEFT JOIN categories k ON k.id = c.category_id "
+        f"{where.replace('change_seq', 'c.change_seq')} ORDER BY c.name", params)]
+    # Templates stay local: each row carries its effective settings instead.
+    tree = template_tree()
+    for c in connections:
+        c.update(tree.effective(c))
+        c.pop("template_id", None)
+    for cat in categories:
+        cat.pop("template_id", None)
+    data = {
         "version": 1,
         "exported_at": datetime.now().isoformat(),
+        "source": _database_uid(conn),
+        "seq": seq,
         "categories": categories,
         "connections": connections,
     }
+    if since is not None:
+        data["delta"] = True
+        data["since"] = since
+        data["tombstones"] = [dict(r) for r in conn.execute(
+            "SELECT uid, kind, change_seq, deleted_at FROM tombstones WHERE change_seq > ?", (since,))]
+    conn.close()
+    return data
 
 
-def import_connections(data: dict):
-    cat_map = {}
-    for cat in data.get("categories", []):
-        existing = get_categories()
-        found = next((c for c in existing if c["name"] == cat["name"]), None)
-        if found:
-            cat_map[cat["id"]] = found["id"]
-        else:
-            new_id = add_category(cat["name"])
-            cat_map[cat["id"]] = new_id
+def _database_uid(conn: sqlite3.Connection) -> str:
+    # Identifies this database as the source of a delta export.
+    row = conn.execute("SELECT value FROM settings WHERE key = 'database_uid'").fetchone()
+    if row:
+        return row["value"]
+    uid = conn.execute("SELECT lower(hex(randomblob(16))) AS uid").fetchone()["uid"]
+    conn.execute("INSERT INTO settings (key, value) VALUES ('database_uid', ?)", (uid,))
+    conn.commit()
+    return uid
+
+
+def current_seq() -> int:
+    conn = get_connection()
+    seq = conn.execute("SELECT seq FROM change_counter").fetchone()["seq"]
+    conn.close()
+    return seq
+
+
+def get_sync_seq(source: str) -> int | None:
+    # The last seq of source's change log already applied here.
+    value = get_setting(f"sync_seq:{source}")
+    return int(value) if value is not None else None
+
+
+def _free_category_name(conn: sqlite3.Connection, name: str) -> str:
+    taken = {r["name"] for r in conn.execute("SELECT name FROM categories")}
+    n = 2
+    while f"{name} ({n})" in taken:
+        n += 1
+    return f"{name} ({n})"
+
+
+@_query
+def apply_delta(data: dict) -> int:
+    # Applies an export_connections(since=...) delta in one transaction,
+    # matching rows by uid. A row whose local edit is no older than the
+    # delta's keeps the local edit. Returns the number of rows changed.
+    fields = [f for f in INSERT_FIELDS if f != "category_id"]
+    conn = get_connection()
+    changed = 0
+    try:
+        with conn:
+            for cat in data.get("categories", []):
+                name = cat["name"]
+                clash = conn.execute("SELECT id FROM categories WHERE name = ? AND uid IS NOT ?",
+                                     (name, cat["uid"])).fetchone()
+                if clash is not None:
+                    if conn.execute("SELECT 1 FROM categories WHERE uid = ?", (cat["uid"],)).fetchone():
+                        # A rename onto the name of a different local
+                        # category: both stay, the incoming one suffixed.
+                        name = _free_category_name(conn, name)
+                    else:
+                        # The same category created independently on both
+                        # sides has two uids; adopt the incoming one.
+                        conn.execute("UPDATE categories SET uid = ? WHERE id = ?",
+                                     (cat["uid"], clash["id"]))
+                changed += conn.execute("""
+                    INSERT INTO categories (uid, name, sort_order, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(uid) DO UPDATE SET
+                        name = excluded.name, sort_order = excluded.sort_order,
+                        updated_at = excluded.updated_at
+                    WHERE excluded.updated_at > categories.updated_at
+                """, (cat["uid"], name, cat.get("sort_order", 0), cat.get("updated_at"))).rowcount
+            categories = {r["uid"]: r["id"] for r in conn.execute("SELECT id, uid FROM categories")}
+
+            cols = ", ".join(fields)
+            updates = ", ".join(f"{f} = excluded.{f}" for f in fields)
+            sql = f"""
+                INSERT INTO connections ({cols}, category_id, uid, updated_at, identity_key)
+                VALUES ({", ".join("?" * len(fields))}, ?, ?, ?,
+                        (SELECT ? WHERE NOT EXISTS (
+                            SELECT 1 FROM connections WHERE identity_key = ? AND uid IS NOT ?)))
+                ON CONFLICT(uid) DO UPDATE SET {updates},
+                    category_id = excluded.category_id, updated_at = excluded.updated_at,
+                    identity_key = excluded.identity_key
+                WHERE excluded.updated_at > connections.updated_at
+            """
+            for row in data.get("connections", []):
+                key = identity_key(row.get("hostname"), row.get("port"), row.get("username"))
+                params = [row.get(f) for f in fields] + [
+                    categories.get(row.get("category_uid")), row["uid"], row.get("updated_at"),
+                    key, key, row["uid"],
+                ]
+                changed += conn.execute(sql, params).rowcount
 
+            for tomb in data.get("tombstones", []):
+                if tomb["kind"] in ("connections", "categories"):
+                    changed += conn.execute(
+                        f"DELETE FROM {tomb['kind']} WHERE uid = ?", (tomb["uid"],)
+                    ).rowcount
+
+            if data.get("source"):
+                conn.execute(
+                    "INSERT INTO settings (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (f"sync_seq:{data['source']}", str(data["seq"])),
+                )
+    finally:
+        conn.close()
+    invalidate_category_cache()
+    _touch_all()
+    return changed
+
+
+def json_records(data: dict):
+    names = {cat["id"]: cat["name"] for cat in data.get("categories", [])}
     for conn_data in data.get("connections", []):
-        conn_data.pop("id", None)
-        conn_data.pop("created_at", None)
-        conn_data.pop("last_connected", None)
-        old_cat_id = conn_data.pop("category_id", None)
-        if old_cat_id and old_cat_id in cat_map:
-            conn_data["category_id"] = cat_map[old_cat_id]
-        add_connection(**conn_data)
+        record = dict(conn_data)
+        old_cat_id = record.pop("category_id", None)
+        if old_cat_id in names:
+            record["category"] = names[old_cat_id]
+        record["modified"] = (record.get("updated_at") or record.get("last_connected")
+                              or record.get("created_at"))
+        yield record
+
+
+@traced(cat="db")
+def import_connections(data: dict, progress=None, policy: str | None = None) -> int:
+    return bulk_insert(json_records(data), progress=progress,
+                       total=len(data.get("connections", [])), policy=policy)
+
+
+def _recency(value: str | None) -> str:
+    # last_connected is ISO with a "T", created_at is SQLite's datetime()
+    # with a space; normalise so the two compare as strings.
+    return (value or "").replace("T", " ")
+
+
+DIFF_FIELDS = [f for f in INSERT_FIELDS if f not in ("category_id", "encrypted_password")]
+
+
+def _import_action(record: dict, current: dict | None, category_names: dict,
+                   tree: TemplateTree, policy: str) -> tuple[str, dict]:
+    # What importing record does under policy to current, the row with its
+    # identity key: "added", "updated", "unchanged" or "kept", and the
+    # fields it changes as [old, new] pairs. diff_import reports this and
+    # bulk_insert acts on it, so a dry run always matches the import.
+    if current is None:
+        return "added", {}
+    # Settings are compared with what the row resolves to, so an export's
+    # spelled-out settings do not count as changes to inherited ones.
+    effective = tree.effective(current)
+    changes = {}
+    for f in DIFF_FIELDS:
+        old = effective[f] if f in SETTINGS else current[f]
+        if record.get(f) is not None and record[f] != old:
+            changes[f] = [old, record[f]]
+    category = record.get("category")
+    if category and category != category_names.get(current["category_id"]):
+        changes["category"] = [category_names.get(current["category_id"]), category]
+    # A blank password leaves the stored one alone.
+    if record.get("encrypted_password") and record["encrypted_password"] != current["encrypted_password"]:
+        changes["password"] = ["********", "********"]
+    if not changes:
+        return "unchanged", changes
+    if policy == "overwrite" or (
+            policy == "newest" and _recency(record.get("modified"))
+            > _recency(current["updated_at"] or current["created_at"])):
+        return "updated", changes
+    return "kept", changes
+
+
+def _existing_by_key(conn: sqlite3.Connection, keys=None) -> dict:
+    # Rows with an identity key: all of them, or those whose key is in keys.
+    if keys is None:
+        rows = conn.execute("SELECT * FROM connections WHERE identity_key IS NOT NULL")
+    else:
+        rows = conn.execute("SELECT * FROM connections WHERE identity_key IN "
+                            "(SELECT value FROM json_each(?))", (json.dumps(sorted(keys)),))
+    return {r["identity_key"]: dict(r) for r in rows}
+
+
+@_query(retry=False)
+def bulk_insert(records, progress=None, total: int | None = None, policy: str | None = None) -> int:
+    # Inserts everything in one transaction: either the whole batch lands
+    # or none of it does. A record may name its category with "category";
+    # missing categories are created in the same transaction.
+    #
+    # policy decides what happens when a record has the identity key of an
+    # existing row: None stores it as an extra copy, "keep" skips it,
+    # "overwrite" writes the fields it changes and "newest" writes them
+    # only if the record's "modified" timestamp is later than the row's
+    # last edit (see _import_action). With a policy, a key met again later
+    # in the batch is skipped. Returns the number of rows inserted or
+    # updated.
+    if policy is not None and policy not in CONFLICT_POLICIES:
+        raise ValueError(f"unknown conflict policy: {policy}")
+    # New rows are stamped with a single change_seq instead of one per row
+    # by the insert trigger, which would double the cost of a large
+    # import. A record's uid is kept unless a row here already has it.
+    cols = ", ".join(INSERT_FIELDS) + ", uid, updated_at, change_seq, identity_key"
+    insert_sql = (f"INSERT INTO connections ({cols}) VALUES ({', '.join('?' * len(INSERT_FIELDS))}, "
+                  "COALESCE((SELECT ? WHERE NOT EXISTS (SELECT 1 FROM connections WHERE uid = ?)),"
+                  f" lower(hex(randomblob(16)))), COALESCE(?, datetime('now')), ?, {_FREE_KEY})")
+
+    # The records are read first, outside the transaction: an importer
+    # parses files and encrypts passwords as it yields them, and another
+    # writer on a shared database should wait for the inserts only.
+    # RDP settings a record does not carry stay NULL, so new rows follow
+    # their category's template.
+    defaults = {"port": 3389, "username": "", "encrypted_password": "", "notes": ""}
+    category_at = INSERT_FIELDS.index("category_id")
+    seq_at = len(INSERT_FIELDS) + 3
+    batch = []
+    for record in records:
+        values = dict(defaults)
+        values.update((k, v) for k, v in record.items() if k in INSERT_FIELDS and v is not None)
+        key = identity_key(values.get("hostname"), values["port"], values["username"])
+        row = [values.get(f) for f in INSERT_FIELDS]
+        row += [record.get("uid"), record.get("uid"), record.get("updated_at"), None, key, key, None]
+        batch.append((record, key, row))
+        if progress and len(batch) % BULK_PROGRESS_EVERY == 0:
+            progress(len(batch), total)
+    tree = template_tree() if policy is not None else None
+
+    def write() -> int:
+        conn = get_connection()
+        try:
+            with conn:
+                conn.execute("UPDATE change_counter SET seq = seq + 1")
+                seq = conn.execute("SELECT seq FROM change_counter").fetchone()["seq"]
+                # Categories named by "category" are looked up, or created,
+                # in the same transaction as the rows.
+                categories = {r["name"]: r["id"] for r in conn.execute("SELECT id, name FROM categories")}
+
+                def category_id(name: str) -> int:
+                    if name not in categories:
+                        categories[name] = conn.execute(
+                            "INSERT INTO categories (name) VALUES (?)", (name,)
+                        ).lastrowid
+                    return categories[name]
+
+                inserts = []
+                updated = 0
+                if policy is not None:
+                    existing = _existing_by_key(conn, {key for _, key, _ in batch if key})
+                    names = {cat_id: name for name, cat_id in categories.items()}
+                    seen = set()
+                for record, key, row in batch:
+                    if policy is not None and key is not None:
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        current = existing.get(key)
+                        action, changes = _import_action(record, current, names, tree, policy)
+                        if action == "updated":
+                            # Only the changed fields are written, so a
+                            # setting the row inherits stays inherited.
+                            fields = {f: record[f] for f in changes if f in DIFF_FIELDS}
+                            if "category" in changes:
+                                fields["category_id"] = category_id(record["category"])
+                            if "password" in changes:
+                                fields["encrypted_password"] = record["encrypted_password"]
+                            conn.execute(
+                                f"UPDATE connections SET {', '.join(f + ' = ?' for f in fields)} WHERE id = ?",
+                                [*fields.values(), current["id"]],
+                            )
+                            updated += 1
+                        if action != "added":
+                            continue
+                    if record.get("category"):
+                        row[category_at] = category_id(record["category"])
+                    row[seq_at] = seq
+                    inserts.append(row)
+                conn.executemany(insert_sql, inserts)
+                # A re-imported row is no longer deleted.
+                conn.execute("DELETE FROM tombstones WHERE uid IN "
+                             "(SELECT uid FROM connections WHERE change_seq = ?)", (seq,))
+        finally:
+            conn.close()
+        return len(inserts) + updated
+
+    # Unlike the records, the rows can be written again if the database
+    # stays locked.
+    written = _retrying(write, BUSY_RETRY_COUNT.labels(query="bulk_insert"))()
+    invalidate_category_cache()
+    _touch_all()
+    if progress:
+        progress(len(batch), total)
+    return written
+
+
+@_query(retry=False)
+def diff_import(records, policy: str = "keep") -> dict:
+    # Dry run of bulk_insert with a conflict policy: one pass over the
+    # records against a hash map of existing identity keys, nothing written.
+    conn = get_connection()
+    existing = _existing_by_key(conn)
+    names = {r["id"]: r["name"] for r in conn.execute("SELECT id, name FROM categories")}
+    conn.close()
+    tree = template_tree()
+
+    report = {"added": [], "updated": [], "unchanged": [], "kept": [], "duplicates": []}
+    seen = set()
+    for record in records:
+        key = identity_key(record.get("hostname"), record.get("port"), record.get("username"))
+        entry = {"name": record.get("name") or record.get("hostname"), "key": key}
+        if key is not None and key in seen:
+            report["duplicates"].append(entry)
+            continue
+        seen.add(key)
+        current = existing.get(key)
+        action, changes = _import_action(record, current, names, tree, policy)
+        if current is not None:
+            entry["id"] = current["id"]
+            entry["changes"] = changes
+        report[action].append(entry)
+    return report
@@ -1,13 +1,25 @@
 import os
 import base64
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
+
+from core import metrics
+from core.tracing import traced
+
+# cryptography is imported inside the functions that need it: it is the
+# most expensive import in the app and nothing on the startup path uses it.
 
 DEFAULT_PASSPHRASE = "RDPManager_NoMasterPassword_DefaultKey"
 
+KEY_DERIVATION_SECONDS = metrics.histogram(
+    "rdpmanager_key_derivation_seconds", "PBKDF2 key derivation time",
+)
+
 
+@traced(cat="crypto")
+@metrics.timed(KEY_DERIVATION_SECONDS.labels())
 def _derive_key(master_password: str, salt: bytes) -> bytes:
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives import hashes
+
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
@@ -18,16 +30,35 @@ def _derive_key(master_password: str, salt: bytes) -> bytes:
 
 
 def encrypt_password(plain: str, master_password: str, salt: bytes) -> str:
+    from cryptography.fernet import Fernet
+
     key = _derive_key(master_password, salt)
     f = Fernet(key)
     return f.encrypt(plain.encode()).decode()
 
 
 def decrypt_password(encrypted_str: str, master_password: str, salt: bytes) -> str:
+    from cryptography.fernet import Fernet
+
     key = _derive_key(master_password, salt)
     f = Fernet(key)
     return f.decrypt(encrypted_str.encode()).decode()
 
 
+def make_encryptor(master_password: str, salt: bytes):
+    # Derives the key once, on first use, for bulk imports where running
+    # PBKDF2 for every password would dominate the run time.
+    fernet = None
+
+    def encrypt(plain: str) -> str:
+        nonlocal fernet
+        if fernet is None:
+            from cryptography.fernet import Fernet
+            fernet = Fernet(_derive_key(master_password, salt))
+        return fernet.encrypt(plain.encode()).decode()
+
+    return encrypt
+
+
 def generate_salt() -> bytes:
     return os.urandom(16)
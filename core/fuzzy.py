@@ -0,0 +1,264 @@
+import heapq
+import math
+from array import array
+from datetime import datetime
+
+from core.search import SEARCH_FIELDS
+
+# Scoring follows fzf's v1 algorithm: every matched character scores
+# SCORE_MATCH, gaps are penalised, and characters that start a word, a
+# camelCase hump or a digit run earn a bonus that carries over to the
+# characters matched consecutively after them.
+SCORE_MATCH = 16
+SCORE_GAP_START = -3
+SCORE_GAP_EXTENSION = -1
+BONUS_BOUNDARY = SCORE_MATCH // 2
+BONUS_NON_WORD = SCORE_MATCH // 2
+BONUS_CAMEL = BONUS_BOUNDARY + SCORE_GAP_EXTENSION
+BONUS_CONSECUTIVE = -(SCORE_GAP_START + SCORE_GAP_EXTENSION)
+BONUS_FIRST_CHAR_MULTIPLIER = 2
+
+# A literal substring hit (as reported by the trigram index) ranks above
+# scattered subsequence matches of similar quality.
+BONUS_EXACT = SCORE_MATCH * 2
+# Frecency nudges the order between comparable matches but never lifts a
+# poor match above a good one.
+FRECENCY_WEIGHT = 4.0
+
+BATCH_SIZE = 4096
+
+_NON_WORD, _LOWER, _UPPER, _LETTER, _NUMBER = range(5)
+
+
+def _char_class(ch: str) -> int:
+    if ch.islower():
+        return _LOWER
+    if ch.isupper():
+        return _UPPER
+    if ch.isdigit():
+        return _NUMBER
+    if ch.isalpha():
+        return _LETTER
+    return _NON_WORD
+
+
+def _bonus(prev_class: int, cls: int) -> int:
+    if prev_class == _NON_WORD and cls != _NON_WORD:
+        return BONUS_BOUNDARY
+    if (prev_class == _LOWER and cls == _UPPER) or (prev_class != _NUMBER and cls == _NUMBER):
+        return BONUS_CAMEL
+    if cls == _NON_WORD:
+        return BONUS_NON_WORD
+    return 0
+
+
+_BONUS_TABLE = [[_bonus(prev, cls) for cls in range(5)] for prev in range(5)]
+_ASCII_CLASSES = bytes(_char_class(chr(i)) for i in range(128)) + bytes(128)
+
+
+def char_classes(text: str) -> bytes:
+    if text.isascii():
+        return text.encode("ascii").translate(_ASCII_CLASSES)
+    return bytes(_char_class(ch) for ch in text)
+
+
+def fold(text: str) -> str:
+    # str.lower(), one character for one: a character whose lowercase is
+    # longer ("İ" becomes "i" plus a combining dot) keeps only the first,
+    # so positions still line up with char_classes(text).
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(ch.lower()[0] for ch in text)
+
+
+def _char_bit(ch: str) -> int:
+    if "a" <= ch <= "z":
+        return 1 << (ord(ch) - 97)
+    if "0" <= ch <= "9":
+        return 1 << (ord(ch) - 48 + 26)
+    return 1 << (36 + ord(ch) % 28)
+
+
+def char_mask(text: str) -> int:
+    mask = 0
+    for ch in set(text):
+        mask |= _char_bit(ch)
+    return mask
+
+
+def fuzzy_score(query: str, lowered: str, classes: bytes) -> int | None:
+    # Forward pass: leftmost subsequence match, using str.find so the scan
+    # itself runs in C.
+    pos = -1
+    for ch in query:
+        pos = lowered.find(ch, pos + 1)
+        if pos < 0:
+            return None
+    end = pos
+
+    # Backward pass: shrink the window to the shortest one ending at `end`.
+    start = end + 1
+    for ch in reversed(query):
+        start = lowered.rfind(ch, 0, start)
+    start = max(start, 0)
+
+    score = 0
+    qi = 0
+    in_gap = False
+    consecutive = 0
+    first_bonus = 0
+    prev_class = classes[start - 1] if start > 0 else _NON_WORD
+    for i in range(start, end + 1):
+        cls = classes[i]
+        if qi < len(query) and lowered[i] == query[qi]:
+            score += SCORE_MATCH
+            bonus = _BONUS_TABLE[prev_class][cls]
+            if consecutive == 0:
+                first_bonus = bonus
+            else:
+                if bonus >= BONUS_BOUNDARY and bonus > first_bonus:
+                    first_bonus = bonus
+                bonus = max(bonus, first_bonus, BONUS_CONSECUTIVE)
+            score += bonus * BONUS_FIRST_CHAR_MULTIPLIER if qi == 0 else bonus
+            in_gap = False
+            consecutive += 1
+            qi += 1
+        else:
+            score += SCORE_GAP_EXTENSION if in_gap else SCORE_GAP_START
+            in_gap = True
+            consecutive = 0
+            first_bonus = 0
+        prev_class = cls
+    return score
+
+
+def frecency(last_connected: str | None, connect_count: int | None, now: datetime | None = None) -> float:
+    if not last_connected:
+        return 0.0
+    try:
+        then = datetime.fromisoformat(last_connected)
+    except ValueError:
+        return 0.0
+    age_days = ((now or datetime.now()) - then).total_seconds() / 86400
+    if age_days < 4:
+        weight = 100
+    elif age_days < 14:
+        weight = 70
+    elif age_days < 31:
+        weight = 50
+    elif age_days < 90:
+        weight = 30
+    else:
+        weight = 10
+    return weight * max(1, connect_count or 0)
+
+
+class FuzzyIndex:
+    # Candidates are stored column-wise in dense slots (pre-lowered fields,
+    # their character classes, character bitmasks, frecency) so a query can
+    # reject most of them with one AND per slot before any per-character
+    # scoring, and scoring never re-derives case or word boundaries.
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._ids = []
+        self._slots = {}
+        self._lowered = []
+        self._classes = []
+        self._masks = array("Q")
+        self._frecency = array("d")
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def rebuild(self, connections: list[dict]):
+        self.clear()
+        now = datetime.now()
+        for conn in connections:
+            self._append(conn, now)
+
+    def _append(self, conn: dict, now: datetime):
+        originals = tuple(conn.get(f) or "" for f in SEARCH_FIELDS)
+        lowered = tuple(fold(t) for t in originals)
+        self._slots[conn["id"]] = len(self._ids)
+        self._ids.append(conn["id"])
+        self._classes.append(tuple(char_classes(t) for t in originals))
+        self._lowered.append(lowered)
+        self._masks.append(char_mask("".join(lowered)))
+        self._frecency.append(frecency(conn.get("last_connected"), conn.get("connect_count"), now))
+
+    def update(self, conn: dict):
+        slot = self._slots.get(conn["id"])
+        if slot is None:
+            self._append(conn, datetime.now())
+            return
+        originals = tuple(conn.get(f) or "" for f in SEARCH_FIELDS)
+        lowered = tuple(fold(t) for t in originals)
+        self._classes[slot] = tuple(char_classes(t) for t in originals)
+        self._lowered[slot] = lowered
+        self._masks[slot] = char_mask("".join(lowered))
+        self._frecency[slot] = frecency(conn.get("last_connected"), conn.get("connect_count"))
+
+    def remove(self, conn_id: int):
+        slot = self._slots.pop(conn_id, None)
+        if slot is None:
+            return
+        last = len(self._ids) - 1
+        if slot != last:
+            # Swap-remove keeps the columns dense.
+            moved = self._ids[last]
+            self._ids[slot] = moved
+            self._classes[slot] = self._classes[last]
+            self._lowered[slot] = self._lowered[last]
+            self._masks[slot] = self._masks[last]
+            self._frecency[slot] = self._frecency[last]
+            self._slots[moved] = slot
+        self._ids.pop()
+        self._classes.pop()
+        self._lowered.pop()
+        self._masks.pop()
+        self._frecency.pop()
+
+    def rank_batches(self, query: str, exact: set[int] | frozenset = frozenset(),
+                     batch_size: int = BATCH_SIZE):
+        query = fold(query)
+        qmask = char_mask(query)
+        ids, lowered, classes = self._ids, self._lowered, self._classes
+        masks, frec = self._masks, self._frecency
+        for start in range(0, len(ids), batch_size):
+            stop = min(start + batch_size, len(ids))
+            results = []
+            for slot in range(start, stop):
+                if masks[slot] & qmask != qmask:
+                    continue
+                best = None
+                for low, cls in zip(lowered[slot], classes[slot]):
+                    s = fuzzy_score(query, low, cls)
+                    if s is not None and (best is None or s > best):
+                        best = s
+                if best is None:
+                    continue
+                conn_id = ids[slot]
+                if conn_id in exact:
+                    best += BONUS_EXACT
+                if frec[slot]:
+                    best += FRECENCY_WEIGHT * math.log1p(frec[slot])
+                results.append((best, conn_id))
+            yield results
+
+    def rank(self, query: str, limit: int | None = None,
+             exact: set[int] | frozenset = frozenset()) -> list[int]:
+        scored = []
+        for batch in self.rank_batches(query, exact):
+            scored.extend(batch)
+        return self.order(scored, limit)
+
+    def order(self, scored: list[tuple[float, int]], limit: int | None = None) -> list[int]:
+        name_of = lambda conn_id: self._lowered[self._slots[conn_id]][0]
+        key = lambda item: (-item[0], name_of(item[1]))
+        if limit is not None:
+            return [conn_id for _, conn_id in heapq.nsmallest(limit, scored, key=key)]
+        return [conn_id for _, conn_id in sorted(scored, key=key)]
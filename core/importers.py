@@ -0,0 +1,300 @@
+import csv
+import json
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from core import database as db
+
+# Importers yield (source, record, error) triples: exactly one of record and
+# error is set. Records use the connections column names plus an optional
+# "category" name and plain "password". A bad file or row becomes an error
+# entry and the import carries on.
+
+# Below this many .rdp files, starting worker processes costs more than it saves.
+PARALLEL_THRESHOLD = 256
+PARALLEL_CHUNK = 64
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.errors = []
+        self.diff = None
+
+    def add_error(self, source: str, message: str):
+        self.errors.append((source, message))
+
+
+def _flag(value) -> int:
+    return 1 if str(value).strip().lower() in ("1", "true", "yes", "y", "on") else 0
+
+
+def _int(value, default=None):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def _split_address(address: str, port=None) -> tuple[str, int]:
+    address = address.strip()
+    if address.startswith("[") and "]" in address:
+        host, _, rest = address[1:].partition("]")
+        return host, _int(rest.lstrip(":"), port or 3389)
+    if address.count(":") == 1:
+        host, _, rest = address.partition(":")
+        return host, _int(rest, port or 3389)
+    return address, port or 3389
+
+
+# --- .rdp files ---
+
+RDP_FIELDS = {
+    "screen mode id": ("screen_mode", _int),
+    "desktopwidth": ("desktop_width", _int),
+    "desktopheight": ("desktop_height", _int),
+    "session bpp": ("color_depth", _int),
+    "redirectclipboard": ("redirect_clipboard", _flag),
+    "redirectprinters": ("redirect_printers", _flag),
+    "redirectdrives": ("redirect_drives", _flag),
+    "username": ("username", str),
+}
+
+
+def parse_rdp_text(text: str, name: str) -> dict:
+    # Inverse of core.rdp.generate_rdp_file. Lines are "key:type:value";
+    # unknown keys are ignored. Saved passwords ("password 51") are
+    # DPAPI-encrypted for the machine that wrote them and cannot be used.
+    record = {"name": name}
+    for line in text.splitlines():
+        key, sep, rest = line.partition(":")
+        if not sep:
+            continue
+        _, sep, value = rest.partition(":")
+        if not sep:
+            continue
+        key = key.strip().lower()
+        if key == "full address":
+            record["hostname"], record["port"] = _split_address(value)
+        elif key == "server port":
+            record["port"] = _int(value, 3389)
+        elif key in RDP_FIELDS:
+            column, convert = RDP_FIELDS[key]
+            record[column] = convert(value.strip())
+    if not record.get("hostname"):
+        raise ValueError("no 'full address' entry")
+    return record
+
+
+def _read_rdp(path: Path) -> str:
+    # mstsc writes .rdp files as UTF-16 with a BOM; hand-written ones are
+    # usually UTF-8.
+    raw = path.read_bytes()
+    if raw[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        return raw.decode("utf-16")
+    return raw.decode("utf-8-sig")
+
+
+def _parse_rdp_path(args: tuple[str, str | None]) -> tuple:
+    # Top-level so worker processes can unpickle it.
+    path, category = args
+    try:
+        record = parse_rdp_text(_read_rdp(Path(path)), Path(path).stem)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        return path, None, str(e)
+    if category:
+        record["category"] = category
+    return path, record, None
+
+
+def iter_rdp_files(root: Path, workers: int | None = None):
+    # Files in a subdirectory go into a category named after it.
+    root = Path(root)
+    if root.is_file():
+        yield _parse_rdp_path((str(root), None))
+        return
+    jobs = []
+    for path in root.rglob("*.rdp"):
+        parent = path.parent.relative_to(root)
+        jobs.append((str(path), parent.parts[0] if parent.parts else None))
+
+    if len(jobs) < PARALLEL_THRESHOLD:
+        for job in jobs:
+            yield _parse_rdp_path(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        yield from pool.map(_parse_rdp_path, jobs, chunksize=PARALLEL_CHUNK)
+
+
+# --- CSV ---
+
+# Accepted header names (lower-cased) for each column.
+CSV_COLUMNS = {
+    "name": ("name", "display name", "title"),
+    "hostname": ("hostname", "host", "address", "server", "computer"),
+    "port": ("port",),
+    "username": ("username", "user", "login"),
+    "password": ("password",),
+    "category": ("category", "group", "folder"),
+    "notes": ("notes", "description", "comment"),
+    "desktop_width": ("desktop_width", "width"),
+    "desktop_height": ("desktop_height", "height"),
+    "color_depth": ("color_depth", "colors"),
+}
+
+
+def iter_csv(path: Path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        headers = {h.strip().lower(): h for h in reader.fieldnames or ()}
+        columns = {}
+        for column, aliases in CSV_COLUMNS.items():
+            found = next((headers[a] for a in aliases if a in headers), None)
+            if found:
+                columns[column] = found
+        if "hostname" not in columns:
+            yield str(path), None, "no hostname column"
+            return
+
+        for row in reader:
+            source = f"{path}:{reader.line_num}"
+            values = {c: (row.get(h) or "").strip() for c, h in columns.items()}
+            if not values["hostname"]:
+                yield source, None, "empty hostname"
+                continue
+            record = {k: v for k, v in values.items() if v}
+            record["hostname"], port = _split_address(values["hostname"], _int(values.get("port")))
+            record["port"] = port
+            record.setdefault("name", record["hostname"])
+            for column in ("desktop_width", "desktop_height", "color_depth"):
+                if column in record:
+                    record[column] = _int(record[column])
+            yield source, record, None
+
+
+# --- mRemoteNG ---
+
+MREMOTENG_COLORS = {"Colors256": 8, "Colors15Bit": 15, "Colors16Bit": 16, "Colors24Bit": 24, "Colors32Bit": 32}
+
+
+def iter_mremoteng(path: Path):
+    # confCons.xml is a tree of <Node Type="Container|Connection"> elements.
+    # iterparse keeps memory flat: each node is cleared once handled.
+    # Passwords are encrypted with mRemoteNG's own key and are not imported.
+    containers = []
+    try:
+        for event, elem in ET.iterparse(str(path), events=("start", "end")):
+            if not elem.tag.endswith("Node"):
+                continue
+            attrs = elem.attrib
+            if attrs.get("Type") == "Container":
+                if event == "start":
+                    containers.append(attrs.get("Name", ""))
+                else:
+                    containers.pop()
+                    elem.clear()
+                continue
+            if event != "end":
+                continue
+            attrs = dict(attrs)
+            elem.clear()
+            name = attrs.get("Name", "")
+            source = f"{path}:{'/'.join(containers + [name])}"
+            if attrs.get("Protocol", "RDP") != "RDP":
+                yield source, None, f"skipped {attrs.get('Protocol')} connection"
+                continue
+            if not attrs.get("Hostname"):
+                yield source, None, "empty hostname"
+                continue
+            record = {
+                "name": name or attrs["Hostname"],
+                "hostname": attrs["Hostname"],
+                "port": _int(attrs.get("Port"), 3389),
+                "username": attrs.get("Username", ""),
+                "notes": attrs.get("Descr", ""),
+                "redirect_clipboard": _flag(attrs.get("RedirectClipboard", "true")),
+                "redirect_printers": _flag(attrs.get("RedirectPrinters", "false")),
+                "redirect_drives": _flag(attrs.get("RedirectDiskDrives", "false")),
+            }
+            # Resolution is "Fullscreen", "FitToWindow", "SmartSize" or "Res<W>x<H>".
+            resolution = attrs.get("Resolution", "")
+            if resolution == "Fullscreen":
+                record["screen_mode"] = 2
+            elif resolution.startswith("Res"):
+                width, _, height = resolution[3:].partition("x")
+                if _int(width) and _int(height):
+                    record.update(screen_mode=1, desktop_width=_int(width), desktop_height=_int(height))
+            if attrs.get("Colors") in MREMOTENG_COLORS:
+                record["color_depth"] = MREMOTENG_COLORS[attrs["Colors"]]
+            if containers:
+                record["category"] = containers[-1]
+            yield source, record, None
+    except ET.ParseError as e:
+        yield str(path), None, f"invalid XML: {e}"
+
+
+# --- JSON export ---
+
+def iter_json(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for i, record in enumerate(db.json_records(data)):
+        yield f"{path}:{i}", record, None
+
+
+# --- Entry point ---
+
+FORMATS = {
+    "json": iter_json,
+    "rdp": iter_rdp_files,
+    "csv": iter_csv,
+    "mremoteng": iter_mremoteng,
+}
+
+
+def detect_format(path: Path) -> str:
+    path = Path(path)
+    if path.is_dir() or path.suffix.lower() == ".rdp":
+        return "rdp"
+    if path.suffix.lower() == ".csv":
+        return "csv"
+    if path.suffix.lower() == ".xml":
+        return "mremoteng"
+    return "json"
+
+
+def import_path(path: Path, fmt: str | None = None, encrypt=None, progress=None,
+                policy: str | None = None, dry_run: bool = False) -> ImportReport:
+    # encrypt turns a plain password into the stored form (see
+    # core.encryption.make_encryptor); without it passwords are dropped.
+    # policy is passed to db.bulk_insert; with dry_run the report carries
+    # db.diff_import's result in .diff and nothing is written.
+    report = ImportReport()
+    fmt = fmt or detect_format(path)
+    if fmt == "json" and not dry_run:
+        # A delta export (export_connections(since=...)) is applied by uid
+        # rather than merged by identity key; policy does not apply.
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("delta"):
+            report.imported = db.apply_delta(data)
+            return report
+    entries = FORMATS[fmt](Path(path))
+
+    def records():
+        for source, record, error in entries:
+            if error is not None:
+                report.add_error(source, error)
+                continue
+            password = record.pop("password", None)
+            if password and encrypt is not None and not dry_run:
+                record["encrypted_password"] = encrypt(password)
+            yield record
+
+    if dry_run:
+        report.diff = db.diff_import(records(), policy or "keep")
+    else:
+        report.imported = db.bulk_insert(records(), progress=progress, policy=policy)
+    return report
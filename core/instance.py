@@ -0,0 +1,129 @@
+import json
+import os
+import secrets
+import socket
+import sys
+import threading
+import time
+
+from core import database as db
+
+# One RDPManagerApp per user. The running instance holds an OS lock on
+# instance.lock and listens on a loopback socket whose port and token are
+# in instance.json. A later launch finds the lock taken, sends its request
+# over the socket and exits without ever importing Tk.
+
+LOCK_NAME = "instance.lock"
+INFO_NAME = "instance.json"
+FORWARD_TIMEOUT = 2.0
+
+
+def _try_lock(fd: int) -> bool:
+    if sys.platform == "win32":
+        import msvcrt
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    import fcntl
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class InstanceServer:
+    def __init__(self, lock_fd: int):
+        self._lock_fd = lock_fd
+        self._token = secrets.token_hex(16)
+        self._handler = None
+        self._pending = []
+        self._guard = threading.Lock()
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(8)
+        port = self._sock.getsockname()[1]
+
+        info = db.DB_DIR / INFO_NAME
+        tmp = info.with_name(f"{INFO_NAME}.tmp")
+        tmp.write_text(json.dumps({"pid": os.getpid(), "port": port, "token": self._token}),
+                       encoding="utf-8")
+        os.replace(tmp, info)
+
+        threading.Thread(target=self._serve, name="instance", daemon=True).start()
+
+    def set_handler(self, handler):
+        # Requests that arrived before the app was ready are replayed here.
+        with self._guard:
+            self._handler = handler
+            pending, self._pending = self._pending, []
+        for message in pending:
+            handler(message)
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            with client:
+                client.settimeout(FORWARD_TIMEOUT)
+                try:
+                    message = json.loads(client.makefile("r", encoding="utf-8").readline())
+                except (OSError, ValueError):
+                    continue
+                if not isinstance(message, dict) or not secrets.compare_digest(
+                        str(message.pop("token", "")), self._token):
+                    continue
+                with self._guard:
+                    handler = self._handler
+                    if handler is None:
+                        self._pending.append(message)
+                if handler is not None:
+                    handler(message)
+                try:
+                    client.sendall(b"ok\n")
+                except OSError:
+                    pass
+
+    def close(self):
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+        try:
+            (db.DB_DIR / INFO_NAME).unlink()
+        except OSError:
+            pass
+        os.close(self._lock_fd)
+
+
+def acquire() -> InstanceServer | None:
+    # Returns the server when this process is the first instance, None when
+    # another one already holds the lock.
+    db.DB_DIR.mkdir(parents=True, exist_ok=True)
+    fd = os.open(str(db.DB_DIR / LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o600)
+    if not _try_lock(fd):
+        os.close(fd)
+        return None
+    return InstanceServer(fd)
+
+
+def forward(message: dict, timeout: float = FORWARD_TIMEOUT) -> bool:
+    # The first instance may still be starting up and not have written its
+    # port yet, so keep trying until the timeout.
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            info = json.loads((db.DB_DIR / INFO_NAME).read_text(encoding="utf-8"))
+            with socket.create_connection(("127.0.0.1", info["port"]), timeout=timeout) as sock:
+                payload = dict(message, token=info["token"])
+                sock.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+                return sock.makefile("rb").readline().strip() == b"ok"
+        except (OSError, ValueError, KeyError):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
@@ -0,0 +1,272 @@
+import functools
+import os
+import threading
+import time
+from pathlib import Path
+
+# Histograms use HDR-style log-linear buckets over integer microseconds:
+# every power-of-two range is split into 2**SUB_BITS equal sub-buckets, so
+# any recorded value is off by at most 1/16 of itself while a histogram
+# spanning microseconds to minutes needs only a few hundred buckets.
+SUB_BITS = 4
+SUB_COUNT = 1 << SUB_BITS
+INF_LABEL = 'le="+Inf"'
+
+
+def _bucket_index(micros: int) -> int:
+    if micros < SUB_COUNT:
+        return micros
+    shift = micros.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB_COUNT + (micros >> shift) - SUB_COUNT
+
+
+def _bucket_upper(index: int) -> int:
+    # Largest microsecond value that lands in this bucket.
+    if index < SUB_COUNT:
+        return index
+    shift = index // SUB_COUNT - 1
+    top = index % SUB_COUNT + SUB_COUNT
+    return ((top + 1) << shift) - 1
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "count", "sum", "max", "_lock")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = _bucket_index(max(0, int(seconds * 1_000_000)))
+        with self._lock:
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def time(self):
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            buckets = sorted(self.buckets.items())
+            count = self.count
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, n in buckets:
+            seen += n
+            if seen >= rank:
+                return (_bucket_upper(index) + 1) / 1_000_000
+        return self.max
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _Family:
+    kind = ""
+    child_type = None
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self.child_type())
+        return child
+
+    def children(self) -> list:
+        with self._lock:
+            return list(self._children.items())
+
+    def _label_text(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Family):
+    kind = "counter"
+    child_type = _CounterChild
+
+    def inc(self, amount: float = 1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{self._label_text(key)} {child.value}" for key, child in self.children()]
+
+
+class Histogram(_Family):
+    kind = "histogram"
+    child_type = _HistogramChild
+
+    def observe(self, seconds: float, **labels):
+        self.labels(**labels).observe(seconds)
+
+    def time(self, **labels):
+        return self.labels(**labels).time()
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, child in self.children():
+            with child._lock:
+                buckets = sorted(child.buckets.items())
+                count, total = child.count, child.sum
+            # Only populated buckets are written; their bounds are fixed by
+            # the bucket layout, so they line up across processes.
+            cumulative = 0
+            for index, n in buckets:
+                cumulative += n
+                le = f'le="{(_bucket_upper(index) + 1) / 1_000_000:.6g}"'
+                lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._label_text(key, INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {total:.9g}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str, labelnames):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = cls(name, help_text, labelnames)
+            elif not isinstance(family, cls):
+                raise ValueError(f"metric {name} is already registered as a {family.kind}")
+            return family
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._get(Counter, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames=()) -> Histogram:
+        return self._get(Histogram, name, help_text, labelnames)
+
+    def render(self) -> str:
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labelnames=()) -> Counter:
+    return REGISTRY.counter(name, help_text, labelnames)
+
+
+def histogram(name: str, help_text: str, labelnames=()) -> Histogram:
+    return REGISTRY.histogram(name, help_text, labelnames)
+
+
+def timed(child: _HistogramChild):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+# --- Export ---
+
+def write_textfile(path: Path, registry: Registry = REGISTRY):
+    # Write then rename so a collector never reads a half-written file.
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(registry.render(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def start_file_exporter(path: Path, interval: float = 60.0,
+                        registry: Registry = REGISTRY) -> threading.Event:
+    # Returns an event that stops the writer when set.
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            write_textfile(path, registry)
+
+    threading.Thread(target=run, name="metrics-file", daemon=True).start()
+    return stop
+
+
+def start_http_server(port: int, registry: Registry = REGISTRY):
+    # Bound to loopback only: this is for a scraper or agent on the same
+    # machine, never for the network.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,109 @@
+import builtins
+import json
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Imports faster than this are left out of the report.
+IMPORT_THRESHOLD_MS = 0.5
+
+
+class StartupProfile:
+    def __init__(self, start: float | None = None):
+        self.start = start if start is not None else time.perf_counter()
+        self.phases = []
+        self.marks = {}
+        self.imports = {}
+        self._stack = []
+        self._original_import = None
+
+    def _now_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    # --- Imports ---
+
+    def track_imports(self):
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def stop_tracking_imports(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import
+        if level == 0 and name in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+
+        # Each frame on the stack accumulates the time spent in nested
+        # imports so self time can be separated from inclusive time.
+        self._stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            if elapsed >= IMPORT_THRESHOLD_MS:
+                key = _resolve(name, globals, fromlist, level)
+                total, own = self.imports.get(key, (0.0, 0.0))
+                self.imports[key] = (total + elapsed, own + elapsed - nested)
+
+    # --- Phases ---
+
+    @contextmanager
+    def phase(self, name: str):
+        begin = self._now_ms()
+        try:
+            yield
+        finally:
+            self.phases.append((name, begin, self._now_ms()))
+
+    def mark(self, name: str):
+        self.marks[name] = self._now_ms()
+
+    def report(self, top: int = 25) -> dict:
+        slowest = sorted(self.imports.items(), key=lambda kv: kv[1][1], reverse=True)[:top]
+        return {
+            "total_ms": round(self._now_ms(), 2),
+            "marks": {k: round(v, 2) for k, v in self.marks.items()},
+            "phases": [
+                {"name": name, "start_ms": round(b, 2), "duration_ms": round(e - b, 2)}
+                for name, b, e in self.phases
+            ],
+            "imports": [
+                {"module": name, "self_ms": round(own, 2), "inclusive_ms": round(total, 2)}
+                for name, (total, own) in slowest
+            ],
+        }
+
+    def write(self, path: Path) -> dict:
+        data = self.report()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        return data
+
+
+def _resolve(name: str, globals, fromlist, level: int) -> str:
+    if level == 0:
+        return name
+    package = (globals or {}).get("__package__") or ""
+    parts = package.split(".")
+    base = ".".join(parts[:len(parts) - level + 1])
+    if name:
+        return f"{base}.{name}"
+    return f"{base}.{{{','.join(fromlist or ())}}}"
+
+
+@contextmanager
+def phase(profile: StartupProfile | None, name: str):
+    if profile is None:
+        yield
+    else:
+        with profile.phase(name):
+            yield
@@ -1,24 +1,42 @@
+import asyncio
 import os
+import socket
 import subprocess
 import tempfile
 import threading
+import time
 from pathlib import Path
 
 from core.encryption import decrypt_password
+from core.templates import with_defaults
+from core import metrics
+from core.tracing import traced
 
+LAUNCH_SECONDS = metrics.histogram(
+    "rdpmanager_launch_seconds", "Time from connect request to mstsc.exe spawned",
+)
+LAUNCHES = metrics.counter("rdpmanager_launches_total", "RDP launch attempts", ["result"])
+PROBE_SECONDS = metrics.histogram("rdpmanager_probe_seconds", "Host reachability probe latency")
+PROBES = metrics.counter("rdpmanager_probes_total", "Host reachability probes", ["result"])
 
+
+@traced(cat="rdp")
 def generate_rdp_file(connection: dict) -> str:
-    rdp_content = f"""screen mode id:i:{connection.get('screen_mode', 2)}
+    # Pass the row through core.database.resolve_connection first so
+    # inherited template settings apply; anything still unset gets the
+    # built-in default.
+    settings = with_defaults(connection)
+    rdp_content = f"""screen mode id:i:{settings['screen_mode']}
 use multimon:i:0
-desktopwidth:i:{connection.get('desktop_width', 1920)}
-desktopheight:i:{connection.get('desktop_height', 1080)}
-session bpp:i:{connection.get('color_depth', 32)}
+desktopwidth:i:{settings['desktop_width']}
+desktopheight:i:{settings['desktop_height']}
+session bpp:i:{settings['color_depth']}
 full address:s:{connection['hostname']}:{connection.get('port', 3389)}
 audiomode:i:0
 audiocapturemode:i:0
-redirectclipboard:i:{1 if connection.get('redirect_clipboard', True) else 0}
-redirectprinters:i:{1 if connection.get('redirect_printers', False) else 0}
-redirectdrives:i:{1 if connection.get('redirect_drives', False) else 0}
+redirectclipboard:i:{1 if settings['redirect_clipboard'] else 0}
+redirectprinters:i:{1 if settings['redirect_printers'] else 0}
+redirectdrives:i:{1 if settings['redirect_drives'] else 0}
 redirectcomports:i:0
 redirectsmartcards:i:0
 username:s:{connection.get('username', '')}
@@ -58,6 +76,7 @@ def cleanup_rdp_file(rdp_path: str):
         pass
 
 
+@traced(cat="rdp")
 def launch_rdp(rdp_file_path: str):
     subprocess.Popen(
         ["mstsc.exe", rdp_file_path],
@@ -65,9 +84,39 @@ def launch_rdp(rdp_file_path: str):
     )
 
 
-def connect(connection: dict, master_password: str, encryption_salt: bytes):
+class LaunchCancelled(Exception):
+    pass
+
+
+def connect(connection: dict, master_password: str, encryption_salt: bytes, progress=None,
+            cancel: threading.Event | None = None):
+    # progress(stage) is called before each of "decrypt", "credentials",
+    # "render" and "spawn". Setting cancel stops the launch at the next of
+    # those with LaunchCancelled; once mstsc is spawned it is too late.
+    def report(stage: str):
+        if cancel is not None and cancel.is_set():
+            raise LaunchCancelled(stage)
+        if progress:
+            progress(stage)
+
+    started = time.perf_counter()
+    try:
+        timer = _launch(connection, master_password, encryption_salt, report)
+    except LaunchCancelled:
+        LAUNCHES.inc(result="cancelled")
+        raise
+    except Exception:
+        LAUNCHES.inc(result="error")
+        raise
+    LAUNCHES.inc(result="ok")
+    LAUNCH_SECONDS.observe(time.perf_counter() - started)
+    return timer
+
+
+def _launch(connection: dict, master_password: str, encryption_salt: bytes, report):
     password = ""
     if connection.get("encrypted_password"):
+        report("decrypt")
         password = decrypt_password(
             connection["encrypted_password"], master_password, encryption_salt
         )
@@ -75,31 +124,119 @@ def connect(connection: dict, master_password: str, encryption_salt: bytes):
     hostname = connection["hostname"]
     port = connection.get("port", 3389)
     username = connection.get("username", "")
+    staged = bool(username and password)
 
-    if username and password:
+    if staged:
+        report("credentials")
         store_credentials(hostname, port, username, password)
 
-    rdp_path = generate_rdp_file(connection)
+    rdp_path = None
+    try:
+        report("render")
+        rdp_path = generate_rdp_file(connection)
+        report("spawn")
+    except LaunchCancelled:
+        # Nothing was launched; do not leave the password in the vault.
+        if staged:
+            cleanup_credentials(hostname)
+        if rdp_path:
+            cleanup_rdp_file(rdp_path)
+        raise
     launch_rdp(rdp_path)
 
     def _cleanup():
-        if username and password:
+        if staged:
             cleanup_credentials(hostname)
         cleanup_rdp_file(rdp_path)
 
     timer = threading.Timer(30.0, _cleanup)
     timer.daemon = True
     timer.start()
+    return timer
+
+
+# Probes check the RDP listener itself rather than ICMP: connect to the
+# port, send an X.224 Connection Request carrying an RDP negotiation
+# request, and expect a TPKT-framed reply. A host that accepts the TCP
+# connection but never answers (hung service, tarpit) counts as down.
+PROBE_TIMEOUT = 1.5
+PROBE_CONCURRENCY = 256
+X224_CONNECTION_REQUEST = bytes.fromhex("030000130ee000000000000100080003000000")
+TPKT_VERSION = 3
+
+
+def tcp_probe(hostname: str, port: int = 3389, timeout: float = PROBE_TIMEOUT) -> bool:
+    # Blocking; one socket and no subprocess, so it is cheap to run from a
+    # thread pool.
+    with PROBE_SECONDS.time():
+        try:
+            with socket.create_connection((hostname, port or 3389), timeout=timeout) as sock:
+                sock.sendall(X224_CONNECTION_REQUEST)
+                alive = sock.recv(4)[:1] == bytes([TPKT_VERSION])
+        except OSError:
+            alive = False
+    PROBES.inc(result="up" if alive else "down")
+    return alive
+
+
+async def _probe_async(hostname: str, port: int, timeout: float) -> bool:
+    streams = []
+
+    async def handshake():
+        reader, writer = await asyncio.open_connection(hostname, port or 3389)
+        streams.append(writer)
+        writer.write(X224_CONNECTION_REQUEST)
+        await writer.drain()
+        return (await reader.read(4))[:1] == bytes([TPKT_VERSION])
 
-
-def ping_host(hostname: str) -> bool:
     try:
-        result = subprocess.run(
-            ["ping", "-n", "1", "-w", "1000", hostname],
-            capture_output=True,
-            creationflags=subprocess.CREATE_NO_WINDOW,
-            timeout=5,
-        )
-        return result.returncode == 0
-    except (subprocess.TimeoutExpired, FileNotFoundError):
+        return await asyncio.wait_for(handshake(), timeout)
+    except (OSError, asyncio.TimeoutError):
         return False
+    finally:
+        for writer in streams:
+            writer.close()
+
+
+def probe_many(targets, timeout: float = PROBE_TIMEOUT, concurrency: int = PROBE_CONCURRENCY,
+               on_result=None) -> dict:
+    # Probes (key, hostname, port) targets on one asyncio loop in the
+    # calling thread, at most concurrency at a time: thousands of hosts
+    # cost sockets, not threads. on_result(key, alive, seconds) is called
+    # as each finishes. Returns {key: alive}.
+    results = {}
+
+    async def run():
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(key, hostname, port):
+            async with gate:
+                start = time.perf_counter()
+                alive = await _probe_async(hostname, port, timeout)
+                elapsed = time.perf_counter() - start
+            PROBE_SECONDS.observe(elapsed)
+            PROBES.inc(result="up" if alive else "down")
+            results[key] = alive
+            if on_result is not None:
+                on_result(key, alive, elapsed)
+
+        await asyncio.gather(*(one(*target) for target in targets))
+
+    asyncio.run(run())
+    return results
+
+
+def ping_host(hostname: str) -> bool:
+    with PROBE_SECONDS.time():
+        try:
+            result = subprocess.run(
+                ["ping", "-n", "1", "-w", "1000", hostname],
+                capture_output=True,
+                creationflags=subprocess.CREATE_NO_WINDOW,
+                timeout=5,
+            )
+            alive = result.returncode == 0
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            alive = False
+    PROBES.inc(result="up" if alive else "down")
+    return alive
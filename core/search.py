@@ -0,0 +1,79 @@
+SEARCH_FIELDS = ("name", "hostname", "username")
+
+
+def _haystack(conn: dict) -> str:
+    # Fields are joined with a newline so no query (which never contains
+    # one) can match across a field boundary.
+    return "\n".join((conn.get(f) or "").lower() for f in SEARCH_FIELDS)
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self):
+        self._docs = {}
+        self._postings = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def rebuild(self, connections: list[dict]):
+        self._docs = {}
+        self._postings = {}
+        for conn in connections:
+            self.add(conn)
+
+    def add(self, conn: dict):
+        conn_id = conn["id"]
+        if conn_id in self._docs:
+            self.remove(conn_id)
+        doc = _haystack(conn)
+        self._docs[conn_id] = doc
+        for gram in _trigrams(doc):
+            self._postings.setdefault(gram, set()).add(conn_id)
+
+    def update(self, conn: dict):
+        self.add(conn)
+
+    def remove(self, conn_id: int):
+        doc = self._docs.pop(conn_id, None)
+        if doc is None:
+            return
+        for gram in _trigrams(doc):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(conn_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def matches(self, conn_id: int, query: str) -> bool:
+        doc = self._docs.get(conn_id)
+        return doc is not None and query.lower() in doc
+
+    def search(self, query: str) -> set[int]:
+        query = query.lower()
+        if not query:
+            return set(self._docs)
+        if len(query) < 3:
+            return {i for i, doc in self._docs.items() if query in doc}
+
+        postings = []
+        for gram in _trigrams(query):
+            ids = self._postings.get(gram)
+            if not ids:
+                return set()
+            postings.append(ids)
+        postings.sort(key=len)
+
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates &= ids
+            if not candidates:
+                return candidates
+
+        # Trigram hits are only candidates: "abc-bcd" has every gram of
+        # "abcd" without containing it.
+        docs = self._docs
+        return {i for i in candidates if query in docs[i]}
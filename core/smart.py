@@ -0,0 +1,203 @@
+import fnmatch
+import functools
+import heapq
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from core.tags import TagQueryError, parse_query
+
+# Smart folders are saved queries shown as virtual categories. A query is a
+# tag filter (see core.tags) in which a few prefixes test the connection
+# itself instead of its tags:
+#
+#   is:up, is:down, is:unknown   result of the last reachability probe
+#   idle:30d                     not connected for 30 days (h, d and w work)
+#   in:<category>                category name, spaces written as "-";
+#                                in:none is Uncategorized
+#   host:<glob>, user:<glob>     e.g. host:*.corp.example
+#
+# so "env:prod idle:30d" or "role:sql is:down". Each folder's members are
+# kept as a set that is updated one connection at a time as rows, tags and
+# probe results change; nothing is re-evaluated against the whole fleet
+# after the first build.
+
+_DURATION = re.compile(r"(\d+)([hdw])$")
+_UNITS = {"h": "hours", "d": "days", "w": "weeks"}
+STATUSES = ("up", "down", "unknown")
+PREDICATES = ("is", "idle", "in", "host", "user")
+
+# What a query sees of one connection: the row, its category name (None
+# when uncategorized), its set of tags and "up", "down" or "unknown".
+Facts = namedtuple("Facts", "conn category tags status")
+
+
+def _duration(arg: str) -> timedelta:
+    m = _DURATION.match(arg)
+    if not m:
+        raise TagQueryError(f"idle:{arg} needs a duration such as 30d")
+    return timedelta(**{_UNITS[m.group(2)]: int(m.group(1))})
+
+
+def _last_connected(conn: dict) -> datetime | None:
+    value = conn.get("last_connected")
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _predicate(kind: str, arg: str):
+    if kind == "is":
+        if arg not in STATUSES:
+            raise TagQueryError(f"is:{arg} is not one of {', '.join(STATUSES)}")
+        return lambda f, now: f.status == arg
+    if kind == "idle":
+        age = _duration(arg)
+
+        def idle(f, now):
+            last = _last_connected(f.conn)
+            return last is None or last <= now - age
+        return idle
+    if kind == "in":
+        if arg == "none":
+            return lambda f, now: f.category is None
+        return lambda f, now: (f.category or "").lower().replace(" ", "-") == arg
+    column = {"host": "hostname", "user": "username"}[kind]
+    return lambda f, now: fnmatch.fnmatchcase((f.conn[column] or "").lower(), arg)
+
+
+def _compile(node, durations: list):
+    op = node[0]
+    if op == "all":
+        return lambda f, now: True
+    if op == "tag":
+        name = node[1]
+        kind, sep, arg = name.partition(":")
+        if sep and kind in PREDICATES:
+            if kind == "idle":
+                durations.append(_duration(arg))
+            return _predicate(kind, arg)
+        return lambda f, now: name in f.tags
+    if op == "not":
+        inner = _compile(node[1], durations)
+        return lambda f, now: not inner(f, now)
+    a, b = _compile(node[1], durations), _compile(node[2], durations)
+    if op == "and":
+        return lambda f, now: a(f, now) and b(f, now)
+    return lambda f, now: a(f, now) or b(f, now)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_folder(query: str):
+    # Returns (test, durations): test(facts, now) -> bool, and the idle:
+    # ages the query uses. Raises TagQueryError for a malformed query.
+    durations = []
+    test = _compile(parse_query(query.strip()), durations)
+    return test, tuple(durations)
+
+
+class SmartFolders:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._queries = {}
+        self._tests = {}
+        self._durations = ()
+        self.members = {}
+        # (when, connection id): idle: results only change with the clock,
+        # so each row is queued for the moment its next threshold passes.
+        self._expiry = []
+        self._due = {}
+
+    def set_folders(self, folders) -> set:
+        # folders: rows of db.get_smart_folders(). Returns the ids whose
+        # query is new or changed; pass them to rebuild().
+        wanted = {f["id"]: f["query"] for f in folders}
+        for fid in set(self._queries) - set(wanted):
+            del self._queries[fid], self._tests[fid], self.members[fid]
+        stale = {fid for fid, query in wanted.items() if self._queries.get(fid) != query}
+        for fid in stale:
+            self._queries[fid] = wanted[fid]
+            self._tests[fid] = compile_folder(wanted[fid])[0]
+            self.members[fid] = set()
+        self._durations = tuple(sorted({d for q in wanted.values() for d in compile_folder(q)[1]}))
+        return stale
+
+    def rebuild(self, facts, fids=None, now: datetime | None = None):
+        # facts: a Facts for every connection; fids limits the build to
+        # those folders.
+        now = now or datetime.now()
+        fids = list(self._tests if fids is None else fids)
+        tests = [(self._tests[fid], self.members[fid]) for fid in fids]
+        for _, members in tests:
+            members.clear()
+        if len(fids) == len(self._tests):
+            self._expiry = []
+            self._due = {}
+        for f in facts:
+            for test, members in tests:
+                if test(f, now):
+                    members.add(f.conn["id"])
+            when = self._next_expiry(f.conn, now)
+            if when is not None and self._due.get(f.conn["id"]) != when:
+                self._due[f.conn["id"]] = when
+                self._expiry.append((when, f.conn["id"]))
+        heapq.heapify(self._expiry)
+
+    def _next_expiry(self, conn: dict, now: datetime) -> datetime | None:
+        if not self._durations:
+            return None
+        last = _last_connected(conn)
+        if last is None:
+            return None
+        return next((last + age for age in self._durations if last + age > now), None)
+
+    def _schedule(self, conn: dict, now: datetime):
+        when = self._next_expiry(conn, now)
+        if when is not None and self._due.get(conn["id"]) != when:
+            self._due[conn["id"]] = when
+            heapq.heappush(self._expiry, (when, conn["id"]))
+
+    def update(self, facts: Facts, now: datetime | None = None) -> set:
+        # Re-evaluates one connection; returns the ids of folders it joined
+        # or left.
+        now = now or datetime.now()
+        changed = set()
+        conn_id = facts.conn["id"]
+        for fid, test in self._tests.items():
+            members = self.members[fid]
+            if test(facts, now) != (conn_id in members):
+                members ^= {conn_id}
+                changed.add(fid)
+        self._schedule(facts.conn, now)
+        return changed
+
+    def remove(self, conn_id: int) -> set:
+        self._due.pop(conn_id, None)
+        changed = set()
+        for fid, members in self.members.items():
+            if conn_id in members:
+                members.discard(conn_id)
+                changed.add(fid)
+        return changed
+
+    def expire(self, lookup, now: datetime | None = None) -> set:
+        # lookup(conn_id) -> Facts, or None once the connection is gone.
+        now = now or datetime.now()
+        due = set()
+        while self._expiry and self._expiry[0][0] <= now:
+            when, conn_id = heapq.heappop(self._expiry)
+            # Entries superseded by a later reconnect are skipped.
+            if self._due.get(conn_id) == when:
+                del self._due[conn_id]
+                due.add(conn_id)
+        changed = set()
+        for conn_id in due:
+            facts = lookup(conn_id)
+            if facts is not None:
+                changed |= self.update(facts, now=now)
+        return changed
@@ -0,0 +1,223 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from pathlib import Path
+
+from core import database as db
+from core.tracing import traced
+
+# A copy of the list model (categories, smart folders and every connection
+# row) kept next to the database, so the window can paint its first frame
+# without opening SQLite. Layout, little-endian:
+#
+#   header    HEADER below
+#   meta      JSON: column names and kinds, categories, smart folders
+#   records   one fixed-width struct per connection, a cell per column:
+#             "i" columns are an int64 (NULL_INT for NULL), "s" columns
+#             a uint32 index into the string table (0 for NULL)
+#   strings   the count of distinct strings, their uint32 end offsets,
+#             then the strings themselves as UTF-8
+#
+# The header records the size and mtime of the database file and its WAL
+# as they were when the snapshot was taken; any write since changes one of
+# them and the snapshot is ignored. PRAGMA data_version would need an open
+# connection and only means something within that connection, so it cannot
+# vouch for a file written by an earlier run. A CRC of everything after the
+# header catches a torn or damaged file. The change_seq counter at the time
+# of the snapshot is kept too, so the watcher can replay whatever tracked
+# changes land between loading it and opening the database.
+
+MAGIC = b"RDPS"
+# Also bump it when the connections table gains a column, so a snapshot
+# taken before the migration is not mistaken for current rows.
+FORMAT_VERSION = 1
+# magic, version, column count, rows, meta bytes, string bytes, change_seq,
+# database size and mtime, WAL size and mtime, CRC-32 of the body.
+HEADER = struct.Struct("<4sHHIIIQqqqqI")
+NULL_INT = -(1 << 63)
+COUNT = struct.Struct("<I")
+# Reads that the stamp check rejects before write_current gives up.
+WRITE_ATTEMPTS = 3
+
+_write_lock = threading.Lock()
+
+
+class Snapshot:
+    def __init__(self, categories: list, smart_folders: list, connections: list, seq: int):
+        self.categories = categories
+        self.smart_folders = smart_folders
+        # In name order, as db.get_connections() returns them.
+        self.connections = connections
+        self.seq = seq
+
+
+def path_for(db_path: Path) -> Path:
+    return db_path.with_name(db_path.name + ".snapshot")
+
+
+def db_stamp(db_path: Path) -> tuple:
+    # (size, mtime_ns) of the database and of its WAL, zeros when absent.
+    stamp = []
+    for path in (db_path, db_path.with_name(db_path.name + "-wal")):
+        try:
+            st = os.stat(path)
+            stamp += [st.st_size, st.st_mtime_ns]
+        except OSError:
+            stamp += [0, 0]
+    return tuple(stamp)
+
+
+def _kind(values) -> str | None:
+    # "i" or "s"; None when a column mixes the two, which SQLite allows.
+    kinds = {type(v) for v in values if v is not None}
+    if kinds <= {int}:
+        return "i"
+    if kinds == {str}:
+        return "s"
+    return None
+
+
+def _record_struct(kinds) -> struct.Struct:
+    return struct.Struct("<" + "".join("q" if k == "i" else "I" for k in kinds))
+
+
+def encode(snapshot: Snapshot, stamp: tuple) -> bytes | None:
+    # None when a column cannot be stored in a fixed-width cell.
+    rows = snapshot.connections
+    names = list(rows[0]) if rows else []
+    kinds = [_kind(r[name] for r in rows) for name in names]
+    if None in kinds:
+        return None
+    record = _record_struct(kinds)
+
+    # Index 0 stands for NULL, so real strings are numbered from 1.
+    indexes = {}
+    records = bytearray(record.size * len(rows))
+    for i, row in enumerate(rows):
+        cells = []
+        for name, kind in zip(names, kinds):
+            value = row[name]
+            if kind == "i":
+                cells.append(NULL_INT if value is None else value)
+            elif value is None:
+                cells.append(0)
+            else:
+                cells.append(indexes.setdefault(value, len(indexes) + 1))
+        record.pack_into(records, i * record.size, *cells)
+
+    encoded = [value.encode("utf-8") for value in indexes]
+    ends = []
+    end = 0
+    for data in encoded:
+        end += len(data)
+        ends.append(end)
+    strings = COUNT.pack(len(encoded)) + struct.pack(f"<{len(ends)}I", *ends) + b"".join(encoded)
+
+    meta = json.dumps({
+        "columns": list(zip(names, kinds)),
+        "categories": snapshot.categories,
+        "smart_folders": snapshot.smart_folders,
+    }, separators=(",", ":"), default=str).encode("utf-8")
+    body = meta + records + strings
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(names), len(rows), len(meta), len(strings),
+                         snapshot.seq, *stamp, zlib.crc32(body))
+    return header + body
+
+
+def _decode(view: memoryview, stamp: tuple) -> Snapshot | None:
+    if len(view) < HEADER.size:
+        return None
+    (magic, version, ncols, nrows, meta_len, strings_len, seq,
+     *saved_stamp, crc) = HEADER.unpack_from(view)
+    if magic != MAGIC or version != FORMAT_VERSION or tuple(saved_stamp) != stamp:
+        return None
+    body = view[HEADER.size:]
+    if zlib.crc32(body) != crc:
+        return None
+    meta = json.loads(str(body[:meta_len], "utf-8"))
+    columns = meta["columns"]
+    record = _record_struct(kind for _, kind in columns)
+    records_end = meta_len + record.size * nrows
+    if len(columns) != ncols or records_end + strings_len != len(body):
+        return None
+    strings = body[records_end:]
+    (count,) = COUNT.unpack_from(strings)
+    ends = struct.unpack_from(f"<{count}I", strings, COUNT.size)
+    blob = strings[COUNT.size + 4 * count:]
+    table = [None]
+    start = 0
+    for end in ends:
+        table.append(str(blob[start:end], "utf-8"))
+        start = end
+
+    # (name, cell, is a string) per column.
+    plan = [(name, i, kind == "s") for i, (name, kind) in enumerate(columns)]
+    rows = [
+        {name: table[cells[i]] if is_text else (None if cells[i] == NULL_INT else cells[i])
+         for name, i, is_text in plan}
+        for cells in record.iter_unpack(body[meta_len:records_end])
+    ] if nrows else []
+    return Snapshot(meta["categories"], meta["smart_folders"], rows, seq)
+
+
+@traced(cat="db")
+def load(path: Path, stamp: tuple) -> Snapshot | None:
+    # None when the file is missing, damaged, from another format version
+    # or older than the database; the caller then reads the database.
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None
+    with f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # ValueError: an empty file cannot be mapped.
+            return None
+    with mapped:
+        try:
+            with memoryview(mapped) as view:
+                return _decode(view, stamp)
+        except (struct.error, ValueError, KeyError, IndexError, TypeError):
+            return None
+
+
+def save(path: Path, snapshot: Snapshot, stamp: tuple) -> bool:
+    data = encode(snapshot, stamp)
+    if data is None:
+        return False
+    # Written aside and renamed so a reader never maps a partial file.
+    fd, tmp = tempfile.mkstemp(prefix=path.name + ".", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+@traced(cat="db")
+def write_current() -> bool:
+    # Snapshots the database as it is now. Safe to call from any thread.
+    with _write_lock:
+        db_path = db.get_db_path()
+        for _ in range(WRITE_ATTEMPTS):
+            # Stamped on both sides of the read, and thrown away if the two
+            # differ: a write in between may be missing from the rows yet
+            # counted in the stamp. Closing the last connection may also
+            # checkpoint the WAL, which changes both files; the next read
+            # then finds them settled.
+            stamp = db_stamp(db_path)
+            snapshot = db.read_snapshot()
+            if db_stamp(db_path) == stamp:
+                return save(path_for(db_path), Snapshot(*snapshot), stamp)
+        return False
@@ -0,0 +1,235 @@
+import functools
+import re
+
+# Each connection gets a dense ordinal, and each tag is a Python int used as
+# a bitset over those ordinals. A filter such as
+# "env:prod AND role:sql AND NOT site:dr" then compiles to a few big-int
+# ANDs, ORs and masks, whatever the size of the fleet.
+#
+# Grammar (operators are case-insensitive; adjacent terms mean AND):
+#   expr := term (OR term)*
+#   term := factor (AND? factor)*
+#   factor := NOT factor | "(" expr ")" | TAG
+# "-tag" is shorthand for NOT tag. Tags are lower-cased.
+
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|(-)(?=[\w.:/@*?])|([\w.:/@*?-]+))")
+
+
+class TagQueryError(ValueError):
+    pass
+
+
+def normalize_tags(text_or_tags) -> list[str]:
+    # Accepts "a, b c" or an iterable of names; returns sorted unique tags.
+    if isinstance(text_or_tags, str):
+        text_or_tags = re.split(r"[\s,]+", text_or_tags)
+    return sorted({t.strip().lower() for t in text_or_tags if t and t.strip()})
+
+
+def _tokenize(text: str) -> list[str]:
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m or m.end() == pos:
+            raise TagQueryError(f"unexpected {text[pos:].strip()[:10]!r}")
+        pos = m.end()
+        lparen, rparen, minus, word = m.groups()
+        if lparen or rparen:
+            tokens.append(lparen or rparen)
+        elif minus:
+            tokens.append("NOT")
+        elif word.upper() in ("AND", "OR", "NOT"):
+            tokens.append(word.upper())
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+@functools.lru_cache(maxsize=256)
+def parse_query(text: str) -> tuple:
+    # Returns the syntax tree: ("or", a, b), ("and", a, b), ("not", a),
+    # ("tag", name), or ("all",) for an empty query.
+    tokens = _tokenize(text)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def expr():
+        left = term()
+        while peek() == "OR":
+            take()
+            left = ("or", left, term())
+        return left
+
+    def term():
+        left = factor()
+        while peek() not in (None, "OR", ")"):
+            if peek() == "AND":
+                take()
+            left = ("and", left, factor())
+        return left
+
+    def factor():
+        token = peek()
+        if token is None:
+            raise TagQueryError("expression ends early")
+        take()
+        if token == "NOT":
+            return ("not", factor())
+        if token == "(":
+            inner = expr()
+            if peek() != ")":
+                raise TagQueryError("missing ')'")
+            take()
+            return inner
+        if token in (")", "AND", "OR"):
+            raise TagQueryError(f"unexpected {token!r}")
+        return ("tag", token)
+
+    if not tokens:
+        return ("all",)
+    tree = expr()
+    if pos != len(tokens):
+        raise TagQueryError(f"unexpected {tokens[pos]!r}")
+    return tree
+
+
+def _compile_bits(node):
+    op = node[0]
+    if op == "all":
+        return lambda ix: ix.universe
+    if op == "tag":
+        return lambda ix: ix.bits(node[1])
+    if op == "not":
+        inner = _compile_bits(node[1])
+        return lambda ix: ix.universe & ~inner(ix)
+    a, b = _compile_bits(node[1]), _compile_bits(node[2])
+    if op == "and":
+        return lambda ix: a(ix) & b(ix)
+    return lambda ix: a(ix) | b(ix)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_query(text: str):
+    # Returns a function of a TagIndex that yields the matching bitset.
+    return _compile_bits(parse_query(text))
+
+
+class TagIndex:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._ordinals = {}
+        self._ids = []
+        self._free = []
+        self._tags = {}
+        self._bits = {}
+        self.universe = 0
+
+    def rebuild(self, pairs, conn_ids=()):
+        # pairs: (connection_id, tag) for every tagged connection; conn_ids
+        # adds untagged connections so NOT can match them.
+        # Bitsets are assembled in a bytearray: OR-ing one bit at a time
+        # into a growing int would copy it for every connection.
+        self.clear()
+        ordinals = self._ordinals
+        for conn_id in conn_ids:
+            ordinals.setdefault(conn_id, len(ordinals))
+        members = {}
+        for conn_id, tag in pairs:
+            tag = tag.lower()
+            ordinal = ordinals.setdefault(conn_id, len(ordinals))
+            self._tags.setdefault(conn_id, set()).add(tag)
+            members.setdefault(tag, []).append(ordinal)
+        self._ids = [None] * len(ordinals)
+        for conn_id, ordinal in ordinals.items():
+            self._ids[ordinal] = conn_id
+        self.universe = (1 << len(ordinals)) - 1
+        size = (len(ordinals) + 7) // 8
+        for tag, ords in members.items():
+            buf = bytearray(size)
+            for o in ords:
+                buf[o >> 3] |= 1 << (o & 7)
+            self._bits[tag] = int.from_bytes(buf, "little")
+
+    def _ordinal(self, conn_id: int) -> int:
+        ordinal = self._ordinals.get(conn_id)
+        if ordinal is None:
+            if self._free:
+                ordinal = self._free.pop()
+                self._ids[ordinal] = conn_id
+            else:
+                ordinal = len(self._ids)
+                self._ids.append(conn_id)
+            self._ordinals[conn_id] = ordinal
+            self.universe |= 1 << ordinal
+        return ordinal
+
+    def set_tags(self, conn_id: int, tags):
+        tags = set(normalize_tags(tags))
+        old = self._tags.get(conn_id, set())
+        if tags == old:
+            return
+        bit = 1 << self._ordinal(conn_id)
+        for tag in old - tags:
+            remaining = self._bits[tag] & ~bit
+            if remaining:
+                self._bits[tag] = remaining
+            else:
+                del self._bits[tag]
+        for tag in tags - old:
+            self._bits[tag] = self._bits.get(tag, 0) | bit
+        self._tags[conn_id] = tags
+
+    def add(self, conn_id: int):
+        # An untagged connection still has to be in the universe for NOT.
+        self._ordinal(conn_id)
+
+    def remove(self, conn_id: int):
+        self.set_tags(conn_id, ())
+        ordinal = self._ordinals.pop(conn_id, None)
+        if ordinal is not None:
+            self._tags.pop(conn_id, None)
+            self.universe &= ~(1 << ordinal)
+            self._ids[ordinal] = None
+            self._free.append(ordinal)
+
+    def bits(self, tag: str) -> int:
+        return self._bits.get(tag, 0)
+
+    def tags_of(self, conn_id: int) -> list[str]:
+        return sorted(self._tags.get(conn_id, ()))
+
+    def tag_set(self, conn_id: int) -> set[str]:
+        # The index's own set; do not modify it.
+        return self._tags.get(conn_id, set())
+
+    def tag_counts(self) -> dict[str, int]:
+        return {tag: bits.bit_count() for tag, bits in sorted(self._bits.items())}
+
+    def evaluate(self, query: str) -> int:
+        return compile_query(query.strip())(self)
+
+    def ids(self, bits: int) -> set[int]:
+        # One pass over the binary string beats peeling bits off a large
+        # int, which copies it every time.
+        digits = bin(bits)[:1:-1]
+        ids = self._ids
+        found = set()
+        i = digits.find("1")
+        while i != -1:
+            found.add(ids[i])
+            i = digits.find("1", i + 1)
+        return found
+
+    def query(self, query: str) -> set[int]:
+        return self.ids(self.evaluate(query))
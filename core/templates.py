@@ -0,0 +1,122 @@
+# Connection templates. A template holds RDP settings and may inherit from
+# a parent template; categories and connections can each name one. A NULL
+# setting means "inherit", and a connection's effective value is the first
+# one set along:
+#
+#   the connection itself
+#   -> its template, then that template's parents
+#   -> its category's template, then that template's parents
+#   -> DEFAULTS
+#
+# so changing a template changes every connection that does not override
+# the field, without touching their rows.
+
+SETTINGS = (
+    "screen_mode", "desktop_width", "desktop_height", "color_depth",
+    "redirect_clipboard", "redirect_printers", "redirect_drives",
+)
+DEFAULTS = {
+    "screen_mode": 2,
+    "desktop_width": 1920,
+    "desktop_height": 1080,
+    "color_depth": 32,
+    "redirect_clipboard": 1,
+    "redirect_printers": 0,
+    "redirect_drives": 0,
+}
+
+
+def with_defaults(connection: dict) -> dict:
+    # The connection's own settings with DEFAULTS for the unset ones.
+    return {f: DEFAULTS[f] if connection.get(f) is None else connection[f] for f in SETTINGS}
+
+
+class TemplateTree:
+    # Memoizes what each template chain contributes and the merged base of
+    # each (connection template, category template) pair. Editing a
+    # template only drops the entries of that template and the templates
+    # that inherit from it.
+
+    def __init__(self, templates, category_templates: dict):
+        self._rows = {t["id"]: dict(t) for t in templates}
+        self._category_templates = dict(category_templates)
+        self._chains = {}
+        self._bases = {}
+
+    def get(self, template_id: int | None) -> dict | None:
+        return self._rows.get(template_id)
+
+    def category_template(self, category_id: int | None) -> int | None:
+        return self._category_templates.get(category_id)
+
+    def _descendants(self, template_id: int) -> set:
+        found = {template_id}
+        grew = True
+        while grew:
+            grew = False
+            for tid, row in self._rows.items():
+                if tid not in found and row.get("parent_id") in found:
+                    found.add(tid)
+                    grew = True
+        return found
+
+    def would_cycle(self, template_id: int, parent_id: int | None) -> bool:
+        return parent_id is not None and parent_id in self._descendants(template_id)
+
+    def _chain(self, template_id: int | None) -> dict:
+        # Settings set somewhere along the template's parent chain.
+        if template_id is None or template_id not in self._rows:
+            return {}
+        cached = self._chains.get(template_id)
+        if cached is not None:
+            return cached
+        row = self._rows[template_id]
+        # The parent link is checked on write; a cycle from a concurrent
+        # edit elsewhere is cut here rather than recursing forever.
+        self._chains[template_id] = {}
+        inherited = self._chain(row.get("parent_id"))
+        own = {f: row[f] for f in SETTINGS if row.get(f) is not None}
+        chain = {**inherited, **own}
+        self._chains[template_id] = chain
+        return chain
+
+    def base(self, template_id: int | None, category_id: int | None = None) -> dict:
+        # What a connection with no overrides of its own resolves to.
+        key = (template_id, self._category_templates.get(category_id))
+        base = self._bases.get(key)
+        if base is None:
+            base = {**DEFAULTS, **self._chain(key[1]), **self._chain(key[0])}
+            self._bases[key] = base
+        return base
+
+    def effective(self, connection: dict) -> dict:
+        base = self.base(connection.get("template_id"), connection.get("category_id"))
+        return {f: base[f] if connection.get(f) is None else connection[f] for f in SETTINGS}
+
+    def invalidate(self, template_id: int):
+        dropped = self._descendants(template_id)
+        for tid in dropped:
+            self._chains.pop(tid, None)
+        for key in [k for k in self._bases if k[0] in dropped or k[1] in dropped]:
+            del self._bases[key]
+
+    def put(self, row: dict):
+        self.invalidate(row["id"])
+        self._rows[row["id"]] = dict(row)
+
+    def remove(self, template_id: int):
+        self.invalidate(template_id)
+        self._rows.pop(template_id, None)
+        for row in self._rows.values():
+            if row.get("parent_id") == template_id:
+                row["parent_id"] = None
+        for cid, tid in list(self._category_templates.items()):
+            if tid == template_id:
+                del self._category_templates[cid]
+
+    def set_category_template(self, category_id: int, template_id: int | None):
+        # Bases are keyed by template, not category, so nothing to drop.
+        if template_id is None:
+            self._category_templates.pop(category_id, None)
+        else:
+            self._category_templates[category_id] = template_id
@@ -0,0 +1,129 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+# Spans are kept in a bounded ring so tracing can stay on for a whole
+# session; the oldest events fall off once it is full.
+RING_SIZE = 100_000
+
+_enabled = False
+_events = deque(maxlen=RING_SIZE)
+_thread_names = {}
+_origin_ns = time.perf_counter_ns()
+
+
+def enable(ring_size: int | None = None):
+    global _enabled, _events
+    if ring_size is not None and ring_size != _events.maxlen:
+        _events = deque(_events, maxlen=ring_size)
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def clear():
+    _events.clear()
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name: str, cat: str, args: dict | None):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        thread = threading.current_thread()
+        _thread_names[thread.ident] = thread.name
+        # deque.append is atomic, so worker threads can record without a lock.
+        _events.append((self.name, self.cat, self.start, end, thread.ident, self.args))
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, cat: str = "app", **args):
+    # With tracing off this returns a shared no-op context manager, so a
+    # span costs one global lookup and a call.
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name, cat, args or None)
+
+
+def traced(name: str | None = None, cat: str = "app"):
+    def decorate(fn):
+        label = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(label, cat, None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot() -> list[tuple]:
+    return list(_events)
+
+
+def to_chrome_trace() -> dict:
+    # Chrome trace_event format: complete ("X") events with microsecond
+    # timestamps, plus metadata events naming each thread.
+    pid = os.getpid()
+    events = []
+    for name, cat, start, end, tid, args in snapshot():
+        event = {
+            "name": name, "cat": cat, "ph": "X", "pid": pid, "tid": tid,
+            "ts": (start - _origin_ns) / 1000, "dur": (end - start) / 1000,
+        }
+        if args:
+            event["args"] = {k: str(v) for k, v in args.items()}
+        events.append(event)
+    for tid, thread_name in list(_thread_names.items()):
+        events.append({
+            "name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+            "args": {"name": thread_name},
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def dump(path: Path) -> int:
+    data = to_chrome_trace()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return sum(1 for e in data["traceEvents"] if e["ph"] == "X")
+
+
+def default_trace_path(directory: Path) -> Path:
+    return Path(directory) / f"trace-{time.strftime('%Y%m%d-%H%M%S')}.json"
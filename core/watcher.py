@@ -0,0 +1,102 @@
+import sqlite3
+
+from core import database as db
+from core.tracing import traced
+
+# Notices writes made to the database by anything else: the CLI, a script,
+# an import or another instance sharing the file. PRAGMA data_version on a
+# connection held open for the purpose changes whenever another connection
+# commits, and reading it touches no table, so an idle poll costs a few
+# microseconds. Only when it moves are the change_seq columns consulted.
+# data_version also moves when this process commits through another
+# connection; the change_seq ranges of those commits (db.own_changes) are
+# left out, since the caller has applied its own writes already.
+
+# Past this many changed rows, patching row by row is slower than a reload.
+PATCH_LIMIT = 500
+
+
+class Changes:
+    def __init__(self):
+        self.connections = []
+        self.deleted = set()
+        self.categories = False
+        self.reload = False
+
+    def __bool__(self):
+        return bool(self.connections or self.deleted or self.categories or self.reload)
+
+
+class DatabaseWatcher:
+    def __init__(self, since: int | None = None):
+        # Autocommit, so no read transaction is left open between polls.
+        self._conn = sqlite3.connect(str(db.get_db_path()), isolation_level=None,
+                                     timeout=db.BUSY_TIMEOUT)
+        self._conn.row_factory = sqlite3.Row
+        self._data_version = None
+        self._seq = 0
+        self.catch_up()
+        if since is not None:
+            # The caller's rows are as of change_seq `since` (a startup
+            # snapshot); the first poll reports anything newer.
+            self._data_version = None
+            self._seq = since
+
+    def catch_up(self):
+        # Forget everything up to now, e.g. after the caller reloaded anyway.
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self._seq = self._conn.execute("SELECT seq FROM change_counter").fetchone()["seq"]
+
+    @traced(cat="db")
+    def poll(self) -> Changes | None:
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return None
+        self._data_version = data_version
+        # Templates are not in the change log; reloading them is one query.
+        db.invalidate_template_cache()
+
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            seq = conn.execute("SELECT seq FROM change_counter").fetchone()["seq"]
+            if seq == self._seq:
+                # Only untracked columns (last_connected, settings) moved.
+                return None
+            own = db.own_changes(self._seq)
+            newer = "change_seq > ?" + " AND change_seq NOT BETWEEN ? AND ?" * len(own)
+            params = [self._seq] + [v for before, after in own for v in (before + 1, after)]
+            changes = Changes()
+            count = conn.execute(
+                f"SELECT COUNT(*) FROM connections WHERE {newer}", params
+            ).fetchone()[0]
+            if count > PATCH_LIMIT:
+                changes.reload = True
+            else:
+                changes.connections = [dict(r) for r in conn.execute(
+                    f"SELECT * FROM connections WHERE {newer}", params)]
+            for row in conn.execute(
+                    f"SELECT uid, kind FROM tombstones WHERE {newer}", params):
+                if row["kind"] == "categories":
+                    changes.categories = True
+                else:
+                    changes.deleted.add(row["uid"])
+            changes.categories = changes.categories or conn.execute(
+                f"SELECT 1 FROM categories WHERE {newer} LIMIT 1", params
+            ).fetchone() is not None
+            self._seq = seq
+        finally:
+            conn.execute("COMMIT")
+        if not changes:
+            # Nothing but this process's own writes.
+            return None
+
+        # Rows cached for the touched categories are no longer current.
+        if changes.categories or changes.reload:
+            db.invalidate_connections()
+        else:
+            db.invalidate_connections({c["category_id"] for c in changes.connections})
+        return changes
+
+    def close(self):
+        self._conn.close()
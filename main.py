@@ -1,16 +1,97 @@
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
 import sys
 import os
 
 # Ensure the project root is on the path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from ui.app import RDPManagerApp
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="RDPManager")
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="record import times and startup phases, then write them as JSON",
+    )
+    parser.add_argument(
+        "--profile-output", metavar="PATH",
+        help="where --profile-startup writes its report (default: ~/.rdpmanager/startup-profile.json)",
+    )
+    parser.add_argument(
+        "--exit-after-first-paint", action="store_true",
+        help="quit as soon as the first frame is painted (for startup benchmarks)",
+    )
+    parser.add_argument(
+        "--connect", metavar="NAME",
+        help="launch the connection with this id, name or hostname",
+    )
+    parser.add_argument(
+        "--show", action="store_true",
+        help="bring the window of the running instance to the front (the default)",
+    )
+    parser.add_argument(
+        "--multi-instance", action="store_true",
+        help="start a separate instance even if one is already running",
+    )
+    parser.add_argument(
+        "--trace", action="store_true",
+        help="record hot-path spans from launch; Ctrl+Shift+T or quitting writes a Chrome trace",
+    )
+    return parser.parse_args(argv)
+
+
+def instance_message(args) -> dict:
+    if args.connect:
+        return {"command": "connect", "target": args.connect}
+    return {"command": "show"}
 
 
 def main():
-    app = RDPManagerApp()
+    args = parse_args()
+
+    # Hand the request to a running instance before anything heavy loads.
+    instance = None
+    if not args.multi_instance:
+        from core import instance as single_instance
+        instance = single_instance.acquire()
+        if instance is None:
+            if single_instance.forward(instance_message(args)):
+                return
+            print("RDP Manager is already running but did not respond.", file=sys.stderr)
+            sys.exit(1)
+
+    profile = None
+    if args.profile_startup:
+        from core.profiling import StartupProfile
+        profile = StartupProfile(start=STARTED)
+        profile.track_imports()
+
+    if args.trace:
+        from core import tracing
+        tracing.enable()
+
+    from core.profiling import phase
+
+    with phase(profile, "import_ui"):
+        from ui.app import RDPManagerApp
+
+    app = RDPManagerApp(
+        profile=profile,
+        profile_output=args.profile_output,
+        exit_after_first_paint=args.exit_after_first_paint,
+        instance=instance,
+        initial_message=instance_message(args) if args.connect else None,
+    )
     app.mainloop()
 
 
 if __name__ == "__main__":
+    # In the PyInstaller build, each worker of the .rdp importer's process
+    # pool starts this executable again; freeze_support() runs the
+    # worker's task there and exits instead of opening another window.
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,45 @@
+from core.fuzzy import FuzzyIndex, char_classes, fold, fuzzy_score
+
+
+def score(query: str, text: str) -> int | None:
+    return fuzzy_score(query, fold(text), char_classes(text))
+
+
+def conn(conn_id: int, name: str, hostname: str = "host") -> dict:
+    return {"id": conn_id, "name": name, "hostname": hostname, "username": ""}
+
+
+def test_subsequence_matches():
+    assert score("prdsql3", "prod-sql-03") is not None
+    assert score("sql", "prod-sql-03") is not None
+    assert score("lqs", "prod-sql-03") is None
+
+
+def test_word_boundary_earns_bonus():
+    assert score("sql", "prod-sql-03") > score("sql", "prodsql03")
+
+
+def test_camel_case_earns_bonus():
+    assert score("sql", "prodSql03") > score("sql", "prodsql03")
+
+
+def test_consecutive_run_beats_scattered_match():
+    assert score("pro", "prod") > score("pro", "pxrxo")
+
+
+def test_rank_orders_best_match_first():
+    index = FuzzyIndex()
+    index.rebuild([conn(1, "pxrxdxsxqxlx3"), conn(2, "prod-sql-03"), conn(3, "web-01")])
+    assert index.rank("prdsql3") == [2, 1]
+
+
+def test_name_whose_length_changes_when_lowered():
+    # "İ".lower() is two characters long.
+    assert len("İstanbul-DC".lower()) != len("İstanbul-DC")
+    assert len(fold("İstanbul-DC")) == len("İstanbul-DC")
+    index = FuzzyIndex()
+    index.rebuild([conn(1, "İstanbul-DC"), conn(2, "dc-02")])
+    assert set(index.rank("dc")) == {1, 2}
+    assert index.rank("ist") == [1]
+    index.update(conn(2, "İİ-dc"))
+    assert set(index.rank("dc")) == {1, 2}
@@ -0,0 +1,109 @@
+import pytest
+
+from core import database as db
+
+# bulk_insert's conflict policies and diff_import, its dry run. Rows are
+# matched by identity key (host, port and account).
+
+POLICIES = ("keep", "overwrite", "newest")
+
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    original = db.DB_PATH
+    db.use_database(tmp_path / "connections.db")
+    db.init_db()
+    yield
+    db.use_database(original)
+
+
+def seed():
+    cat = db.add_category("Dev")
+    db.add_connection(name="web", hostname="web.test", username="admin",
+                      encrypted_password="secret", category_id=cat)
+    db.add_connection(name="db", hostname="db.test", port=3390, notes="primary")
+    db.add_connection(name="spare", hostname="spare.test")
+
+
+def backdate(stamp: str = "2020-01-01 00:00:00"):
+    conn = db.get_connection()
+    with conn:
+        conn.execute("UPDATE connections SET updated_at = ?", (stamp,))
+    conn.close()
+
+
+def rows_by_host() -> dict:
+    return {c["hostname"]: c for c in db.get_connections()}
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_reimporting_an_export_adds_no_rows(fresh_db, policy):
+    seed()
+    data = db.export_connections()
+    before = rows_by_host()
+    diff = db.diff_import(db.json_records(data), policy)
+    assert not diff["added"] and not diff["updated"]
+    assert len(diff["unchanged"]) == 3
+    assert db.import_connections(data, policy=policy) == 0
+    assert rows_by_host() == before
+
+
+def test_without_policy_a_reimport_stores_copies(fresh_db):
+    seed()
+    assert db.import_connections(db.export_connections()) == 3
+    rows = db.get_connections()
+    assert len(rows) == 6
+    # The copies are stored without an identity key.
+    assert sum(c["identity_key"] is None for c in rows) == 3
+
+
+def test_newest_updates_only_when_the_record_is_later(fresh_db):
+    seed()
+    backdate()
+    records = [
+        # ISO with a "T" against the stored "YYYY-MM-DD HH:MM:SS".
+        {"name": "web", "hostname": "web.test", "username": "admin",
+         "notes": "later", "modified": "2020-01-01T00:00:01.500000"},
+        {"name": "db", "hostname": "db.test", "port": 3390,
+         "notes": "earlier", "modified": "2019-12-31T23:59:59"},
+    ]
+    assert db.bulk_insert(records, policy="newest") == 1
+    rows = rows_by_host()
+    assert rows["web.test"]["notes"] == "later"
+    assert rows["db.test"]["notes"] == "primary"
+
+
+def test_blank_password_keeps_the_stored_one(fresh_db):
+    seed()
+    record = {"name": "web", "hostname": "web.test", "username": "admin",
+              "encrypted_password": "", "notes": "renamed"}
+    assert db.bulk_insert([record], policy="overwrite") == 1
+    row = rows_by_host()["web.test"]
+    assert row["notes"] == "renamed"
+    assert row["encrypted_password"] == "secret"
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_diff_counts_match_what_bulk_insert_writes(fresh_db, policy):
+    seed()
+    backdate()
+    records = [
+        {"name": "new", "hostname": "new.test"},
+        {"name": "web", "hostname": "web.test", "username": "admin",
+         "notes": "later", "modified": "2021-01-01 00:00:00"},
+        {"name": "db", "hostname": "db.test", "port": 3390,
+         "notes": "earlier", "modified": "2019-01-01 00:00:00"},
+        {"name": "spare", "hostname": "spare.test", "notes": "", "modified": "2021-01-01 00:00:00"},
+    ]
+    diff = db.diff_import([dict(r) for r in records], policy)
+    expected = {"keep": (1, 0, 2), "overwrite": (1, 2, 0), "newest": (1, 1, 1)}[policy]
+    assert (len(diff["added"]), len(diff["updated"]), len(diff["kept"])) == expected
+    assert len(diff["unchanged"]) == 1
+
+    written = db.bulk_insert(records, policy=policy)
+    assert written == len(diff["added"]) + len(diff["updated"])
+    assert len(db.get_connections()) == 3 + len(diff["added"])
+    rows = rows_by_host()
+    for entry in diff["updated"]:
+        host = next(r["hostname"] for r in records if r["name"] == entry["name"])
+        assert rows[host]["notes"] in ("later", "earlier")
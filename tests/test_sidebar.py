@@ -0,0 +1,176 @@
+import importlib
+import sqlite3
+import sys
+import types
+from collections import Counter
+
+import pytest
+
+from core import database as db
+from core.watcher import DatabaseWatcher
+
+# The sidebar keeps a fixed pool of row widgets and rebinds them to model
+# rows, so routine operations must not construct any new widget. The
+# customtkinter classes are replaced with counting fakes so this runs
+# without a display.
+
+created = Counter()
+
+
+class FakeWidget:
+    height = 400
+
+    def __init__(self, *args, **kwargs):
+        created[type(self).__name__] += 1
+
+    def __getattr__(self, name):
+        # pack, place, bind, configure, set, ...: accepted and ignored.
+        return lambda *args, **kwargs: None
+
+    def winfo_height(self):
+        return FakeWidget.height
+
+    def _get_widget_scaling(self):
+        return 1.0
+
+
+def _fake_class(name):
+    return type(name, (FakeWidget,), {})
+
+
+@pytest.fixture
+def sidebar_module(monkeypatch):
+    fake = types.ModuleType("customtkinter")
+    for name in ("CTkFrame", "CTkLabel", "CTkFont", "CTkScrollbar"):
+        setattr(fake, name, _fake_class(name))
+    monkeypatch.setitem(sys.modules, "customtkinter", fake)
+    monkeypatch.setattr("tkinter.Menu", _fake_class("Menu"))
+    monkeypatch.delitem(sys.modules, "ui.sidebar", raising=False)
+    yield importlib.import_module("ui.sidebar")
+    sys.modules.pop("ui.sidebar", None)
+
+
+@pytest.fixture
+def seeded_db(tmp_path):
+    original = db.DB_PATH
+    db.use_database(tmp_path / "connections.db")
+    db.init_db()
+    cats = [db.add_category(f"Site {i}") for i in range(3)]
+    for i in range(60):
+        db.add_connection(name=f"host-{i:02d}", hostname=f"10.0.0.{i}",
+                          category_id=cats[i % 3] if i % 4 else None)
+    yield
+    db.use_database(original)
+
+
+@pytest.fixture
+def sidebar(sidebar_module, seeded_db):
+    dispatcher = types.SimpleNamespace(post=lambda fn, *args, key=None: None)
+    FakeWidget.height = 400
+    bar = sidebar_module.Sidebar(None, dispatcher)
+    bar.refresh(probe=False)
+    bar._on_resize()
+    yield bar
+    bar.shutdown()
+
+
+def _row(bar, kind):
+    return next(r for r in bar._pool if r.key is not None and r.key[0] == kind)
+
+
+def _widgets():
+    return sum(created.values())
+
+
+def test_resize_builds_pool_for_viewport(sidebar, sidebar_module):
+    expected = -(-FakeWidget.height // sidebar_module.ROW_HEIGHT) + 1
+    assert len(sidebar._pool) == expected
+    assert created["CTkLabel"] >= 3 * expected
+
+
+def test_select_creates_no_widgets(sidebar):
+    before = _widgets()
+    sidebar._on_row_click(_row(sidebar, "conn"))
+    sidebar.move_selection(1)
+    assert sidebar.get_selected_id() is not None
+    assert _widgets() == before
+
+
+def test_category_toggle_creates_no_widgets(sidebar):
+    before = _widgets()
+    header = _row(sidebar, "cat")
+    cat_id = header.key[1]
+    sidebar._on_row_click(header)
+    assert sidebar._is_collapsed(cat_id)
+    sidebar._toggle_category(cat_id)
+    assert not sidebar._is_collapsed(cat_id)
+    assert _widgets() == before
+
+
+def test_single_row_edit_creates_no_widgets(sidebar):
+    before = _widgets()
+    conn_id = _row(sidebar, "conn").key[1]
+    db.update_connection(conn_id, name="renamed", hostname="10.9.9.9")
+    sidebar.upsert_connection(db.get_connection_by_id(conn_id))
+    assert sidebar.get_connection(conn_id)["name"] == "renamed"
+    assert _widgets() == before
+
+
+def test_only_growing_the_viewport_creates_widgets(sidebar):
+    size = len(sidebar._pool)
+    before = _widgets()
+    FakeWidget.height = 200
+    sidebar._on_resize()
+    assert _widgets() == before
+    FakeWidget.height = 800
+    sidebar._on_resize()
+    assert len(sidebar._pool) > size
+    assert _widgets() > before
+
+
+def test_tags_are_read_once_per_connection(sidebar, monkeypatch):
+    conn_id = _row(sidebar, "conn").key[1]
+    db.set_connection_tags(conn_id, ["web", "prod"])
+    reads = []
+    get_connection_tags = db.get_connection_tags
+    monkeypatch.setattr(db, "get_connection_tags",
+                        lambda cid: reads.append(cid) or get_connection_tags(cid))
+    assert sidebar.get_tags(conn_id) == ["prod", "web"]
+    assert sidebar.get_tags(conn_id) == ["prod", "web"]
+    assert reads == [conn_id]
+    db.set_connection_tags(conn_id, ["web"])
+    sidebar.update_tags(conn_id, ["web"])
+    assert sidebar.get_tags(conn_id) == ["web"]
+    assert reads == [conn_id, conn_id]
+
+
+def test_external_changes_in_an_unloaded_category(sidebar_module, seeded_db):
+    dispatcher = types.SimpleNamespace(post=lambda fn, *args, key=None: None)
+    bar = sidebar_module.Sidebar(None, dispatcher, collapsed_by_default=True)
+    bar.refresh(probe=False)
+    bar._on_resize()
+    cats = [c["id"] for c in db.get_categories()]
+    bar._toggle_category(cats[0])
+    assert not bar._complete and cats[1] not in bar._groups
+    moved, deleted = [c["id"] for c in db.get_connections(cats[1])[:2]]
+
+    # Another process moves one row out of the unloaded category and
+    # deletes another.
+    watcher = DatabaseWatcher()
+    other = sqlite3.connect(db.get_db_path())
+    with other:
+        other.execute("UPDATE connections SET category_id = ? WHERE id = ?", (cats[0], moved))
+        other.execute("DELETE FROM connections WHERE id = ?", (deleted,))
+    other.close()
+    changes = watcher.poll()
+    watcher.close()
+    bar.apply_changes(changes.connections, changes.deleted)
+
+    assert bar._counts == db.get_category_counts()
+    assert moved in bar._groups[cats[0]]
+    for cid in cats:
+        if bar._is_collapsed(cid):
+            bar._toggle_category(cid)
+    for cid in cats:
+        assert bar._groups[cid] == [c["id"] for c in db.get_connections(cid)]
+    bar.shutdown()
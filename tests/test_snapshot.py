@@ -0,0 +1,43 @@
+import pytest
+
+from core import database as db
+from core import snapshot
+
+
+@pytest.fixture
+def seeded_db(tmp_path):
+    original = db.DB_PATH
+    db.use_database(tmp_path / "connections.db")
+    db.init_db()
+    cat = db.add_category("Dev")
+    for i in range(5):
+        db.add_connection(name=f"host-{i}", hostname=f"10.0.0.{i}", category_id=cat if i % 2 else None)
+    yield db.get_db_path()
+    db.use_database(original)
+
+
+def load(db_path):
+    return snapshot.load(snapshot.path_for(db_path), snapshot.db_stamp(db_path))
+
+
+def test_snapshot_round_trip(seeded_db):
+    assert snapshot.write_current()
+    loaded = load(seeded_db)
+    assert loaded.connections == db.get_connections()
+    assert [c["name"] for c in loaded.categories] == ["Dev"]
+    assert loaded.seq == db.current_seq()
+
+
+def test_write_makes_snapshot_stale(seeded_db):
+    assert snapshot.write_current()
+    db.add_connection(name="late", hostname="10.0.0.99")
+    assert load(seeded_db) is None
+
+
+def test_snapshot_survives_another_start(seeded_db):
+    # Opening the database again, as the next launch does, must not
+    # modify the file, or the snapshot is lost whenever the app did not
+    # get to rewrite it on exit.
+    assert snapshot.write_current()
+    db.init_db()
+    assert load(seeded_db) is not None
@@ -0,0 +1,119 @@
+import pytest
+
+from core import database as db
+
+# Delta sync between two databases: export_connections(since=...) on one,
+# apply_delta on the other. Timestamps have one-second resolution, so the
+# receiving side's rows are backdated where a test needs the incoming edit
+# to be the newer one.
+
+
+@pytest.fixture
+def use(tmp_path):
+    original = db.DB_PATH
+    created = set()
+
+    def use(name: str):
+        db.use_database(tmp_path / f"{name}.db")
+        if name not in created:
+            db.init_db()
+            created.add(name)
+
+    yield use
+    db.use_database(original)
+
+
+def backdate(table: str):
+    conn = db.get_connection()
+    with conn:
+        conn.execute(f"UPDATE {table} SET updated_at = '2000-01-01 00:00:00'")
+    conn.close()
+
+
+def by_uid() -> dict:
+    return {c["uid"]: c for c in db.get_connections()}
+
+
+def test_round_trip_moves_only_changed_rows_and_tombstones(use):
+    use("a")
+    cat = db.add_category("Dev")
+    ids = [db.add_connection(name=f"host-{i}", hostname=f"10.0.0.{i}", category_id=cat)
+           for i in range(3)]
+    full = db.export_connections(since=0)
+    use("b")
+    assert db.apply_delta(full) == 4
+    assert {c["name"] for c in db.get_connections()} == {"host-0", "host-1", "host-2"}
+
+    use("a")
+    uids = {c["id"]: c["uid"] for c in db.get_connections()}
+    db.update_connection(ids[0], notes="edited")
+    db.delete_connection(ids[1])
+    delta = db.export_connections(since=full["seq"])
+    assert delta["delta"]
+    assert [c["uid"] for c in delta["connections"]] == [uids[ids[0]]]
+    assert [t["uid"] for t in delta["tombstones"]] == [uids[ids[1]]]
+    assert delta["categories"] == []
+
+    use("b")
+    backdate("connections")
+    assert db.apply_delta(delta) == 2
+    rows = by_uid()
+    assert rows[uids[ids[0]]]["notes"] == "edited"
+    assert uids[ids[1]] not in rows
+    assert uids[ids[2]] in rows
+    assert db.get_sync_seq(delta["source"]) == delta["seq"]
+
+    use("a")
+    assert db.export_connections(since=delta["seq"])["connections"] == []
+
+
+def test_reimport_after_delete_clears_tombstone(use):
+    use("a")
+    conn_id = db.add_connection(name="web", hostname="web.test")
+    backup = db.export_connections()
+    uid = db.get_connection_by_id(conn_id)["uid"]
+    seq = db.current_seq()
+    db.delete_connection(conn_id)
+    assert [t["uid"] for t in db.export_connections(since=seq)["tombstones"]] == [uid]
+
+    assert db.import_connections(backup) == 1
+    assert uid in by_uid()
+    delta = db.export_connections(since=seq)
+    assert delta["tombstones"] == []
+    assert [c["uid"] for c in delta["connections"]] == [uid]
+
+
+def test_same_category_created_on_both_sides_adopts_incoming_uid(use):
+    use("a")
+    cat = db.add_category("Shared")
+    db.add_connection(name="db", hostname="db.test", category_id=cat)
+    delta = db.export_connections(since=0)
+    use("b")
+    local = db.add_category("Shared")
+    db.apply_delta(delta)
+    categories = db.get_categories()
+    assert [(c["id"], c["uid"]) for c in categories] == [(local, delta["categories"][0]["uid"])]
+    assert db.get_connections()[0]["category_id"] == local
+
+
+def test_rename_onto_another_category_name_keeps_both(use):
+    use("a")
+    dev = db.add_category("Dev")
+    ops = db.add_category("Ops")
+    full = db.export_connections(since=0)
+    use("b")
+    db.apply_delta(full)
+
+    use("a")
+    db.rename_category(dev, "Old")
+    db.rename_category(ops, "Dev")
+    delta = db.export_connections(since=full["seq"])
+    uids = {c["name"]: c["uid"] for c in delta["categories"]}
+
+    use("b")
+    backdate("categories")
+    db.apply_delta(delta)
+    names = {c["uid"]: c["name"] for c in db.get_categories()}
+    assert names[uids["Old"]] == "Old"
+    assert names[uids["Dev"]].startswith("Dev")
+    assert len(set(names.values())) == len(names) == 2
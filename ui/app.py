@@ -1,21 +1,35 @@
-import base64
 import json
 import threading
+from datetime import datetime
 from pathlib import Path
 from tkinter import messagebox
 
 import customtkinter as ctk
 
 from core import database as db
-from core.encryption import generate_salt, DEFAULT_PASSPHRASE
-from core.rdp import connect as rdp_connect
+from core.encryption import DEFAULT_PASSPHRASE
+from core import snapshot, tracing
+from core.profiling import phase
+from core.tags import TagQueryError
+from ui.connector import Connector
+from ui.dispatch import UIDispatcher
 from ui.sidebar import Sidebar
 from ui.details import DetailsPanel
-from ui.dialogs import (
-    ConnectionDialog,
-    CategoryDialog,
-    ImportExportDialog,
-)
+
+# Dialogs, the tray icon (pystray + PIL) and cryptography are imported on
+# first use so none of them sit between launch and the first painted frame.
+
+SEARCH_DEBOUNCE_MS = 150
+TRAY_RECENT_COUNT = 10
+# How often to check whether the startup snapshot needs rewriting.
+SNAPSHOT_INTERVAL_MS = 5000
+CONNECT_STAGES = {
+    "queued": "waiting",
+    "decrypt": "decrypting password",
+    "credentials": "staging credentials",
+    "render": "writing .rdp file",
+    "spawn": "starting Remote Desktop",
+}
 
 CONFIG_PATH = Path(__file__).parent.parent / "config.json"
 ASSETS_PATH = Path(__file__).parent.parent / "assets"
@@ -26,6 +40,17 @@ def load_config() -> dict:
         "clear_credentials_on_close": True,
         "default_port": 3389,
         "default_screen_mode": 2,
+        "collapse_categories_by_default": False,
+        "metrics_textfile": "",
+        "metrics_interval_seconds": 60,
+        "metrics_http_port": 0,
+        "tray_recent_count": TRAY_RECENT_COUNT,
+        "import_conflict_policy": "keep",
+        "database_path": "",
+        # None: WAL for a shared database_path, rollback journal otherwise.
+        "database_wal": None,
+        "watch_interval_ms": 1000,
+        "startup_snapshot": True,
     }
     try:
         with open(CONFIG_PATH, "r") as f:
@@ -37,8 +62,15 @@ def load_config() -> dict:
 
 
 class RDPManagerApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, profile=None, profile_output: str | None = None,
+                 exit_after_first_paint: bool = False, instance=None,
+                 initial_message: dict | None = None):
         super().__init__()
+        self._instance = instance
+        self._initial_message = initial_message
+        self._profile = profile
+        self._profile_output = profile_output
+        self._exit_after_first_paint = exit_after_first_paint
 
         self.title("RDP Manager")
         self.geometry("1100x700")
@@ -55,19 +87,147 @@ class RDPManagerApp(ctk.CTk):
         self.master_password = DEFAULT_PASSPHRASE
         self.encryption_salt = None
         self._tray_icon = None
+        self._tray_version = None
+        self._tray_items = ()
+        self._metrics_stop = None
+        self._watcher = None
+        self._search_job = None
+        self._cat_filter_ids = {}
+        self._snapshot = None
+        self._snapshot_version = None
+
+        self.dispatcher = UIDispatcher(self)
+        self.dispatcher.start()
+        self.connector = Connector(
+            self.dispatcher, on_progress=self._connect_progress, on_done=self._connect_done,
+            on_failed=self._connect_failed, on_cancelled=self._connect_cancelled,
+        )
 
-        db.init_db()
-        self._init_encryption_salt()
-        self._build_ui()
-        self._setup_tray()
+        wal = self.config["database_wal"]
+        if self.config["database_path"] or wal is not None:
+            db.use_database(self.config["database_path"] or db.DB_PATH, wal=wal is not False)
+        if self.config["startup_snapshot"]:
+            with phase(profile, "load_snapshot"):
+                db_path = db.get_db_path()
+                self._snapshot = snapshot.load(snapshot.path_for(db_path), snapshot.db_stamp(db_path))
+        if self._snapshot is None:
+            # No usable snapshot: open the database before the first paint.
+            with phase(profile, "init_db"):
+                db.init_db()
+                self._init_encryption_salt()
+        with phase(profile, "build_ui"):
+            self._build_ui()
+        with phase(profile, "load_connections"):
+            if self._snapshot is not None:
+                self.sidebar.load_snapshot(self._snapshot)
+            else:
+                self.sidebar.refresh(probe=False)
 
-    def _init_encryption_salt(self):
-        salt_b64 = db.get_setting("encryption_salt")
-        if salt_b64:
-            self.encryption_salt = base64.b64decode(salt_b64)
+        if self._instance is not None:
+            # Called on the instance server thread; hop to Tk via the dispatcher.
+            self._instance.set_handler(
+                lambda message: self.dispatcher.post(self._handle_instance_message, message)
+            )
+
+        self.after(0, self._after_first_paint)
+
+    def _after_first_paint(self):
+        self.update_idletasks()
+        if self._profile:
+            self._profile.mark("first_paint")
+        if self._snapshot is not None:
+            # The first frame came from the snapshot; the database is only
+            # opened now.
+            with phase(self._profile, "init_db"):
+                db.init_db()
+                self._init_encryption_salt()
+        # None: no valid snapshot was found, so write one at the first tick.
+        self._snapshot_version = db.data_version() if self._snapshot is not None else None
+        if self.config["startup_snapshot"]:
+            self.after(SNAPSHOT_INTERVAL_MS, self._snapshot_tick)
+
+        with phase(self._profile, "tray"):
+            self._setup_tray()
+        self._start_metrics()
+        self._start_watcher()
+        self._snapshot = None
+        self.sidebar.probe_all()
+        if self._initial_message:
+            self._handle_instance_message(self._initial_message)
+
+        if self._profile:
+            self._profile.mark("startup_complete")
+            self._profile.stop_tracking_imports()
+            path = Path(self._profile_output) if self._profile_output else db.DB_DIR / "startup-profile.json"
+            report = self._profile.write(path)
+            print(f"Startup profile written to {path}")
+            print(f"  first paint: {report['marks']['first_paint']:.1f} ms")
+            for p in report["phases"]:
+                print(f"  {p['name']:<20} {p['duration_ms']:8.1f} ms")
+        if self._exit_after_first_paint:
+            self._quit()
+
+    def _start_metrics(self):
+        # Exporting is opt-in; the registry itself always records.
+        textfile = self.config["metrics_textfile"]
+        port = self.config["metrics_http_port"]
+        if not textfile and not port:
+            return
+        from core import metrics
+
+        if textfile:
+            self._metrics_stop = metrics.start_file_exporter(
+                Path(textfile).expanduser(), self.config["metrics_interval_seconds"],
+            )
+        if port:
+            try:
+                metrics.start_http_server(port)
+            except OSError as e:
+                self._set_status(f"Metrics endpoint unavailable on port {port}: {e}")
+
+    def _start_watcher(self):
+        # Picks up writes from the CLI, scripts and other instances.
+        if self.config["watch_interval_ms"] <= 0:
+            return
+        from core.watcher import DatabaseWatcher
+
+        # Rows loaded from the snapshot are as of its change_seq; anything
+        # written since then is picked up by the first poll.
+        self._watcher = DatabaseWatcher(since=self._snapshot.seq if self._snapshot else None)
+        self.after(self.config["watch_interval_ms"], self._poll_database)
+
+    def _poll_database(self):
+        if self._watcher is None:
+            return
+        changes = self._watcher.poll()
+        if changes:
+            self._apply_external_changes(changes)
+        self.after(self.config["watch_interval_ms"], self._poll_database)
+
+    def _apply_external_changes(self, changes):
+        selected = self.sidebar.get_selected_id()
+        if changes.categories or changes.reload:
+            self._update_cat_filter()
+            self._refresh_all()
         else:
-            self.encryption_salt = generate_salt()
-            db.set_setting("encryption_salt", base64.b64encode(self.encryption_salt).decode())
+            self.sidebar.apply_changes(changes.connections, changes.deleted)
+            self._refresh_tray_menu()
+        if selected is not None:
+            if self.sidebar.get_selected_id() is None:
+                self.details.clear()
+            elif changes.reload or changes.categories or any(
+                    c["id"] == selected for c in changes.connections):
+                self._show_details(selected)
+
+    def _snapshot_tick(self):
+        # Rewrites the startup snapshot on a worker once something changed.
+        if db.data_version() != self._snapshot_version:
+            self._snapshot_version = db.data_version()
+            threading.Thread(target=snapshot.write_current, name="snapshot", daemon=True).start()
+        self.after(SNAPSHOT_INTERVAL_MS, self._snapshot_tick)
+
+    def _init_encryption_salt(self):
+        self.encryption_salt = db.get_encryption_salt()
 
     def _build_ui(self):
         # Top bar
@@ -76,7 +236,7 @@ class RDPManagerApp(ctk.CTk):
         top.pack_propagate(False)
 
         self.search_var = ctk.StringVar()
-        self.search_var.trace_add("write", lambda *a: self._on_search())
+        self.search_var.trace_add("write", lambda *a: self._schedule_search())
         search = ctk.CTkEntry(
             top, placeholder_text="Search connections...",
             textvariable=self.search_var, width=250, height=32,
@@ -87,11 +247,20 @@ class RDPManagerApp(ctk.CTk):
         self._cat_filter_var = ctk.StringVar(value="All Categories")
         self._cat_filter_menu = ctk.CTkOptionMenu(
             top, variable=self._cat_filter_var,
-            values=self._get_cat_filter_values(), height=32, width=180,
+            values=self._get_cat_filter_values(self._snapshot.categories if self._snapshot else None),
+            height=32, width=180,
             command=lambda v: self._on_search(),
         )
         self._cat_filter_menu.pack(side="left", padx=(0, 10), pady=9)
 
+        # Tag filter: env:prod AND role:sql AND NOT site:dr
+        self.tag_filter_var = ctk.StringVar()
+        self.tag_filter_var.trace_add("write", lambda *a: self._schedule_search())
+        ctk.CTkEntry(
+            top, placeholder_text="Tags: env:prod -site:dr",
+            textvariable=self.tag_filter_var, width=200, height=32,
+        ).pack(side="left", padx=(0, 10), pady=9)
+
         ctk.CTkButton(
             top, text="+ Connection", width=130, height=32,
             command=self._add_connection,
@@ -103,6 +272,12 @@ class RDPManagerApp(ctk.CTk):
             command=self._add_category,
         ).pack(side="right", padx=5, pady=9)
 
+        ctk.CTkButton(
+            top, text="+ Smart Folder", width=120, height=32,
+            fg_color=("gray70", "gray35"), hover_color=("gray60", "gray45"),
+            command=self._add_smart_folder,
+        ).pack(side="right", padx=5, pady=9)
+
         # Menu buttons
         menu_frame = ctk.CTkFrame(top, fg_color="transparent")
         menu_frame.pack(side="right", padx=5)
@@ -116,6 +291,11 @@ class RDPManagerApp(ctk.CTk):
             fg_color="transparent", hover_color=("gray75", "gray30"),
             command=lambda: self._import_export("export"),
         ).pack(side="left")
+        ctk.CTkButton(
+            menu_frame, text="Templates", width=80, height=28,
+            fg_color="transparent", hover_color=("gray75", "gray30"),
+            command=self._manage_templates,
+        ).pack(side="left")
 
         # Main area
         main = ctk.CTkFrame(self, fg_color="transparent")
@@ -123,11 +303,17 @@ class RDPManagerApp(ctk.CTk):
 
         self.sidebar = Sidebar(
             main,
+            self.dispatcher,
             on_select=self._on_select,
             on_connect=self._connect,
             on_edit=self._edit_connection,
             on_delete=self._delete_connection,
             on_duplicate=self._duplicate_connection,
+            on_bulk_update=self._bulk_update,
+            on_bulk_delete=self._bulk_delete,
+            on_edit_smart=self._edit_smart_folder,
+            on_delete_smart=self._delete_smart_folder,
+            collapsed_by_default=self.config["collapse_categories_by_default"],
         )
         self.sidebar.pack(side="left", fill="y", padx=(5, 0), pady=5)
 
@@ -150,13 +336,16 @@ class RDPManagerApp(ctk.CTk):
         self.bind("<Control-n>", lambda e: self._add_connection())
         self.bind("<Delete>", lambda e: self._delete_selected())
         self.bind("<Return>", lambda e: self._connect_selected())
+        self.bind("<Escape>", lambda e: self.connector.cancel())
+        self.bind("<Up>", lambda e: self._move_selection(-1))
+        self.bind("<Down>", lambda e: self._move_selection(1))
+        self.bind("<Control-T>", lambda e: self._toggle_trace())
 
         self.protocol("WM_DELETE_WINDOW", self._on_close)
 
-        self.sidebar.refresh()
-
-    def _get_cat_filter_values(self) -> list[str]:
-        cats = db.get_categories()
+    def _get_cat_filter_values(self, categories: list | None = None) -> list[str]:
+        cats = db.get_categories() if categories is None else categories
+        self._cat_filter_ids = {c["name"]: c["id"] for c in cats}
         values = ["All Categories", "Uncategorized"]
         values.extend(c["name"] for c in cats)
         return values
@@ -167,70 +356,151 @@ class RDPManagerApp(ctk.CTk):
             return -1
         if val == "Uncategorized":
             return 0
-        cats = db.get_categories()
-        cat = next((c for c in cats if c["name"] == val), None)
-        return cat["id"] if cat else -1
+        return self._cat_filter_ids.get(val, -1)
+
+    def _schedule_search(self):
+        # Coalesce keystrokes: only the last edit within the debounce window
+        # triggers a search, earlier pending ones are dropped.
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DEBOUNCE_MS, self._on_search)
 
     def _on_search(self):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+            self._search_job = None
         text = self.search_var.get()
         cat_id = self._get_category_filter_id()
-        self.sidebar.refresh(filter_text=text, category_filter=cat_id)
+        try:
+            self.sidebar.set_filter(filter_text=text, category_filter=cat_id,
+                                    tag_filter=self.tag_filter_var.get())
+        except TagQueryError as e:
+            self._set_status(f"Tag filter: {e}")
 
     def _on_select(self, conn_id: int):
-        self.details.show_connection(conn_id)
+        self._show_details(conn_id)
+
+    def _show_details(self, conn_id: int):
+        # The sidebar holds the row and its tags; rows of a category it has
+        # not loaded are read by the details pane.
+        self.details.show_connection(conn_id, self.sidebar.get_connection(conn_id),
+                                     self.sidebar.get_tags(conn_id))
 
     def _connect(self, conn_id: int):
+        # The launch runs on the connector's pool; this only queues it.
         conn = db.get_connection_by_id(conn_id)
         if not conn:
             return
-        self._set_status(f"Connecting to {conn['name']}...")
-        try:
-            rdp_connect(conn, self.master_password, self.encryption_salt)
-            db.update_last_connected(conn_id)
-            self._set_status(f"Launched RDP: {conn['name']}")
-            self.details.show_connection(conn_id)
-        except Exception as e:
-            messagebox.showerror("Connection Error", str(e))
-            self._set_status("Connection failed")
+        job = self.connector.submit(db.resolve_connection(conn), self.master_password,
+                                    self.encryption_salt)
+        if job is None:
+            self._set_status(f"Already connecting to {conn['name']}")
+
+    def _connect_progress(self, conn: dict, stage: str):
+        self._set_status(f"Connecting to {conn['name']}: {CONNECT_STAGES.get(stage, stage)}... "
+                         "(Esc to cancel)")
+
+    def _connect_done(self, conn: dict):
+        row = db.get_connection_by_id(conn["id"])
+        if row:
+            self.sidebar.upsert_connection(row)
+            if self.sidebar.get_selected_id() == conn["id"]:
+                self._show_details(conn["id"])
+        self._refresh_tray_menu()
+        self._set_status(f"Launched RDP: {conn['name']}")
+
+    def _connect_cancelled(self, conn: dict):
+        self._set_status(f"Cancelled connecting to {conn['name']}")
+
+    def _flush_search(self):
+        if self._search_job is not None:
+            self._on_search()
+        self.sidebar.flush_search()
+
+    def _move_selection(self, delta: int):
+        self._flush_search()
+        self.sidebar.move_selection(delta)
 
     def _connect_selected(self):
-        sel = self.sidebar.get_selected_id()
+        self._flush_search()
+        sel = self.sidebar.get_selected_id() or self.sidebar.first_result()
         if sel:
             self._connect(sel)
 
     def _delete_selected(self):
-        sel = self.sidebar.get_selected_id()
-        if sel:
-            self._delete_connection(sel)
+        ids = self.sidebar.get_selected_ids()
+        if len(ids) > 1:
+            self._bulk_delete(ids)
+        elif ids:
+            self._delete_connection(ids[0])
 
     def _add_connection(self):
+        from ui.dialogs import ConnectionDialog
+
         categories = db.get_categories()
         dialog = ConnectionDialog(
             self, self.master_password, self.encryption_salt,
-            categories=categories,
+            categories=categories, templates=db.get_templates(),
         )
         self.wait_window(dialog)
         if dialog.result:
-            db.add_connection(**dialog.result)
-            self._refresh_all()
+            tags = dialog.result.pop("tags", [])
+            new_id = db.add_connection(**dialog.result)
+            if tags:
+                db.set_connection_tags(new_id, tags)
+                self.sidebar.update_tags(new_id, tags)
+            self.sidebar.upsert_connection(db.get_connection_by_id(new_id))
             self._set_status("Connection added")
 
     def _edit_connection(self, conn_id: int):
         conn = db.get_connection_by_id(conn_id)
         if not conn:
             return
+        from ui.dialogs import ConnectionDialog
+
         categories = db.get_categories()
         dialog = ConnectionDialog(
             self, self.master_password, self.encryption_salt,
-            connection=conn, categories=categories,
+            connection=conn, categories=categories, templates=db.get_templates(),
+            dispatcher=self.dispatcher,
         )
         self.wait_window(dialog)
         if dialog.result:
-            db.update_connection(conn_id, **dialog.result)
-            self._refresh_all()
-            self.details.show_connection(conn_id)
+            tags = dialog.result.pop("tags", [])
+            try:
+                db.update_connection(conn_id, expected_version=conn["row_version"], **dialog.result)
+            except db.ConflictError as e:
+                if not self._resolve_conflict(e, dialog.result):
+                    return
+            db.set_connection_tags(conn_id, tags)
+            self.sidebar.update_tags(conn_id, tags)
+            self.sidebar.upsert_connection(db.get_connection_by_id(conn_id))
+            self._show_details(conn_id)
+            self._refresh_tray_menu()
             self._set_status("Connection updated")
 
+    def _resolve_conflict(self, error, result: dict) -> bool:
+        # Someone else saved the connection while the dialog was open.
+        # Returns True once the edit has been written anyway.
+        if error.current is None:
+            messagebox.showerror("Connection Deleted",
+                                 "This connection was deleted by someone else; your changes were not saved.")
+            self.details.clear()
+            self.sidebar.remove_connection(error.conn_id)
+            self._set_status("Edit discarded: connection was deleted")
+            return False
+        if messagebox.askyesno(
+            "Edit Conflict",
+            f"'{error.current['name']}' was changed by someone else while you were editing it.\n\n"
+            "Overwrite their changes with yours?",
+        ):
+            db.update_connection(error.conn_id, **result)
+            return True
+        self.sidebar.upsert_connection(db.get_connection_by_id(error.conn_id))
+        self._show_details(error.conn_id)
+        self._set_status("Edit discarded: kept the other change")
+        return False
+
     def _delete_connection(self, conn_id: int):
         conn = db.get_connection_by_id(conn_id)
         if not conn:
@@ -238,16 +508,38 @@ class RDPManagerApp(ctk.CTk):
         if messagebox.askyesno("Delete Connection", f"Delete '{conn['name']}'?"):
             db.delete_connection(conn_id)
             self.details.clear()
-            self._refresh_all()
+            self.sidebar.remove_connection(conn_id)
+            self._refresh_tray_menu()
             self._set_status("Connection deleted")
 
     def _duplicate_connection(self, conn_id: int):
         new_id = db.duplicate_connection(conn_id)
         if new_id:
-            self._refresh_all()
+            self.sidebar.upsert_connection(db.get_connection_by_id(new_id))
+            self._refresh_tray_menu()
             self._set_status("Connection duplicated")
 
+    def _bulk_update(self, ids: list, fields: dict):
+        count = db.bulk_update(ids, **fields)
+        self.sidebar.apply_changes(db.get_connections_by_ids(ids))
+        selected = self.sidebar.get_selected_id()
+        if selected in ids:
+            self._show_details(selected)
+        self._refresh_tray_menu()
+        self._set_status(f"Updated {count} connections")
+
+    def _bulk_delete(self, ids: list):
+        if not messagebox.askyesno("Delete Connections", f"Delete {len(ids)} connections?"):
+            return
+        count = db.bulk_delete(ids)
+        self.details.clear()
+        self.sidebar.apply_changes([], deleted_ids=ids)
+        self._refresh_tray_menu()
+        self._set_status(f"Deleted {count} connections")
+
     def _add_category(self):
+        from ui.dialogs import CategoryDialog
+
         dialog = CategoryDialog(self)
         self.wait_window(dialog)
         if dialog.result:
@@ -259,17 +551,83 @@ class RDPManagerApp(ctk.CTk):
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
+    def _add_smart_folder(self):
+        from ui.dialogs import SmartFolderDialog
+
+        # Starts from the tag filter in use, the usual way to draft one.
+        dialog = SmartFolderDialog(self, query=self.tag_filter_var.get().strip())
+        self.wait_window(dialog)
+        if dialog.result:
+            name, query = dialog.result
+            try:
+                db.add_smart_folder(name, query)
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self.sidebar.reload_smart_folders()
+            self._set_status(f"Smart folder '{name}' added")
+
+    def _edit_smart_folder(self, folder_id: int):
+        folder = next((f for f in db.get_smart_folders() if f["id"] == folder_id), None)
+        if not folder:
+            return
+        from ui.dialogs import SmartFolderDialog
+
+        dialog = SmartFolderDialog(self, name=folder["name"], query=folder["query"])
+        self.wait_window(dialog)
+        if dialog.result:
+            try:
+                db.update_smart_folder(folder_id, *dialog.result)
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self.sidebar.reload_smart_folders()
+            self._set_status("Smart folder updated")
+
+    def _delete_smart_folder(self, folder_id: int):
+        folder = next((f for f in db.get_smart_folders() if f["id"] == folder_id), None)
+        if folder and messagebox.askyesno("Delete Smart Folder",
+                                          f"Delete smart folder '{folder['name']}'?\n"
+                                          "The connections in it are not affected."):
+            db.delete_smart_folder(folder_id)
+            self.sidebar.reload_smart_folders()
+            self._set_status("Smart folder deleted")
+
+    def _manage_templates(self):
+        from ui.dialogs import TemplatesDialog
+
+        dialog = TemplatesDialog(self)
+        self.wait_window(dialog)
+        if dialog.result:
+            # Deleting a template rewrites the rows that used it.
+            self._refresh_all()
+            selected = self.sidebar.get_selected_id()
+            if selected is not None:
+                self._show_details(selected)
+            self._set_status("Templates updated")
+
     def _import_export(self, mode: str):
-        dialog = ImportExportDialog(self, mode=mode)
+        from ui.dialogs import ImportExportDialog
+
+        dialog = ImportExportDialog(self, mode=mode, dispatcher=self.dispatcher,
+                                    policy=self.config["import_conflict_policy"])
         self.wait_window(dialog)
         if dialog.result:
             self._refresh_all()
             self._update_cat_filter()
 
     def _refresh_all(self):
+        if self._watcher is not None:
+            # The reload below already includes whatever it would report.
+            self._watcher.catch_up()
         text = self.search_var.get()
         cat_id = self._get_category_filter_id()
-        self.sidebar.refresh(filter_text=text, category_filter=cat_id)
+        try:
+            self.sidebar.refresh(filter_text=text, category_filter=cat_id,
+                                 tag_filter=self.tag_filter_var.get())
+        except TagQueryError:
+            self.sidebar.refresh(filter_text=text, category_filter=cat_id)
+        self._refresh_tray_menu()
 
     def _update_cat_filter(self):
         self._cat_filter_menu.configure(values=self._get_cat_filter_values())
@@ -293,12 +651,17 @@ class RDPManagerApp(ctk.CTk):
 
             def on_quit(icon, item):
                 icon.stop()
-                self.after(0, self.destroy)
+                self.after(0, self._quit)
 
-            menu = pystray.Menu(
+            self._tray_fixed = (
+                pystray.Menu.SEPARATOR,
                 pystray.MenuItem("Show", on_show, default=True),
                 pystray.MenuItem("Quit", on_quit),
             )
+            self._rebuild_tray_items()
+            # pystray calls the lambda whenever it (re)draws the menu; it
+            # only ever gets the cached tuple.
+            menu = pystray.Menu(lambda: self._tray_items)
             self._tray_icon = pystray.Icon("RDPManager", img, "RDP Manager", menu)
 
             t = threading.Thread(target=self._tray_icon.run, daemon=True)
@@ -306,6 +669,71 @@ class RDPManagerApp(ctk.CTk):
         except ImportError:
             pass
 
+    def _rebuild_tray_items(self):
+        import pystray
+        from core.fuzzy import frecency
+
+        self._tray_version = db.data_version()
+        now = datetime.now()
+        ranked = sorted(
+            db.get_recent_connections(),
+            key=lambda c: frecency(c["last_connected"], c["connect_count"], now),
+            reverse=True,
+        )[:self.config["tray_recent_count"]]
+
+        groups = {}
+        for conn in ranked:
+            groups.setdefault(conn["category_id"], []).append(conn)
+        names = db.get_category_names()
+
+        def launcher(conn_id):
+            # pystray rejects actions taking more than (icon, item).
+            return lambda icon, item: self._tray_launch(conn_id)
+
+        items = []
+        for cid, conns in sorted(groups.items(), key=lambda kv: (kv[0] is None, names.get(kv[0], ""))):
+            if items:
+                items.append(pystray.Menu.SEPARATOR)
+            items.append(pystray.MenuItem(names.get(cid, "Uncategorized"), None, enabled=False))
+            for conn in conns:
+                items.append(pystray.MenuItem(f"  {conn['name']}", launcher(conn["id"])))
+        self._tray_items = tuple(items) + (self._tray_fixed if items else self._tray_fixed[1:])
+
+    def _refresh_tray_menu(self):
+        # Cheap enough to call after every write: the menu is only rebuilt
+        # when the database has changed since the last build.
+        if self._tray_icon is None or db.data_version() == self._tray_version:
+            return
+        self._rebuild_tray_items()
+        self._tray_icon.update_menu()
+
+    def _tray_launch(self, conn_id: int):
+        # Runs on the tray thread; the window is left hidden.
+        self.dispatcher.post(self._connect, conn_id)
+
+    def _connect_failed(self, conn: dict, error: str):
+        messagebox.showerror("Connection Error", f"{conn['name']}: {error}")
+        self._set_status("Connection failed")
+
+    def _handle_instance_message(self, message: dict):
+        # A later launch forwarded its command line to this instance.
+        if message.get("command") != "connect":
+            self._restore_from_tray()
+            return
+        target = str(message.get("target", ""))
+        if target.isdigit() and db.get_connection_by_id(int(target)):
+            matches = [{"id": int(target)}]
+        else:
+            matches = db.find_connections(target)
+        if len(matches) == 1:
+            self._connect(matches[0]["id"])
+            return
+        # Nothing or several matched: show the window with the search filled in.
+        self._restore_from_tray()
+        self.search_var.set(target)
+        found = "No connection" if not matches else f"{len(matches)} connections"
+        self._set_status(f"{found} matching '{target}'")
+
     def _restore_from_tray(self):
         self.deiconify()
         self.lift()
@@ -315,4 +743,38 @@ class RDPManagerApp(ctk.CTk):
         if self._tray_icon:
             self.withdraw()
         else:
-            self.destroy()
+            self._quit()
+
+    def _toggle_trace(self):
+        # First press starts recording; later presses write what the ring
+        # holds so far and keep recording.
+        if not tracing.is_enabled():
+            tracing.enable()
+            self._set_status("Tracing started - press Ctrl+Shift+T again to save the trace")
+            return
+        path = tracing.default_trace_path(db.DB_DIR)
+        count = tracing.dump(path)
+        self._set_status(f"Wrote {count} trace events to {path}")
+
+    def _quit(self):
+        if self._metrics_stop is not None:
+            from core import metrics
+            self._metrics_stop.set()
+            metrics.write_textfile(Path(self.config["metrics_textfile"]).expanduser())
+        if tracing.is_enabled() and tracing.snapshot():
+            path = tracing.default_trace_path(db.DB_DIR)
+            tracing.dump(path)
+            print(f"Trace written to {path}")
+        self.dispatcher.stop()
+        self.connector.shutdown()
+        self.sidebar.shutdown()
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+        if self.config["startup_snapshot"]:
+            # Last, once nothing else holds the database open, so the
+            # stamp matches the files the next launch will find.
+            snapshot.write_current()
+        if self._instance is not None:
+            self._instance.close()
+        self.destroy()
@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core import database as db
+from core import rdp
+
+CONNECT_WORKERS = 4
+
+
+class ConnectJob:
+    def __init__(self, connection: dict):
+        self.connection = connection
+        self.stage = "queued"
+        self.cancelled = threading.Event()
+        self.future = None
+
+
+class Connector:
+    # Runs launches on a small worker pool so key derivation, cmdkey and
+    # spawning mstsc never hold up the Tk thread. The callbacks are posted
+    # through the dispatcher and so run on the Tk thread:
+    #
+    #   on_progress(connection, stage)   "queued", then each rdp.connect stage
+    #   on_done(connection)
+    #   on_failed(connection, message)
+    #   on_cancelled(connection)
+
+    def __init__(self, dispatcher, on_progress=None, on_done=None, on_failed=None,
+                 on_cancelled=None, workers: int = CONNECT_WORKERS):
+        self._dispatcher = dispatcher
+        self._callbacks = {
+            "progress": on_progress, "done": on_done,
+            "failed": on_failed, "cancelled": on_cancelled,
+        }
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="connect")
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def _post(self, event: str, *args, key=None):
+        fn = self._callbacks[event]
+        if fn is not None:
+            self._dispatcher.post(fn, *args, key=key)
+
+    def submit(self, connection: dict, master_password: str, encryption_salt: bytes) -> ConnectJob | None:
+        # connection is already resolved (db.resolve_connection). Returns
+        # None when that connection is still being launched.
+        with self._lock:
+            if connection["id"] in self._jobs:
+                return None
+            job = ConnectJob(connection)
+            self._jobs[connection["id"]] = job
+        self._progress(job, "queued")
+        job.future = self._pool.submit(self._run, job, master_password, encryption_salt)
+        return job
+
+    def _progress(self, job: ConnectJob, stage: str):
+        job.stage = stage
+        # Only the latest stage of a launch is worth painting.
+        self._post("progress", job.connection, stage, key=("connect", job.connection["id"]))
+
+    def _run(self, job: ConnectJob, master_password: str, encryption_salt: bytes):
+        try:
+            rdp.connect(job.connection, master_password, encryption_salt,
+                        progress=lambda stage: self._progress(job, stage), cancel=job.cancelled)
+            db.update_last_connected(job.connection["id"])
+        except rdp.LaunchCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            self._finish(job, "failed", str(e))
+        else:
+            self._finish(job, "done")
+
+    def _finish(self, job: ConnectJob, event: str, *args):
+        with self._lock:
+            self._jobs.pop(job.connection["id"], None)
+        self._post(event, job.connection, *args)
+
+    def cancel(self, conn_id: int | None = None) -> bool:
+        # Cancels the launch of conn_id, or the most recent one. A queued
+        # job never starts; a running one stops at its next stage.
+        with self._lock:
+            if conn_id is None and self._jobs:
+                conn_id = next(reversed(self._jobs))
+            job = self._jobs.get(conn_id)
+        if job is None:
+            return False
+        job.cancelled.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, "cancelled")
+        return True
+
+    def active(self) -> list[ConnectJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self):
+        for job in self.active():
+            job.cancelled.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,6 +1,10 @@
 import customtkinter as ctk
 
 from core import database as db
+from core.tracing import traced
+
+INFO_FIELDS = ["Username", "Port", "Password", "Category", "Tags", "Last Connected"]
+RDP_FIELDS = ["Template", "Screen Mode", "Resolution", "Color Depth", "Clipboard", "Printers", "Drives"]
 
 
 class DetailsPanel(ctk.CTkFrame):
@@ -10,155 +14,205 @@ class DetailsPanel(ctk.CTkFrame):
         self.on_edit = on_edit
         self.on_delete = on_delete
         self._conn_id = None
+        self._details_visible = False
 
+        # Both views are built once; selecting a connection only rewrites
+        # label text and toggles the optional rows.
         self._build_empty()
+        self._build_details()
+        self._show_empty()
 
     def _build_empty(self):
-        for w in self.winfo_children():
-            w.destroy()
-
-        placeholder = ctk.CTkFrame(self, fg_color="transparent")
-        placeholder.place(relx=0.5, rely=0.5, anchor="center")
+        self._placeholder = ctk.CTkFrame(self, fg_color="transparent")
         ctk.CTkLabel(
-            placeholder, text="No connection selected",
+            self._placeholder, text="No connection selected",
             font=ctk.CTkFont(size=16), text_color="gray",
         ).pack()
         ctk.CTkLabel(
-            placeholder, text="Select a connection from the sidebar\nor add a new one.",
+            self._placeholder, text="Select a connection from the sidebar\nor add a new one.",
             font=ctk.CTkFont(size=12), text_color="gray",
         ).pack(pady=(5, 0))
 
-    def show_connection(self, conn_id: int):
-        conn = db.get_connection_by_id(conn_id)
-        if not conn:
-            self._build_empty()
-            return
-
-        self._conn_id = conn_id
-
-        for w in self.winfo_children():
-            w.destroy()
+    def _build_details(self):
+        label_font = ctk.CTkFont(size=12)
+        section_font = ctk.CTkFont(size=14, weight="bold")
 
-        scroll = ctk.CTkScrollableFrame(self, fg_color="transparent")
-        scroll.pack(fill="both", expand=True, padx=20, pady=15)
+        self._scroll = ctk.CTkScrollableFrame(self, fg_color="transparent")
 
         # Header
-        header = ctk.CTkFrame(scroll, fg_color="transparent")
+        header = ctk.CTkFrame(self._scroll, fg_color="transparent")
         header.pack(fill="x", pady=(0, 15))
 
-        ctk.CTkLabel(
-            header, text=conn["name"],
-            font=ctk.CTkFont(size=22, weight="bold"), anchor="w",
-        ).pack(fill="x")
+        self._name_label = ctk.CTkLabel(
+            header, text="", font=ctk.CTkFont(size=22, weight="bold"), anchor="w",
+        )
+        self._name_label.pack(fill="x")
 
-        ctk.CTkLabel(
-            header, text=f"{conn['hostname']}:{conn.get('port', 3389)}",
-            font=ctk.CTkFont(size=14), text_color="gray", anchor="w",
-        ).pack(fill="x")
+        self._address_label = ctk.CTkLabel(
+            header, text="", font=ctk.CTkFont(size=14), text_color="gray", anchor="w",
+        )
+        self._address_label.pack(fill="x")
 
         # Connect button
-        connect_btn = ctk.CTkButton(
-            scroll, text="Connect", height=45,
+        ctk.CTkButton(
+            self._scroll, text="Connect", height=45,
             font=ctk.CTkFont(size=16, weight="bold"),
             fg_color="#0078d4", hover_color="#106ebe",
-            command=lambda: self._do_connect(conn_id),
-        )
-        connect_btn.pack(fill="x", pady=(0, 20))
+            command=lambda: self._do_connect(self._conn_id),
+        ).pack(fill="x", pady=(0, 20))
 
         # Info section
-        info_frame = ctk.CTkFrame(scroll, fg_color=("gray88", "gray20"), corner_radius=8)
+        info_frame = ctk.CTkFrame(self._scroll, fg_color=("gray88", "gray20"), corner_radius=8)
         info_frame.pack(fill="x", pady=(0, 10))
-
-        fields = [
-            ("Username", conn.get("username") or "(not set)"),
-            ("Port", str(conn.get("port", 3389))),
-            ("Password", "********" if conn.get("encrypted_password") else "(not set)"),
-        ]
-
-        cat_name = "(None)"
-        if conn.get("category_id"):
-            cats = db.get_categories()
-            cat = next((c for c in cats if c["id"] == conn["category_id"]), None)
-            if cat:
-                cat_name = cat["name"]
-        fields.append(("Category", cat_name))
-
-        if conn.get("last_connected"):
-            fields.append(("Last Connected", conn["last_connected"][:19].replace("T", " ")))
-
-        for i, (label, value) in enumerate(fields):
-            row = ctk.CTkFrame(info_frame, fg_color="transparent")
-            row.pack(fill="x", padx=15, pady=6)
-            ctk.CTkLabel(row, text=label, width=130, anchor="w",
-                         font=ctk.CTkFont(size=12), text_color="gray").pack(side="left")
-            ctk.CTkLabel(row, text=value, anchor="w",
-                         font=ctk.CTkFont(size=12)).pack(side="left", fill="x", expand=True)
+        self._info_rows = {}
+        self._values = {}
+        for label in INFO_FIELDS:
+            self._info_rows[label] = self._build_field(info_frame, label, label_font, pady=6)
 
         # RDP Settings section
-        ctk.CTkLabel(scroll, text="RDP Settings", font=ctk.CTkFont(size=14, weight="bold"), anchor="w").pack(
+        ctk.CTkLabel(self._scroll, text="RDP Settings", font=section_font, anchor="w").pack(
             fill="x", pady=(10, 5)
         )
-
-        rdp_frame = ctk.CTkFrame(scroll, fg_color=("gray88", "gray20"), corner_radius=8)
+        rdp_frame = ctk.CTkFrame(self._scroll, fg_color=("gray88", "gray20"), corner_radius=8)
         rdp_frame.pack(fill="x", pady=(0, 10))
-
-        screen_mode = "Fullscreen" if conn.get("screen_mode", 2) == 2 else "Windowed"
-        rdp_fields = [
-            ("Screen Mode", screen_mode),
-            ("Resolution", f"{conn.get('desktop_width', 1920)}x{conn.get('desktop_height', 1080)}"),
-            ("Color Depth", f"{conn.get('color_depth', 32)}-bit"),
-            ("Clipboard", "Yes" if conn.get("redirect_clipboard") else "No"),
-            ("Printers", "Yes" if conn.get("redirect_printers") else "No"),
-            ("Drives", "Yes" if conn.get("redirect_drives") else "No"),
-        ]
-
-        for label, value in rdp_fields:
-            row = ctk.CTkFrame(rdp_frame, fg_color="transparent")
-            row.pack(fill="x", padx=15, pady=4)
-            ctk.CTkLabel(row, text=label, width=130, anchor="w",
-                         font=ctk.CTkFont(size=12), text_color="gray").pack(side="left")
-            ctk.CTkLabel(row, text=value, anchor="w",
-                         font=ctk.CTkFont(size=12)).pack(side="left", fill="x", expand=True)
+        for label in RDP_FIELDS:
+            self._build_field(rdp_frame, label, label_font, pady=4)
 
         # Notes
-        notes = conn.get("notes", "").strip()
-        if notes:
-            ctk.CTkLabel(scroll, text="Notes", font=ctk.CTkFont(size=14, weight="bold"), anchor="w").pack(
-                fill="x", pady=(10, 5)
-            )
-            notes_frame = ctk.CTkFrame(scroll, fg_color=("gray88", "gray20"), corner_radius=8)
-            notes_frame.pack(fill="x", pady=(0, 10))
-            ctk.CTkLabel(notes_frame, text=notes, anchor="nw", justify="left",
-                         wraplength=400).pack(fill="x", padx=15, pady=10)
+        self._notes_section = ctk.CTkFrame(self._scroll, fg_color="transparent")
+        ctk.CTkLabel(self._notes_section, text="Notes", font=section_font, anchor="w").pack(
+            fill="x", pady=(10, 5)
+        )
+        notes_frame = ctk.CTkFrame(self._notes_section, fg_color=("gray88", "gray20"), corner_radius=8)
+        notes_frame.pack(fill="x", pady=(0, 10))
+        self._notes_label = ctk.CTkLabel(notes_frame, text="", anchor="nw", justify="left",
+                                         wraplength=400)
+        self._notes_label.pack(fill="x", padx=15, pady=10)
 
         # Action buttons
-        btn_frame = ctk.CTkFrame(scroll, fg_color="transparent")
-        btn_frame.pack(fill="x", pady=(10, 0))
+        self._btn_frame = ctk.CTkFrame(self._scroll, fg_color="transparent")
+        self._btn_frame.pack(fill="x", pady=(10, 0))
 
         ctk.CTkButton(
-            btn_frame, text="Edit", width=100, fg_color=("gray70", "gray35"),
+            self._btn_frame, text="Edit", width=100, fg_color=("gray70", "gray35"),
             hover_color=("gray60", "gray45"),
-            command=lambda: self._do_edit(conn_id),
+            command=lambda: self._do_edit(self._conn_id),
         ).pack(side="left", padx=(0, 10))
 
         ctk.CTkButton(
-            btn_frame, text="Delete", width=100,
+            self._btn_frame, text="Delete", width=100,
             fg_color="#dc2626", hover_color="#b91c1c",
-            command=lambda: self._do_delete(conn_id),
+            command=lambda: self._do_delete(self._conn_id),
         ).pack(side="left")
 
+    def _build_field(self, parent, label: str, font, pady: int):
+        row = ctk.CTkFrame(parent, fg_color="transparent")
+        row.pack(fill="x", padx=15, pady=pady)
+        ctk.CTkLabel(row, text=label, width=130, anchor="w",
+                     font=font, text_color="gray").pack(side="left")
+        value = ctk.CTkLabel(row, text="", anchor="w", font=font)
+        value.pack(side="left", fill="x", expand=True)
+        self._values[label] = value
+        return row
+
+    def _show_empty(self):
+        self._scroll.pack_forget()
+        self._placeholder.place(relx=0.5, rely=0.5, anchor="center")
+        self._details_visible = False
+
+    def _show_details(self):
+        if not self._details_visible:
+            self._placeholder.place_forget()
+            self._scroll.pack(fill="both", expand=True, padx=20, pady=15)
+            self._details_visible = True
+
+    def _set(self, label: str, value: str):
+        widget = self._values[label]
+        if widget.cget("text") != value:
+            widget.configure(text=value)
+
+    @traced(cat="ui")
+    def show_connection(self, conn_id: int, conn: dict | None = None, tags: list | None = None):
+        # conn and tags, when the caller has them (the sidebar does), save
+        # reading them from the database on every selection.
+        if conn is None:
+            conn = db.get_connection_by_id(conn_id)
+        if not conn:
+            self.clear()
+            return
+
+        self._conn_id = conn_id
+
+        self._name_label.configure(text=conn["name"])
+        self._address_label.configure(text=f"{conn['hostname']}:{conn.get('port', 3389)}")
+
+        self._set("Username", conn.get("username") or "(not set)")
+        self._set("Port", str(conn.get("port", 3389)))
+        self._set("Password", "********" if conn.get("encrypted_password") else "(not set)")
+
+        cat_name = "(None)"
+        if conn.get("category_id"):
+            cat_name = db.get_category_names().get(conn["category_id"], cat_name)
+        self._set("Category", cat_name)
+        if tags is None:
+            tags = db.get_connection_tags(conn_id)
+        self._set("Tags", ", ".join(tags) or "(none)")
+
+        last_row = self._info_rows["Last Connected"]
+        if conn.get("last_connected"):
+            self._set("Last Connected", conn["last_connected"][:19].replace("T", " "))
+            if not last_row.winfo_manager():
+                last_row.pack(fill="x", padx=15, pady=6)
+        else:
+            last_row.pack_forget()
+
+        # Settings the connection leaves unset come from its template chain.
+        tree = db.template_tree()
+        template = tree.get(conn.get("template_id"))
+        category_template = tree.get(tree.category_template(conn.get("category_id")))
+        if template:
+            self._set("Template", template["name"])
+        elif category_template:
+            self._set("Template", f"{category_template['name']} (from category)")
+        else:
+            self._set("Template", "(none)")
+        settings = tree.effective(conn)
+
+        def shown(text: str, *fields) -> str:
+            inherited = (template or category_template) and any(conn.get(f) is None for f in fields)
+            return f"{text}  (inherited)" if inherited else text
+
+        self._set("Screen Mode", shown("Fullscreen" if settings["screen_mode"] == 2 else "Windowed",
+                                       "screen_mode"))
+        self._set("Resolution", shown(f"{settings['desktop_width']}x{settings['desktop_height']}",
+                                      "desktop_width", "desktop_height"))
+        self._set("Color Depth", shown(f"{settings['color_depth']}-bit", "color_depth"))
+        self._set("Clipboard", shown("Yes" if settings["redirect_clipboard"] else "No", "redirect_clipboard"))
+        self._set("Printers", shown("Yes" if settings["redirect_printers"] else "No", "redirect_printers"))
+        self._set("Drives", shown("Yes" if settings["redirect_drives"] else "No", "redirect_drives"))
+
+        notes = (conn.get("notes") or "").strip()
+        if notes:
+            self._notes_label.configure(text=notes)
+            if not self._notes_section.winfo_manager():
+                self._notes_section.pack(fill="x", before=self._btn_frame)
+        else:
+            self._notes_section.pack_forget()
+
+        self._show_details()
+
     def _do_connect(self, conn_id: int):
-        if self.on_connect:
+        if self.on_connect and conn_id is not None:
             self.on_connect(conn_id)
 
     def _do_edit(self, conn_id: int):
-        if self.on_edit:
+        if self.on_edit and conn_id is not None:
             self.on_edit(conn_id)
 
     def _do_delete(self, conn_id: int):
-        if self.on_delete:
+        if self.on_delete and conn_id is not None:
             self.on_delete(conn_id)
 
     def clear(self):
         self._conn_id = None
-        self._build_empty()
+        self._show_empty()
@@ -1,20 +1,31 @@
 import json
+import threading
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 
 from core.encryption import encrypt_password, decrypt_password
 from core import database as db
+from core.smart import compile_folder
+from core.tags import TagQueryError, normalize_tags
+from core.templates import SETTINGS
 
 
 class ConnectionDialog(ctk.CTkToplevel):
     def __init__(self, parent, master_password: str, encryption_salt: bytes,
-                 connection: dict = None, categories: list = None):
+                 connection: dict = None, categories: list = None, templates: list = None,
+                 dispatcher=None):
         super().__init__(parent)
         self.result = None
         self.master_password = master_password
         self.encryption_salt = encryption_salt
         self.connection = connection
+        self.dispatcher = dispatcher
+        # The saved password is only decrypted when Show is pressed; None
+        # until then.
+        self._plain_password = None
+        self._stored_password = (connection or {}).get("encrypted_password") or ""
         self.categories = categories or []
+        self.templates = templates or []
 
         is_edit = connection is not None
         self.title("Edit Connection" if is_edit else "Add Connection")
@@ -49,7 +60,8 @@ class ConnectionDialog(ctk.CTkToplevel):
         ctk.CTkLabel(right, text="Category", anchor="w").pack(fill="x")
         cat_names = ["(None)"] + [c["name"] for c in self.categories]
         self.category_var = ctk.StringVar(value="(None)")
-        self.category_menu = ctk.CTkOptionMenu(right, values=cat_names, variable=self.category_var, height=32)
+        self.category_menu = ctk.CTkOptionMenu(right, values=cat_names, variable=self.category_var, height=32,
+                                               command=lambda v: self._on_inheritance_change())
         self.category_menu.pack(fill="x")
 
         ctk.CTkLabel(scroll, text="Username", anchor="w").pack(fill="x")
@@ -59,7 +71,10 @@ class ConnectionDialog(ctk.CTkToplevel):
         ctk.CTkLabel(scroll, text="Password", anchor="w").pack(fill="x")
         pass_row = ctk.CTkFrame(scroll, fg_color="transparent")
         pass_row.pack(fill="x", pady=(0, 8))
-        self.pass_entry = ctk.CTkEntry(pass_row, show="*", height=32)
+        self.pass_entry = ctk.CTkEntry(
+            pass_row, show="*", height=32,
+            placeholder_text="Saved - press Show to reveal" if self._stored_password else None,
+        )
         self.pass_entry.pack(side="left", fill="x", expand=True)
         self._pass_visible = False
         self._pass_toggle = ctk.CTkButton(
@@ -69,11 +84,24 @@ class ConnectionDialog(ctk.CTkToplevel):
         )
         self._pass_toggle.pack(side="left", padx=(5, 0))
 
+        ctk.CTkLabel(scroll, text="Tags", anchor="w").pack(fill="x")
+        self.tags_entry = ctk.CTkEntry(scroll, height=32, placeholder_text="env:prod, role:sql, site:hq")
+        self.tags_entry.pack(fill="x", pady=(0, 8))
+
         # RDP Settings
         ctk.CTkLabel(scroll, text="RDP Settings", font=ctk.CTkFont(weight="bold")).pack(
             fill="x", pady=(10, 5)
         )
 
+        # Settings left as the template (or category template) has them are
+        # saved as inherited; only the ones changed here become overrides.
+        ctk.CTkLabel(scroll, text="Template", anchor="w").pack(fill="x")
+        self.template_var = ctk.StringVar(value="(None)")
+        ctk.CTkOptionMenu(
+            scroll, values=["(None)"] + [t["name"] for t in self.templates],
+            variable=self.template_var, height=32, command=lambda v: self._on_inheritance_change(),
+        ).pack(fill="x", pady=(0, 8))
+
         row2 = ctk.CTkFrame(scroll, fg_color="transparent")
         row2.pack(fill="x", pady=(0, 8))
 
@@ -132,8 +160,14 @@ class ConnectionDialog(ctk.CTkToplevel):
 
         if is_edit:
             self._populate(connection)
+        else:
+            self._inherited = db.inherited_settings(None, None)
+            self._show_settings(self._inherited)
 
     def _toggle_conn_password(self):
+        if not self._pass_visible and self._stored_password and self._plain_password is None:
+            self._reveal_password()
+            return
         self._pass_visible = not self._pass_visible
         self.pass_entry.configure(show="" if self._pass_visible else "*")
         self._pass_toggle.configure(text="Hide" if self._pass_visible else "Show")
@@ -144,31 +178,97 @@ class ConnectionDialog(ctk.CTkToplevel):
         self.port_entry.delete(0, "end")
         self.port_entry.insert(0, str(c.get("port", 3389)))
         self.user_entry.insert(0, c.get("username", ""))
-
-        if c.get("encrypted_password"):
-            try:
-                plain = decrypt_password(c["encrypted_password"], self.master_password, self.encryption_salt)
-                self.pass_entry.insert(0, plain)
-            except Exception:
-                pass
+        tags = db.get_connection_tags(c["id"])
+        if tags:
+            self.tags_entry.insert(0, ", ".join(tags))
 
         cat_id = c.get("category_id")
         if cat_id:
             cat = next((cat for cat in self.categories if cat["id"] == cat_id), None)
             if cat:
                 self.category_var.set(cat["name"])
+        template = next((t for t in self.templates if t["id"] == c.get("template_id")), None)
+        if template:
+            self.template_var.set(template["name"])
 
-        self.screen_mode_var.set("Fullscreen" if c.get("screen_mode", 2) == 2 else "Windowed")
-        self.color_depth_var.set(str(c.get("color_depth", 32)))
-        self.width_entry.delete(0, "end")
-        self.width_entry.insert(0, str(c.get("desktop_width", 1920)))
-        self.height_entry.delete(0, "end")
-        self.height_entry.insert(0, str(c.get("desktop_height", 1080)))
-        self.clipboard_var.set(bool(c.get("redirect_clipboard", 1)))
-        self.printers_var.set(bool(c.get("redirect_printers", 0)))
-        self.drives_var.set(bool(c.get("redirect_drives", 0)))
+        self._inherited = db.inherited_settings(*self._selected_ids())
+        self._show_settings(db.effective_settings(c))
         self.notes_text.insert("1.0", c.get("notes", ""))
 
+    def _reveal_password(self):
+        # Key derivation takes a noticeable fraction of a second, so it
+        # runs on a worker when there is a dispatcher to come back through.
+        self._pass_toggle.configure(text="...", state="disabled")
+
+        def decrypt():
+            try:
+                return decrypt_password(self._stored_password, self.master_password, self.encryption_salt)
+            except Exception:
+                return None
+
+        if self.dispatcher is None:
+            self._password_decrypted(decrypt())
+            return
+        threading.Thread(target=lambda: self.dispatcher.post(self._password_decrypted, decrypt()),
+                         name="reveal-password", daemon=True).start()
+
+    def _password_decrypted(self, plain: str | None):
+        if not self.winfo_exists():
+            return
+        self._pass_toggle.configure(text="Show", state="normal")
+        if plain is None:
+            messagebox.showwarning("Password", "The saved password could not be decrypted.", parent=self)
+            return
+        self._plain_password = plain
+        # Anything typed while decrypting wins over the saved value.
+        if not self.pass_entry.get():
+            self.pass_entry.insert(0, plain)
+        self._toggle_conn_password()
+
+    def _selected_ids(self) -> tuple:
+        # (template_id, category_id) as chosen in the menus.
+        template = next((t for t in self.templates if t["name"] == self.template_var.get()), None)
+        cat = next((c for c in self.categories if c["name"] == self.category_var.get()), None)
+        return (template["id"] if template else None, cat["id"] if cat else None)
+
+    def _show_settings(self, settings: dict):
+        self.screen_mode_var.set("Fullscreen" if settings["screen_mode"] == 2 else "Windowed")
+        self.color_depth_var.set(str(settings["color_depth"]))
+        for entry, field in ((self.width_entry, "desktop_width"), (self.height_entry, "desktop_height")):
+            if settings[field] is not None:
+                entry.delete(0, "end")
+                entry.insert(0, str(settings[field]))
+        self.clipboard_var.set(bool(settings["redirect_clipboard"]))
+        self.printers_var.set(bool(settings["redirect_printers"]))
+        self.drives_var.set(bool(settings["redirect_drives"]))
+
+    def _read_settings(self) -> dict:
+        # Width and height are None when they are not numbers.
+        def number(entry):
+            try:
+                return int(entry.get())
+            except ValueError:
+                return None
+
+        return {
+            "screen_mode": 2 if self.screen_mode_var.get() == "Fullscreen" else 1,
+            "desktop_width": number(self.width_entry),
+            "desktop_height": number(self.height_entry),
+            "color_depth": int(self.color_depth_var.get()),
+            "redirect_clipboard": int(self.clipboard_var.get()),
+            "redirect_printers": int(self.printers_var.get()),
+            "redirect_drives": int(self.drives_var.get()),
+        }
+
+    def _on_inheritance_change(self):
+        # Fields still showing the inherited value follow the new template
+        # or category; fields the user changed keep their value.
+        inherited = db.inherited_settings(*self._selected_ids())
+        current = self._read_settings()
+        self._show_settings({f: inherited[f] if current[f] == self._inherited[f] else current[f]
+                             for f in SETTINGS})
+        self._inherited = inherited
+
     def _on_save(self):
         name = self.name_entry.get().strip()
         hostname = self.host_entry.get().strip()
@@ -183,16 +283,21 @@ class ConnectionDialog(ctk.CTkToplevel):
             return
 
         password = self.pass_entry.get()
-        enc_pass = ""
-        if password:
+        if password == (self._plain_password or "") and (password or self._plain_password is None):
+            # Unchanged, or never revealed and left empty: keep the stored
+            # ciphertext instead of deriving the key again.
+            enc_pass = self._stored_password
+        elif password:
             enc_pass = encrypt_password(password, self.master_password, self.encryption_salt)
+        else:
+            enc_pass = ""
 
-        cat_name = self.category_var.get()
-        cat_id = None
-        if cat_name != "(None)":
-            cat = next((c for c in self.categories if c["name"] == cat_name), None)
-            if cat:
-                cat_id = cat["id"]
+        settings = self._read_settings()
+        if settings["desktop_width"] is None or settings["desktop_height"] is None:
+            messagebox.showwarning("Validation", "Width and height must be numbers.", parent=self)
+            return
+        template_id, cat_id = self._selected_ids()
+        inherited = db.inherited_settings(template_id, cat_id)
 
         self.result = {
             "name": name,
@@ -201,14 +306,10 @@ class ConnectionDialog(ctk.CTkToplevel):
             "username": self.user_entry.get().strip(),
             "encrypted_password": enc_pass,
             "category_id": cat_id,
-            "screen_mode": 2 if self.screen_mode_var.get() == "Fullscreen" else 1,
-            "desktop_width": int(self.width_entry.get() or 1920),
-            "desktop_height": int(self.height_entry.get() or 1080),
-            "color_depth": int(self.color_depth_var.get()),
-            "redirect_clipboard": int(self.clipboard_var.get()),
-            "redirect_printers": int(self.printers_var.get()),
-            "redirect_drives": int(self.drives_var.get()),
+            "template_id": template_id,
+            **{f: None if settings[f] == inherited[f] else settings[f] for f in SETTINGS},
             "notes": self.notes_text.get("1.0", "end-1c").strip(),
+            "tags": normalize_tags(self.tags_entry.get()),
         }
         self.grab_release()
         self.destroy()
@@ -253,14 +354,252 @@ class CategoryDialog(ctk.CTkToplevel):
         self.destroy()
 
 
+class SmartFolderDialog(ctk.CTkToplevel):
+    HELP = ("Tags as in the tag filter, plus is:up / is:down / is:unknown, idle:30d,\n"
+            "in:<category>, host:<glob> and user:<glob>. E.g. env:prod idle:30d")
+
+    def __init__(self, parent, name: str = "", query: str = ""):
+        super().__init__(parent)
+        self.result = None
+
+        self.title("Edit Smart Folder" if name else "Add Smart Folder")
+        self.geometry("460x230")
+        self.resizable(False, False)
+        self.transient(parent)
+        self.grab_set()
+
+        frame = ctk.CTkFrame(self, fg_color="transparent")
+        frame.pack(fill="both", expand=True, padx=20, pady=15)
+
+        ctk.CTkLabel(frame, text="Name:", anchor="w").pack(fill="x")
+        self.name_entry = ctk.CTkEntry(frame, height=32)
+        self.name_entry.pack(fill="x", pady=(0, 8))
+        self.name_entry.insert(0, name)
+        self.name_entry.focus_set()
+
+        ctk.CTkLabel(frame, text="Query:", anchor="w").pack(fill="x")
+        self.query_entry = ctk.CTkEntry(frame, height=32)
+        self.query_entry.pack(fill="x")
+        self.query_entry.insert(0, query)
+        self.query_entry.bind("<Return>", lambda e: self._on_save())
+        ctk.CTkLabel(frame, text=self.HELP, anchor="w", justify="left",
+                     font=ctk.CTkFont(size=10), text_color="gray").pack(fill="x", pady=(2, 8))
+
+        btn_frame = ctk.CTkFrame(frame, fg_color="transparent")
+        btn_frame.pack(fill="x")
+        ctk.CTkButton(btn_frame, text="Save", command=self._on_save, width=80).pack(side="right")
+        ctk.CTkButton(btn_frame, text="Cancel", command=self.destroy, width=80, fg_color="gray").pack(
+            side="right", padx=(0, 10)
+        )
+
+    def _on_save(self):
+        name = self.name_entry.get().strip()
+        query = self.query_entry.get().strip()
+        if not name:
+            messagebox.showwarning("Validation", "Name cannot be empty.", parent=self)
+            return
+        try:
+            compile_folder(query)
+        except TagQueryError as e:
+            messagebox.showwarning("Validation", f"Invalid query: {e}", parent=self)
+            return
+        self.result = (name, query)
+        self.grab_release()
+        self.destroy()
+
+
+class TemplateDialog(ctk.CTkToplevel):
+    # Edits one template. Every setting can be left to inherit from the
+    # parent template.
+    INHERIT = "(inherit)"
+    CHOICES = {
+        "screen_mode": ("Screen Mode", {"Fullscreen": 2, "Windowed": 1}),
+        "color_depth": ("Color Depth", {"15": 15, "16": 16, "24": 24, "32": 32}),
+        "redirect_clipboard": ("Redirect Clipboard", {"Yes": 1, "No": 0}),
+        "redirect_printers": ("Redirect Printers", {"Yes": 1, "No": 0}),
+        "redirect_drives": ("Redirect Drives", {"Yes": 1, "No": 0}),
+    }
+
+    def __init__(self, parent, templates: list, template: dict = None):
+        super().__init__(parent)
+        self.result = None
+        template = template or {}
+        # A template cannot inherit from itself.
+        self.parents = [t for t in templates if t["id"] != template.get("id")]
+
+        self.title("Edit Template" if template else "Add Template")
+        self.geometry("420x520")
+        self.resizable(False, False)
+        self.transient(parent)
+        self.grab_set()
+
+        frame = ctk.CTkScrollableFrame(self, fg_color="transparent")
+        frame.pack(fill="both", expand=True, padx=15, pady=15)
+
+        ctk.CTkLabel(frame, text="Template Name *", anchor="w").pack(fill="x")
+        self.name_entry = ctk.CTkEntry(frame, height=32)
+        self.name_entry.pack(fill="x", pady=(0, 8))
+        self.name_entry.insert(0, template.get("name", ""))
+
+        ctk.CTkLabel(frame, text="Inherits From", anchor="w").pack(fill="x")
+        parent_row = next((t for t in self.parents if t["id"] == template.get("parent_id")), None)
+        self.parent_var = ctk.StringVar(value=parent_row["name"] if parent_row else "(None)")
+        ctk.CTkOptionMenu(frame, values=["(None)"] + [t["name"] for t in self.parents],
+                          variable=self.parent_var, height=32).pack(fill="x", pady=(0, 8))
+
+        self.vars = {}
+        for field, (label, options) in self.CHOICES.items():
+            ctk.CTkLabel(frame, text=label, anchor="w").pack(fill="x")
+            current = next((k for k, v in options.items() if v == template.get(field)), self.INHERIT)
+            self.vars[field] = ctk.StringVar(value=current)
+            ctk.CTkOptionMenu(frame, values=[self.INHERIT, *options], variable=self.vars[field],
+                              height=32).pack(fill="x", pady=(0, 8))
+
+        ctk.CTkLabel(frame, text="Resolution (blank to inherit)", anchor="w").pack(fill="x")
+        res_row = ctk.CTkFrame(frame, fg_color="transparent")
+        res_row.pack(fill="x", pady=(0, 8))
+        self.width_entry = ctk.CTkEntry(res_row, height=32, placeholder_text="Width")
+        self.width_entry.pack(side="left", fill="x", expand=True, padx=(0, 5))
+        self.height_entry = ctk.CTkEntry(res_row, height=32, placeholder_text="Height")
+        self.height_entry.pack(side="left", fill="x", expand=True, padx=(5, 0))
+        for entry, field in ((self.width_entry, "desktop_width"), (self.height_entry, "desktop_height")):
+            if template.get(field) is not None:
+                entry.insert(0, str(template[field]))
+
+        btn_frame = ctk.CTkFrame(frame, fg_color="transparent")
+        btn_frame.pack(fill="x", pady=(8, 0))
+        ctk.CTkButton(btn_frame, text="Save", command=self._on_save, width=80).pack(side="right")
+        ctk.CTkButton(btn_frame, text="Cancel", command=self.destroy, width=80, fg_color="gray").pack(
+            side="right", padx=(0, 10)
+        )
+
+    def _on_save(self):
+        name = self.name_entry.get().strip()
+        if not name:
+            messagebox.showwarning("Validation", "Name cannot be empty.", parent=self)
+            return
+        try:
+            width = int(self.width_entry.get()) if self.width_entry.get().strip() else None
+            height = int(self.height_entry.get()) if self.height_entry.get().strip() else None
+        except ValueError:
+            messagebox.showwarning("Validation", "Width and height must be numbers.", parent=self)
+            return
+        parent = next((t for t in self.parents if t["name"] == self.parent_var.get()), None)
+        self.result = {
+            "name": name,
+            "parent_id": parent["id"] if parent else None,
+            "desktop_width": width,
+            "desktop_height": height,
+            **{field: self.CHOICES[field][1].get(var.get()) for field, var in self.vars.items()},
+        }
+        self.grab_release()
+        self.destroy()
+
+
+class TemplatesDialog(ctk.CTkToplevel):
+    # Lists templates and which one each category uses. Changes are saved
+    # as they are made; result is True if anything changed.
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.result = False
+
+        self.title("Templates")
+        self.geometry("460x480")
+        self.transient(parent)
+        self.grab_set()
+
+        self._list = ctk.CTkScrollableFrame(self, fg_color="transparent")
+        self._list.pack(fill="both", expand=True, padx=15, pady=(15, 5))
+
+        btn_frame = ctk.CTkFrame(self, fg_color="transparent")
+        btn_frame.pack(fill="x", padx=15, pady=(0, 15))
+        ctk.CTkButton(btn_frame, text="Close", command=self.destroy, width=80).pack(side="right")
+        ctk.CTkButton(btn_frame, text="+ Template", command=self._add, width=110).pack(side="left")
+        self._render()
+
+    def _render(self):
+        for child in self._list.winfo_children():
+            child.destroy()
+        templates = db.get_templates()
+        bold = ctk.CTkFont(weight="bold")
+
+        ctk.CTkLabel(self._list, text="Templates", font=bold, anchor="w").pack(fill="x", pady=(0, 5))
+        if not templates:
+            ctk.CTkLabel(self._list, text="No templates yet.", text_color="gray", anchor="w").pack(fill="x")
+        names = {t["id"]: t["name"] for t in templates}
+        for t in templates:
+            row = ctk.CTkFrame(self._list, fg_color="transparent")
+            row.pack(fill="x", pady=2)
+            label = t["name"] + (f"  ← {names[t['parent_id']]}" if t["parent_id"] in names else "")
+            ctk.CTkLabel(row, text=label, anchor="w").pack(side="left", fill="x", expand=True)
+            ctk.CTkButton(row, text="Delete", width=60, fg_color="#dc2626", hover_color="#b91c1c",
+                          command=lambda t=t: self._delete(t)).pack(side="right")
+            ctk.CTkButton(row, text="Edit", width=60, fg_color=("gray70", "gray35"),
+                          hover_color=("gray60", "gray45"),
+                          command=lambda t=t: self._edit(t)).pack(side="right", padx=(0, 5))
+
+        ctk.CTkLabel(self._list, text="Category Templates", font=bold, anchor="w").pack(
+            fill="x", pady=(15, 5))
+        by_name = {t["name"]: t["id"] for t in templates}
+        for cat in db.get_categories():
+            row = ctk.CTkFrame(self._list, fg_color="transparent")
+            row.pack(fill="x", pady=2)
+            ctk.CTkLabel(row, text=cat["name"], anchor="w").pack(side="left", fill="x", expand=True)
+            var = ctk.StringVar(value=names.get(cat["template_id"], "(None)"))
+            ctk.CTkOptionMenu(
+                row, values=["(None)"] + list(by_name), variable=var, width=180,
+                command=lambda v, cid=cat["id"]: self._set_category(cid, by_name.get(v)),
+            ).pack(side="right")
+
+    def _add(self):
+        dialog = TemplateDialog(self, db.get_templates())
+        self.wait_window(dialog)
+        if dialog.result:
+            self._save(lambda: db.add_template(**dialog.result))
+
+    def _edit(self, template: dict):
+        dialog = TemplateDialog(self, db.get_templates(), template)
+        self.wait_window(dialog)
+        if dialog.result:
+            self._save(lambda: db.update_template(template["id"], **dialog.result))
+
+    def _delete(self, template: dict):
+        if messagebox.askyesno("Delete Template",
+                               f"Delete template '{template['name']}'?\n"
+                               "Connections using it keep their own settings and lose the inherited ones.",
+                               parent=self):
+            self._save(lambda: db.delete_template(template["id"]))
+
+    def _set_category(self, cat_id: int, template_id: int | None):
+        self._save(lambda: db.set_category_template(cat_id, template_id))
+
+    def _save(self, write):
+        try:
+            write()
+        except Exception as e:
+            messagebox.showerror("Error", str(e), parent=self)
+        else:
+            self.result = True
+        self._render()
+
+
 class ImportExportDialog(ctk.CTkToplevel):
-    def __init__(self, parent, mode: str = "export"):
+    POLICIES = {
+        "Keep existing": "keep",
+        "Overwrite": "overwrite",
+        "Keep most recently used": "newest",
+        "Add as a copy": None,
+    }
+
+    def __init__(self, parent, mode: str = "export", dispatcher=None, policy: str | None = "keep"):
         super().__init__(parent)
         self.result = None
         self.mode = mode
+        self.dispatcher = dispatcher
 
         self.title("Export Connections" if mode == "export" else "Import Connections")
-        self.geometry("400x180")
+        self.geometry("440x180" if mode == "export" else "440x260")
         self.resizable(False, False)
         self.transient(parent)
         self.grab_set()
@@ -272,9 +611,25 @@ class ImportExportDialog(ctk.CTkToplevel):
             ctk.CTkLabel(frame, text="Export all connections to a JSON file.").pack(pady=(0, 10))
             ctk.CTkButton(frame, text="Choose File & Export", command=self._do_export).pack()
         else:
-            ctk.CTkLabel(frame, text="Import connections from a JSON file.").pack(pady=(0, 10))
-            ctk.CTkLabel(frame, text="Existing connections will not be overwritten.", font=ctk.CTkFont(size=11)).pack(pady=(0, 10))
-            ctk.CTkButton(frame, text="Choose File & Import", command=self._do_import).pack()
+            ctk.CTkLabel(frame, text="Import from a JSON export, CSV, mRemoteNG XML or .rdp files.").pack(pady=(0, 10))
+            policy_row = ctk.CTkFrame(frame, fg_color="transparent")
+            policy_row.pack(fill="x", pady=(0, 5))
+            ctk.CTkLabel(policy_row, text="If a host already exists:", font=ctk.CTkFont(size=11)).pack(side="left")
+            label = next((k for k, v in self.POLICIES.items() if v == policy), "Keep existing")
+            self._policy_var = ctk.StringVar(value=label)
+            ctk.CTkOptionMenu(policy_row, variable=self._policy_var, values=list(self.POLICIES),
+                              width=200).pack(side="right")
+            self._dry_run_var = ctk.BooleanVar(value=False)
+            ctk.CTkCheckBox(frame, text="Preview changes only", variable=self._dry_run_var,
+                            font=ctk.CTkFont(size=11)).pack(anchor="w", pady=(0, 10))
+            buttons = ctk.CTkFrame(frame, fg_color="transparent")
+            buttons.pack()
+            self._import_btn = ctk.CTkButton(buttons, text="Choose File & Import", command=self._do_import)
+            self._import_btn.pack(side="left", padx=(0, 10))
+            self._folder_btn = ctk.CTkButton(buttons, text="Import .rdp Folder", command=self._do_import_folder)
+            self._folder_btn.pack(side="left")
+            self._progress_label = ctk.CTkLabel(frame, text="", font=ctk.CTkFont(size=11), text_color="gray")
+            self._progress_label.pack(pady=(5, 0))
 
     def _do_export(self):
         path = filedialog.asksaveasfilename(
@@ -295,18 +650,83 @@ class ImportExportDialog(ctk.CTkToplevel):
     def _do_import(self):
         path = filedialog.askopenfilename(
             parent=self,
-            filetypes=[("JSON files", "*.json")],
+            filetypes=[
+                ("All supported", "*.json *.csv *.xml *.rdp"),
+                ("JSON export", "*.json"),
+                ("CSV", "*.csv"),
+                ("mRemoteNG confCons.xml", "*.xml"),
+                ("RDP file", "*.rdp"),
+            ],
             title="Import Connections",
         )
         if path:
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                db.import_connections(data)
-                count = len(data.get("connections", []))
-                messagebox.showinfo("Import", f"Imported {count} connections.", parent=self)
-                self.result = path
-                self.grab_release()
-                self.destroy()
-            except Exception as e:
-                messagebox.showerror("Import Error", str(e), parent=self)
+            self._start_import(path)
+
+    def _do_import_folder(self):
+        path = filedialog.askdirectory(parent=self, title="Import a Folder of .rdp Files")
+        if path:
+            self._start_import(path)
+
+    def _start_import(self, path: str):
+        self._import_btn.configure(state="disabled")
+        self._folder_btn.configure(state="disabled")
+        policy = self.POLICIES[self._policy_var.get()]
+        threading.Thread(target=self._import_worker, args=(path, policy, self._dry_run_var.get()),
+                         daemon=True).start()
+
+    def _import_worker(self, path: str, policy: str | None, dry_run: bool):
+        # Runs off the Tk thread; every UI update goes through the dispatcher.
+        from core.encryption import DEFAULT_PASSPHRASE, make_encryptor
+        from core.importers import import_path
+
+        try:
+            report = import_path(
+                path, encrypt=make_encryptor(DEFAULT_PASSPHRASE, db.get_encryption_salt()),
+                progress=self._post_progress, policy=policy, dry_run=dry_run,
+            )
+        except Exception as e:
+            self.dispatcher.post(self._import_failed, str(e))
+            return
+        self.dispatcher.post(self._import_done, path, report)
+
+    def _post_progress(self, done: int, total: int):
+        self.dispatcher.post(self._show_progress, done, total, key=("import", id(self)))
+
+    def _show_progress(self, done: int, total: int | None):
+        if self.winfo_exists():
+            text = f"Imported {done} of {total}..." if total else f"Imported {done}..."
+            self._progress_label.configure(text=text)
+
+    def _import_done(self, path: str, report):
+        if not self.winfo_exists():
+            return
+        if report.diff is not None:
+            self._show_preview(report.diff)
+            return
+        message = f"Imported {report.imported} connections."
+        if report.errors:
+            # Show the first few problems; the rest are summarised.
+            lines = [f"{source}: {error}" for source, error in report.errors[:10]]
+            if len(report.errors) > 10:
+                lines.append(f"...and {len(report.errors) - 10} more")
+            message += f"\n\n{len(report.errors)} entries were skipped:\n" + "\n".join(lines)
+        messagebox.showinfo("Import", message, parent=self)
+        self.result = path
+        self.grab_release()
+        self.destroy()
+
+    def _show_preview(self, diff: dict):
+        lines = [f"{len(entries)} {action}" for action, entries in diff.items()]
+        for entry in diff["updated"][:10]:
+            fields = ", ".join(entry["changes"])
+            lines.append(f"  ~ {entry['name']}: {fields}")
+        messagebox.showinfo("Import Preview", "\n".join(lines), parent=self)
+        self._import_btn.configure(state="normal")
+        self._folder_btn.configure(state="normal")
+
+    def _import_failed(self, error: str):
+        if not self.winfo_exists():
+            return
+        messagebox.showerror("Import Error", error, parent=self)
+        self._import_btn.configure(state="normal")
+        self._folder_btn.configure(state="normal")
@@ -0,0 +1,54 @@
+import queue
+import sys
+
+PUMP_INTERVAL_MS = 16
+MAX_UPDATES_PER_FRAME = 200
+
+
+class UIDispatcher:
+    # Tk may only be touched from the thread running mainloop. Worker
+    # threads call post(); a single after() pump on the Tk thread drains the
+    # queue and applies at most MAX_UPDATES_PER_FRAME callbacks per tick.
+    # Posts sharing a key are coalesced so only the latest one runs.
+
+    def __init__(self, root, interval_ms: int = PUMP_INTERVAL_MS,
+                 max_per_frame: int = MAX_UPDATES_PER_FRAME):
+        self._root = root
+        self._interval_ms = interval_ms
+        self._max_per_frame = max_per_frame
+        self._queue = queue.SimpleQueue()
+        self._pending = {}
+        self._job = None
+
+    def post(self, fn, *args, key=None):
+        self._queue.put((key, fn, args))
+
+    def start(self):
+        if self._job is None:
+            self._job = self._root.after(self._interval_ms, self._pump)
+
+    def stop(self):
+        if self._job is not None:
+            self._root.after_cancel(self._job)
+            self._job = None
+
+    def _pump(self):
+        self._job = None
+        while True:
+            try:
+                key, fn, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if key is None:
+                key = object()
+            self._pending[key] = (fn, args)
+
+        for _ in range(min(self._max_per_frame, len(self._pending))):
+            key = next(iter(self._pending))
+            fn, args = self._pending.pop(key)
+            try:
+                fn(*args)
+            except Exception:
+                self._root.report_callback_exception(*sys.exc_info())
+
+        self.start()
@@ -1,30 +1,183 @@
-import threading
+import bisect
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 import customtkinter as ctk
 
 from core import database as db
-from core.rdp import ping_host
+from core.rdp import tcp_probe
+from core.fuzzy import FuzzyIndex
+from core.search import TrigramIndex
+from core.smart import Facts, SmartFolders
+from core.tags import TagIndex
+from core.templates import SETTINGS
+from core.tracing import span, traced
+
+# Every model row (category header or connection) occupies one fixed-height
+# slot, so the visible window can be computed from the scroll offset alone.
+ROW_HEIGHT = 38
+STATUS_COLORS = {"green": "#22c55e", "red": "#ef4444", "gray": "#6b7280"}
+ROW_COLOR = ("gray90", "gray17")
+ROW_SELECTED_COLOR = ("gray75", "gray30")
+# Fuzzy ranking is spread over several Tk callbacks so scoring a large
+# fleet never blocks input for longer than this many seconds at a time.
+SEARCH_FRAME_BUDGET = 0.012
+PROBE_WORKERS = 16
+# How often smart folders with an idle: term are checked against the clock.
+SMART_EXPIRE_MS = 60_000
+SMART_STATUS = {"green": "up", "red": "down"}
+BULK_RESOLUTIONS = [
+    ("Full screen", {"screen_mode": 2}),
+    ("1920 x 1080", {"screen_mode": 1, "desktop_width": 1920, "desktop_height": 1080}),
+    ("1600 x 900", {"screen_mode": 1, "desktop_width": 1600, "desktop_height": 900}),
+    ("1280 x 720", {"screen_mode": 1, "desktop_width": 1280, "desktop_height": 720}),
+]
+
+
+class _Row:
+    # A pooled row widget that can be rebound to any model row.
+
+    def __init__(self, sidebar, parent, fonts: dict):
+        self.key = None
+        self.kind = None
+        self.index = -1
+        self.placed = False
+
+        self.slot = ctk.CTkFrame(parent, fg_color="transparent", height=ROW_HEIGHT, corner_radius=0)
+        self.slot.pack_propagate(False)
+
+        self.body = ctk.CTkFrame(self.slot, height=36, corner_radius=6, fg_color=ROW_COLOR)
+        self.body.pack_propagate(False)
+
+        self.dot = ctk.CTkLabel(self.body, text="●", width=20, font=fonts["dot"])
+        self.name = ctk.CTkLabel(self.body, text="", anchor="w", font=fonts["name"])
+        self.host = ctk.CTkLabel(self.body, text="", anchor="e", font=fonts["host"], text_color="gray")
+
+        for widget in (self.slot, self.body, self.dot, self.name, self.host):
+            widget.bind("<Button-1>", lambda e: sidebar._on_row_click(self))
+            widget.bind("<Control-Button-1>", lambda e: sidebar._on_row_click(self, "toggle"))
+            widget.bind("<Shift-Button-1>", lambda e: sidebar._on_row_click(self, "range"))
+            widget.bind("<Double-Button-1>", lambda e: sidebar._on_row_double_click(self))
+            widget.bind("<Button-3>", lambda e: sidebar._on_row_context(self, e))
+            sidebar._bind_wheel(widget)
+
+    def set_kind(self, kind: str, fonts: dict):
+        if kind == self.kind:
+            return
+        self.kind = kind
+        for widget in (self.body, self.dot, self.name, self.host):
+            widget.pack_forget()
+        if kind in ("cat", "smart"):
+            self.body.configure(fg_color="transparent", height=30)
+            self.body.pack(fill="x", side="bottom", pady=(0, 2))
+            self.name.configure(font=fonts["header"])
+            self.name.pack(fill="both", expand=True, padx=5)
+        else:
+            self.body.configure(height=36)
+            self.body.pack(fill="x", side="bottom", padx=(15, 0), pady=1)
+            self.name.configure(font=fonts["name"])
+            self.dot.pack(side="left", padx=(8, 2))
+            self.name.pack(side="left", fill="x", expand=True, padx=2)
+            self.host.pack(side="right", padx=(2, 8))
 
 
 class Sidebar(ctk.CTkFrame):
-    def __init__(self, parent, on_select=None, on_connect=None, on_edit=None,
-                 on_delete=None, on_duplicate=None):
+    def __init__(self, parent, dispatcher, on_select=None, on_connect=None, on_edit=None,
+                 on_delete=None, on_duplicate=None, on_bulk_update=None, on_bulk_delete=None,
+                 on_edit_smart=None, on_delete_smart=None, collapsed_by_default: bool = False):
         super().__init__(parent, width=300)
         self.pack_propagate(False)
 
+        self.dispatcher = dispatcher
+        self._probe_pool = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="probe")
+        self._probe_generation = 0
+        self._probing = False
+        self._probed = set()
+
         self.on_select = on_select
         self.on_connect = on_connect
         self.on_edit = on_edit
         self.on_delete = on_delete
         self.on_duplicate = on_duplicate
+        self.on_bulk_update = on_bulk_update
+        self.on_bulk_delete = on_bulk_delete
+        self.on_edit_smart = on_edit_smart
+        self.on_delete_smart = on_delete_smart
 
+        self.collapsed_by_default = collapsed_by_default
         self._collapsed = {}
         self._status_cache = {}
-        self._widgets = {}
         self._selected_id = None
-
-        self.scroll = ctk.CTkScrollableFrame(self, fg_color="transparent")
-        self.scroll.pack(fill="both", expand=True, padx=5, pady=5)
+        # Ctrl/Shift-click selects several rows; _selected_id stays the one
+        # the details panel shows and the anchor of a Shift range.
+        self._selection = set()
+        # Index in _items of the selected row: with smart folders expanded
+        # a connection can be listed more than once.
+        self._anchor = -1
+
+        # Virtual list model: one entry per slot, either a category header
+        # or a connection. Widgets only exist for the rows in the viewport.
+        self._items = []
+        self._headers = {}
+        self._shown_counts = {}
+        self._categories = []
+        self._filter_text = ""
+        self._category_filter = -1
+        self._ranked = []
+        self._search_job = None
+        self._search_batches = None
+        self._search_scored = []
+
+        # Category tree model. Header counts come from one aggregate query;
+        # a category's rows are fetched the first time it is expanded and
+        # kept until its data version changes. _all holds every loaded row.
+        self._all = {}
+        self._all_categories = []
+        self._counts = {}
+        self._groups = {}
+        self._group_versions = {}
+        self._complete = False
+        # The search indexes are built on the first search, not on load, so
+        # a large fleet does not delay the first paint.
+        self.index = TrigramIndex()
+        self.fuzzy = FuzzyIndex()
+        self._indexed = False
+        # Tag bitsets cover the whole fleet, so they are built on the first
+        # tag filter, which loads every category.
+        self.tags = TagIndex()
+        self._tags_loaded = False
+        # Until then, the tags of connections shown in the details pane,
+        # read one connection at a time (see get_tags).
+        self._tag_cache = {}
+        self._tag_filter = ""
+        self._tag_matches = None
+        # Smart folders (saved queries) are listed above the categories and
+        # start collapsed: the first expand loads every category and the
+        # tags to build the member sets, which are then patched row by row.
+        self.smart = SmartFolders()
+        self._smart_folders = []
+        self._category_names = {}
+        self._smart_loaded = False
+        self._smart_job = None
+        self._pool = []
+        self._top = 0
+
+        self._fonts = {
+            "header": ctk.CTkFont(size=13, weight="bold"),
+            "name": ctk.CTkFont(size=12),
+            "host": ctk.CTkFont(size=10),
+            "dot": ctk.CTkFont(size=10),
+        }
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y", padx=(0, 3), pady=5)
+
+        self.viewport = ctk.CTkFrame(self, fg_color="transparent", corner_radius=0)
+        self.viewport.pack(side="left", fill="both", expand=True, padx=(5, 0), pady=5)
+        self.viewport.bind("<Configure>", lambda e: self._on_resize())
+        self._bind_wheel(self.viewport)
 
         self._context_menu = tk.Menu(self, tearoff=0)
         self._context_menu.add_command(label="Connect", command=self._ctx_connect)
@@ -36,130 +189,679 @@ class Sidebar(ctk.CTkFrame):
 
         self._ctx_conn_id = None
 
-    def refresh(self, filter_text: str = "", category_filter: int | None = -1):
-        for w in self.scroll.winfo_children():
-            w.destroy()
-        self._widgets.clear()
-
-        categories = db.get_categories()
-        all_connections = db.get_connections()
-
-        if filter_text:
-            filter_text = filter_text.lower()
-            all_connections = [
-                c for c in all_connections
-                if filter_text in c["name"].lower()
-                or filter_text in c["hostname"].lower()
-                or filter_text in (c.get("username") or "").lower()
-            ]
-
-        if category_filter is not None and category_filter != -1:
-            if category_filter == 0:
-                all_connections = [c for c in all_connections if c["category_id"] is None]
-                categories = []
+        self._smart_menu = tk.Menu(self, tearoff=0)
+        self._smart_menu.add_command(label="Edit Smart Folder", command=self._ctx_edit_smart)
+        self._smart_menu.add_command(label="Delete Smart Folder", command=self._ctx_delete_smart)
+        self._ctx_smart_id = None
+
+        self._bulk_menu = tk.Menu(self, tearoff=0)
+        self._move_menu = tk.Menu(self._bulk_menu, tearoff=0)
+        self._resolution_menu = tk.Menu(self._bulk_menu, tearoff=0)
+        self._template_menu = tk.Menu(self._bulk_menu, tearoff=0)
+        for label, fields in BULK_RESOLUTIONS:
+            self._resolution_menu.add_command(
+                label=label, command=lambda f=fields: self._bulk_update(f))
+        self._bulk_menu.add_cascade(label="Move to", menu=self._move_menu)
+        self._bulk_menu.add_cascade(label="Resolution", menu=self._resolution_menu)
+        self._bulk_menu.add_cascade(label="Template", menu=self._template_menu)
+        # Drops the selected rows' own settings so their templates apply.
+        self._bulk_menu.add_command(label="Use Template Settings",
+                                    command=lambda: self._bulk_update(dict.fromkeys(SETTINGS)))
+        self._bulk_menu.add_separator()
+        self._bulk_menu.add_command(label="Delete", command=self._bulk_delete)
+
+    @traced(cat="ui")
+    def refresh(self, filter_text: str = "", category_filter: int | None = -1, probe: bool = True,
+                tag_filter: str = ""):
+        self._reset_model(db.get_categories(), db.get_smart_folders(), probe)
+        self._counts = db.get_category_counts()
+        self._invalidate_all()
+        self._apply_filter(filter_text, category_filter, tag_filter)
+
+    @traced(cat="ui")
+    def load_snapshot(self, snapshot):
+        # Builds the whole model from a core.snapshot.Snapshot without a
+        # query; the rows count as current at today's category versions.
+        self._reset_model(snapshot.categories, snapshot.smart_folders, probe=False)
+        groups = {cat["id"]: [] for cat in self._all_categories}
+        groups[None] = []
+        for c in snapshot.connections:
+            groups.setdefault(c["category_id"], []).append(c["id"])
+        self._all = {c["id"]: c for c in snapshot.connections}
+        self._groups = groups
+        self._group_versions = {cid: db.category_version(cid) for cid in groups}
+        self._counts = {cid: len(members) for cid, members in groups.items() if members}
+        self._complete = True
+        self._invalidate_all()
+        self._apply_filter("", -1)
+
+    def _reset_model(self, categories: list, smart_folders: list, probe: bool):
+        self._all_categories = categories
+        self._category_names = {cat["id"]: cat["name"] for cat in categories}
+        self._smart_folders = smart_folders
+        self._all = {}
+        self._groups = {}
+        self._group_versions = {}
+        self._complete = False
+        self._indexed = False
+        self._tags_loaded = False
+        self._tag_cache.clear()
+        self._smart_loaded = False
+        self._probe_generation += 1
+        self._probing = probe
+        self._probed.clear()
+
+    @traced(cat="probe")
+    def probe_all(self):
+        # Hosts are probed as their rows are bound, so only what the user
+        # can see costs a probe; rows already on screen are queued here.
+        self._probe_generation += 1
+        self._probing = True
+        self._probed.clear()
+        for row in self._pool:
+            if row.key is not None and row.key[0] == "conn":
+                self._probe(self._all[row.key[1]])
+
+    def _is_collapsed(self, cat_id) -> bool:
+        return self._collapsed.get(cat_id, self.collapsed_by_default)
+
+    def _stale(self, cat_ids) -> list:
+        return [cid for cid in cat_ids if self._group_versions.get(cid) != db.category_version(cid)]
+
+    def _load_groups(self, cat_ids, everything: bool = False) -> bool:
+        if everything:
+            if self._complete and not self._stale(self._groups):
+                return False
+        else:
+            requested = len(cat_ids)
+            cat_ids = self._stale(cat_ids)
+            if requested > len(cat_ids):
+                db.CACHE_REQUESTS.inc(requested - len(cat_ids), cache="category_rows", result="hit")
+            if not cat_ids:
+                return False
+            db.CACHE_REQUESTS.inc(len(cat_ids), cache="category_rows", result="miss")
+            # Past half the fleet, one full scan beats a query per category.
+            wanted = sum(self._counts.get(cid, 0) for cid in cat_ids)
+            everything = wanted * 2 > sum(self._counts.values())
+
+        self._indexed = False
+        self._tags_loaded = False
+        self._smart_loaded = False
+        if everything:
+            versions = {cat["id"]: db.category_version(cat["id"]) for cat in self._all_categories}
+            versions[None] = db.category_version(None)
+            rows = db.get_connections()
+            self._groups = {cid: [] for cid in versions}
+            for c in rows:
+                self._groups.setdefault(c["category_id"], []).append(c["id"])
+            self._all = {c["id"]: c for c in rows}
+            self._group_versions = versions
+            self._counts = {cid: len(members) for cid, members in self._groups.items() if members}
+            self._complete = True
+            return True
+
+        for cid in cat_ids:
+            version = db.category_version(cid)
+            rows = db.get_connections(cid) if cid is not None else db.get_connections_uncategorized()
+            for conn_id in self._groups.get(cid, ()):
+                self._all.pop(conn_id, None)
+            self._all.update((c["id"], c) for c in rows)
+            self._groups[cid] = [c["id"] for c in rows]
+            self._group_versions[cid] = version
+            if rows:
+                self._counts[cid] = len(rows)
             else:
-                all_connections = [c for c in all_connections if c["category_id"] == category_filter]
-                categories = [cat for cat in categories if cat["id"] == category_filter]
-
-        categorized = {}
-        uncategorized = []
-        for c in all_connections:
-            cid = c["category_id"]
-            if cid is None:
-                uncategorized.append(c)
-            else:
-                categorized.setdefault(cid, []).append(c)
-
-        for cat in categories:
+                self._counts.pop(cid, None)
+        return True
+
+    def _ensure_tags(self):
+        if self._load_groups((), everything=True):
+            self._invalidate_all()
+        if not self._tags_loaded:
+            self.tags.rebuild(db.get_tag_pairs(), self._all)
+            self._tags_loaded = True
+
+    def update_tags(self, conn_id: int, tags):
+        # The caller has saved new tags for conn_id; follow with
+        # upsert_connection to redraw.
+        self._tag_cache.pop(conn_id, None)
+        if self._tags_loaded:
+            self.tags.set_tags(conn_id, tags)
+            self._requery_tags()
+
+    def _requery_tags(self):
+        if self._tag_filter:
+            self._tag_matches = self.tags.query(self._tag_filter)
+
+    # --- Smart folders ---
+
+    def _smart_collapsed(self, fid: int) -> bool:
+        return self._collapsed.get(("smart", fid), True)
+
+    def _facts(self, conn: dict) -> Facts:
+        return Facts(conn, self._category_names.get(conn["category_id"]),
+                     self.tags.tag_set(conn["id"]),
+                     SMART_STATUS.get(self._status_cache.get(conn["id"]), "unknown"))
+
+    def _ensure_smart(self):
+        self._ensure_tags()
+        if self._smart_loaded:
+            return
+        self.smart.clear()
+        self.smart.set_folders(self._smart_folders)
+        self.smart.rebuild(self._facts(c) for c in self._all.values())
+        self._smart_loaded = True
+        if self._smart_job is None:
+            self._smart_job = self.after(SMART_EXPIRE_MS, self._expire_smart)
+
+    def _smart_update(self, conn_id: int) -> set:
+        conn = self._all.get(conn_id)
+        if conn is None:
+            return self.smart.remove(conn_id)
+        return self.smart.update(self._facts(conn))
+
+    def _smart_changed(self, fids):
+        # Membership moved for fids outside of a full redraw.
+        if not fids or self._filter_text:
+            return
+        self._invalidate(*[("smart", fid) for fid in fids])
+        if any(not self._smart_collapsed(fid) for fid in fids):
+            self._rebuild_items()
+        self._render()
+
+    def _expire_smart(self):
+        self._smart_job = self.after(SMART_EXPIRE_MS, self._expire_smart)
+        if self._smart_loaded:
+            self._smart_changed(self.smart.expire(
+                lambda conn_id: self._facts(self._all[conn_id]) if conn_id in self._all else None))
+
+    def reload_smart_folders(self):
+        # Call after adding, editing or deleting a smart folder; only the
+        # folders whose query changed are evaluated again.
+        self._smart_folders = db.get_smart_folders()
+        if self._smart_loaded:
+            stale = self.smart.set_folders(self._smart_folders)
+            if stale:
+                self.smart.rebuild((self._facts(c) for c in self._all.values()), stale)
+        if not self._filter_text:
+            self._rebuild_items()
+            self._invalidate_all()
+            self._render()
+
+    def _ensure_indexes(self):
+        # Search ranks the whole fleet, so it is the one path that loads
+        # every category.
+        if self._load_groups((), everything=True):
+            self._invalidate_all()
+        if not self._indexed:
+            connections = list(self._all.values())
+            self.index.rebuild(connections)
+            self.fuzzy.rebuild(connections)
+            self._indexed = True
+
+    def set_filter(self, filter_text: str = "", category_filter: int | None = -1, tag_filter: str = ""):
+        # Raises core.tags.TagQueryError for a malformed tag filter, leaving
+        # the current view as it was.
+        if (filter_text.lower() == self._filter_text and category_filter == self._category_filter
+                and tag_filter.strip() == self._tag_filter):
+            return
+        self._apply_filter(filter_text, category_filter, tag_filter)
+
+    def _apply_filter(self, filter_text: str, category_filter: int | None, tag_filter: str = ""):
+        tag_filter = tag_filter.strip()
+        if tag_filter:
+            self._ensure_tags()
+            self._tag_matches = self.tags.query(tag_filter)
+        else:
+            self._tag_matches = None
+        self._tag_filter = tag_filter
+        self._filter_text = filter_text.lower()
+        self._category_filter = category_filter
+
+        categories = self._all_categories
+        if category_filter == 0:
+            categories = []
+        elif category_filter is not None and category_filter != -1:
+            categories = [cat for cat in categories if cat["id"] == category_filter]
+        self._categories = categories + [{"id": None, "name": "Uncategorized"}]
+
+        if self._filter_text:
+            self._start_search()
+            return
+
+        self._cancel_search()
+        if self._load_groups([cat["id"] for cat in self._categories if not self._is_collapsed(cat["id"])]):
+            self._invalidate_all()
+        self._rebuild_items()
+        self._top = 0
+        self._render()
+
+    def _matches(self, conn: dict) -> bool:
+        if self._tag_matches is not None and conn["id"] not in self._tag_matches:
+            return False
+        category_filter = self._category_filter
+        if category_filter is not None and category_filter != -1:
+            wanted = None if category_filter == 0 else category_filter
+            if conn["category_id"] != wanted:
+                return False
+        return True
+
+    # --- Ranked search ---
+
+    def _start_search(self):
+        self._cancel_search()
+        self._ensure_indexes()
+        # Literal substring hits from the trigram index get a ranking bonus
+        # on top of their fuzzy score.
+        exact = self.index.search(self._filter_text) if len(self._filter_text) >= 3 else frozenset()
+        self._search_batches = self.fuzzy.rank_batches(self._filter_text, exact)
+        self._search_scored = []
+        self._search_step()
+
+    def _cancel_search(self):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+            self._search_job = None
+        self._search_batches = None
+
+    def _search_step(self, budget: float | None = SEARCH_FRAME_BUDGET):
+        self._search_job = None
+        deadline = time.perf_counter() + budget if budget is not None else None
+        for batch in self._search_batches:
+            self._search_scored.extend(batch)
+            if deadline is not None and time.perf_counter() >= deadline:
+                self._search_job = self.after(1, self._search_step)
+                return
+
+        ranked = self.fuzzy.order(self._search_scored)
+        self._search_batches = None
+        self._search_scored = []
+        self._ranked = [i for i in ranked if self._matches(self._all[i])]
+        self._rebuild_items()
+        self._top = 0
+        self._render()
+
+    def flush_search(self):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+            self._search_step(budget=None)
+
+    def _rebuild_items(self):
+        self._items = []
+        self._headers = {}
+        self._shown_counts = {}
+        if self._filter_text:
+            self._items = [("conn", conn_id) for conn_id in self._ranked]
+            return
+        if self._category_filter == -1:
+            self._add_smart_items()
+        for cat in self._categories:
             cid = cat["id"]
-            conns = categorized.get(cid, [])
-            if not conns and filter_text:
+            if cid is None and not self._counts.get(None):
                 continue
-            self._render_category(cat, conns)
-
-        if uncategorized:
-            self._render_category({"id": None, "name": "Uncategorized"}, uncategorized)
-
-        self._check_status_all(all_connections)
-
-    def _render_category(self, category: dict, connections: list):
-        cid = category["id"]
-        is_collapsed = self._collapsed.get(cid, False)
-
-        header = ctk.CTkFrame(self.scroll, fg_color="transparent", height=30)
-        header.pack(fill="x", pady=(8, 2))
-        header.pack_propagate(False)
-
-        arrow = "▶" if is_collapsed else "▼"
-        count = len(connections)
-        label_text = f" {arrow}  {category['name']}  ({count})"
-
-        label = ctk.CTkLabel(
-            header, text=label_text, anchor="w",
-            font=ctk.CTkFont(size=13, weight="bold"),
-        )
-        label.pack(fill="both", expand=True, padx=5)
-        label.bind("<Button-1>", lambda e, c=cid: self._toggle_category(c))
-
-        if not is_collapsed:
+            members = self._groups.get(cid, ())
+            if self._tag_matches is not None:
+                members = [conn_id for conn_id in members if conn_id in self._tag_matches]
+                if not members:
+                    continue
+                self._shown_counts[cid] = len(members)
+            self._headers[cid] = cat["name"]
+            self._items.append(("cat", cid))
+            if not self._is_collapsed(cid):
+                self._items.extend(("conn", conn_id) for conn_id in members)
+
+    def _add_smart_items(self):
+        if any(not self._smart_collapsed(f["id"]) for f in self._smart_folders):
+            self._ensure_smart()
+        for folder in self._smart_folders:
+            fid = folder["id"]
+            if not self._smart_loaded:
+                # Count unknown until the folder is first expanded.
+                self._items.append(("smart", fid))
+                continue
+            members = self.smart.members.get(fid, ())
+            if self._tag_matches is not None:
+                members = [conn_id for conn_id in members if conn_id in self._tag_matches]
+                if not members:
+                    continue
+            self._shown_counts[("smart", fid)] = len(members)
+            self._items.append(("smart", fid))
+            if not self._smart_collapsed(fid):
+                self._items.extend(("conn", conn_id) for conn_id in
+                                   sorted(members, key=lambda i: self._all[i]["name"]))
+
+    # --- Incremental updates ---
+
+    def _refresh_counts(self, *cat_ids):
+        # The caller already patched the loaded groups for these categories,
+        # so they are current at the version the write just produced.
+        for cid in cat_ids:
+            if cid in self._groups:
+                self._group_versions[cid] = db.category_version(cid)
+        self._counts = db.get_category_counts()
+        self._invalidate(*[("cat", cid) for cid in self._headers])
+        self._invalidate(*[("smart", f["id"]) for f in self._smart_folders])
+
+    def upsert_connection(self, conn: dict):
+        old = self._all.get(conn["id"])
+        moved = self._patch_row(conn)
+        self._refresh_counts(old["category_id"] if old else conn["category_id"], conn["category_id"])
+
+        if self._filter_text:
+            self._invalidate(("conn", conn["id"]))
+            self._start_search()
+            return
+
+        if (old is not None and conn["id"] in self._all and old["category_id"] == conn["category_id"]
+                and old["name"] == conn["name"] and not moved):
+            self._invalidate(("conn", conn["id"]))
+        else:
+            self._rebuild_items()
+            self._invalidate(("conn", conn["id"]))
+        self._render()
+
+    def remove_connection(self, conn_id: int):
+        old = self._unpatch_row(conn_id)
+        self._refresh_counts(*([old["category_id"]] if old else []))
+
+        if self._filter_text:
+            if conn_id in self._ranked:
+                self._ranked.remove(conn_id)
+                self._rebuild_items()
+                self._render()
+            self._start_search()
+            return
+        self._rebuild_items()
+        self._render()
+
+    def apply_changes(self, connections: list, deleted_uids=(), deleted_ids=()):
+        # Patches a batch of rows (bulk actions, or writes made elsewhere;
+        # see core.watcher) with a single count query and redraw.
+        deleted_uids = set(deleted_uids)
+        gone = [conn_id for conn_id, c in self._all.items() if c.get("uid") in deleted_uids]
+        gone += [conn_id for conn_id in deleted_ids if conn_id in self._all]
+        # A deleted or edited row this model does not hold may have left a
+        # category whose rows were not loaded, and which one is unknown.
+        unknown = not self._complete and (
+            bool(deleted_uids - {self._all[conn_id].get("uid") for conn_id in gone})
+            or any(c["id"] not in self._all and c.get("row_version", 1) > 1 for c in connections))
+        cat_ids = set()
+        for conn_id in gone:
+            cat_ids.add(self._unpatch_row(conn_id)["category_id"])
+            if conn_id in self._ranked:
+                self._ranked.remove(conn_id)
+        for conn in connections:
+            old = self._all.get(conn["id"])
+            if old is not None:
+                cat_ids.add(old["category_id"])
+            cat_ids.add(conn["category_id"])
+            self._patch_row(conn)
+            self._tag_cache.pop(conn["id"], None)
+        if self._tags_loaded and connections:
+            ids = [c["id"] for c in connections]
+            tags = {conn_id: [] for conn_id in ids}
+            for conn_id, tag in db.get_tag_pairs(ids):
+                tags[conn_id].append(tag)
+            for conn_id, names in tags.items():
+                self.tags.set_tags(conn_id, names)
+        if self._tags_loaded:
+            self._requery_tags()
+        if self._smart_loaded:
+            # Again, now that the tags are current too.
             for conn in connections:
-                self._render_connection(conn)
-
-    def _render_connection(self, conn: dict):
+                self._smart_update(conn["id"])
+        if unknown:
+            # Every group is checked against the database when next shown.
+            db.invalidate_connections()
+        self._refresh_counts(*cat_ids)
+        self._invalidate(*[("conn", c["id"]) for c in connections])
+
+        if self._filter_text:
+            self._rebuild_items()
+            self._render()
+            self._start_search()
+            return
+        self._rebuild_items()
+        self._render()
+
+    def _patch_row(self, conn: dict) -> set:
+        # Returns the smart folders the connection joined or left.
         conn_id = conn["id"]
-        is_selected = conn_id == self._selected_id
-
-        frame = ctk.CTkFrame(
-            self.scroll, height=36,
-            fg_color=("gray75", "gray30") if is_selected else ("gray90", "gray17"),
-            corner_radius=6,
-        )
-        frame.pack(fill="x", padx=(15, 0), pady=1)
-        frame.pack_propagate(False)
-
-        status = self._status_cache.get(conn_id, "gray")
-        colors = {"green": "#22c55e", "red": "#ef4444", "gray": "#6b7280"}
-        dot = ctk.CTkLabel(
-            frame, text="●", width=20,
-            text_color=colors.get(status, "#6b7280"),
-            font=ctk.CTkFont(size=10),
-        )
-        dot.pack(side="left", padx=(8, 2))
-
-        name_label = ctk.CTkLabel(
-            frame, text=conn["name"], anchor="w",
-            font=ctk.CTkFont(size=12),
-        )
-        name_label.pack(side="left", fill="x", expand=True, padx=2)
-
-        host_label = ctk.CTkLabel(
-            frame, text=conn["hostname"], anchor="e",
-            font=ctk.CTkFont(size=10), text_color="gray",
-        )
-        host_label.pack(side="right", padx=(2, 8))
-
-        for widget in (frame, dot, name_label, host_label):
-            widget.bind("<Button-1>", lambda e, c=conn_id: self._select(c))
-            widget.bind("<Double-Button-1>", lambda e, c=conn_id: self._double_click(c))
-            widget.bind("<Button-3>", lambda e, c=conn_id: self._show_context(e, c))
-
-        self._widgets[conn_id] = {"frame": frame, "dot": dot}
+        cid = conn["category_id"]
+        old = self._all.pop(conn_id, None)
+        if old is not None:
+            self._groups[old["category_id"]].remove(conn_id)
+        if cid in self._groups or self._complete:
+            self._all[conn_id] = conn
+            members = self._groups.setdefault(cid, [])
+            bisect.insort(members, conn_id, key=lambda i: self._all[i]["name"])
+        if self._indexed:
+            self.index.update(conn)
+            self.fuzzy.update(conn)
+        if old is None or old["hostname"] != conn["hostname"]:
+            self._probed.discard(conn_id)
+        if self._tags_loaded and old is None:
+            self.tags.add(conn_id)
+        return self._smart_update(conn_id) if self._smart_loaded else set()
+
+    def _unpatch_row(self, conn_id: int) -> dict | None:
+        old = self._all.pop(conn_id, None)
+        if self._indexed:
+            self.index.remove(conn_id)
+            self.fuzzy.remove(conn_id)
+        if old is not None:
+            self._groups[old["category_id"]].remove(conn_id)
+        if self._tags_loaded:
+            self.tags.remove(conn_id)
+        self._tag_cache.pop(conn_id, None)
+        if self._smart_loaded:
+            self.smart.remove(conn_id)
+        if self._selected_id == conn_id:
+            self._selected_id = None
+        self._selection.discard(conn_id)
+        return old
+
+    def _invalidate(self, *keys):
+        for row in self._pool:
+            if row.key in keys:
+                row.key = None
+
+    def _invalidate_all(self):
+        for row in self._pool:
+            row.key = None
+
+    # --- Virtual list ---
+
+    def _view_height(self) -> float:
+        return self.viewport.winfo_height() / self._get_widget_scaling()
+
+    def _on_resize(self):
+        needed = math.ceil(self._view_height() / ROW_HEIGHT) + 1
+        while len(self._pool) < needed:
+            self._pool.append(_Row(self, self.viewport, self._fonts))
+        self._render()
+
+    def _max_top(self) -> float:
+        return max(0.0, len(self._items) * ROW_HEIGHT - self._view_height())
+
+    def _scroll_to(self, top: float):
+        top = min(max(0.0, top), self._max_top())
+        if top != self._top:
+            self._top = top
+            self._render()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(value) * len(self._items) * ROW_HEIGHT)
+        elif action == "scroll":
+            step = self._view_height() if unit == "pages" else ROW_HEIGHT
+            self._scroll_to(self._top + int(value) * step)
+
+    def _bind_wheel(self, widget):
+        if sys.platform.startswith("linux"):
+            widget.bind("<Button-4>", lambda e: self._scroll_to(self._top - 3 * ROW_HEIGHT))
+            widget.bind("<Button-5>", lambda e: self._scroll_to(self._top + 3 * ROW_HEIGHT))
+        else:
+            widget.bind("<MouseWheel>", self._on_mousewheel)
+
+    def _on_mousewheel(self, event):
+        if sys.platform == "darwin":
+            self._scroll_to(self._top - event.delta * ROW_HEIGHT)
+        else:
+            self._scroll_to(self._top - (event.delta / 120) * 3 * ROW_HEIGHT)
+
+    def _render(self):
+        self._top = min(self._top, self._max_top())
+        first = int(self._top // ROW_HEIGHT)
+        for i, row in enumerate(self._pool):
+            index = first + i
+            if index >= len(self._items):
+                if row.placed:
+                    row.slot.place_forget()
+                    row.placed = False
+                row.key = None
+                continue
+            key = self._items[index]
+            row.index = index
+            if row.key != key:
+                self._bind_row(row, key)
+            row.slot.place(x=0, y=index * ROW_HEIGHT - self._top, relwidth=1)
+            row.placed = True
+
+        total = len(self._items) * ROW_HEIGHT
+        if total <= 0:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self._top / total, min(1.0, (self._top + self._view_height()) / total))
+
+    def _bind_row(self, row: _Row, key: tuple):
+        row.key = key
+        kind, ident = key
+        row.set_kind(kind, self._fonts)
+        if kind == "cat":
+            arrow = "▶" if self._is_collapsed(ident) else "▼"
+            count = self._shown_counts.get(ident, self._counts.get(ident, 0))
+            row.name.configure(text=f" {arrow}  {self._headers[ident]}  ({count})")
+            return
+        if kind == "smart":
+            arrow = "▶" if self._smart_collapsed(ident) else "▼"
+            name = next((f["name"] for f in self._smart_folders if f["id"] == ident), "")
+            count = self._shown_counts.get(key)
+            row.name.configure(text=f" {arrow}  ★ {name}" + (f"  ({count})" if count is not None else ""))
+            return
+        conn = self._all[ident]
+        if self._probing and ident not in self._probed:
+            self._probe(conn)
+        self._style_selection(row)
+        status = self._status_cache.get(ident, "gray")
+        row.dot.configure(text_color=STATUS_COLORS.get(status, STATUS_COLORS["gray"]))
+        row.name.configure(text=conn["name"])
+        row.host.configure(text=conn["hostname"])
+
+    def _style_selection(self, row: _Row):
+        is_selected = row.key[1] == self._selected_id or row.key[1] in self._selection
+        row.body.configure(fg_color=ROW_SELECTED_COLOR if is_selected else ROW_COLOR)
+
+    def _ensure_visible(self, index: int):
+        y = index * ROW_HEIGHT
+        if y < self._top:
+            self._scroll_to(y)
+        elif y + ROW_HEIGHT > self._top + self._view_height():
+            self._scroll_to(y + ROW_HEIGHT - self._view_height())
+
+    def _rows_for(self, conn_id: int) -> list[_Row]:
+        return [r for r in self._pool if r.key == ("conn", conn_id)]
+
+    def _on_row_click(self, row: _Row, mode: str = "single"):
+        if row.key is None:
+            return
+        kind, ident = row.key
+        if kind == "cat":
+            self._toggle_category(ident)
+        elif kind == "smart":
+            self._toggle_smart(ident)
+        elif mode == "single":
+            self._anchor = row.index
+            self._select(ident)
+        else:
+            self._extend_selection(ident, mode)
+
+    def _on_row_double_click(self, row: _Row):
+        if row.key is not None and row.key[0] == "conn":
+            self._double_click(row.key[1])
+
+    def _on_row_context(self, row: _Row, event):
+        if row.key is not None and row.key[0] == "conn":
+            self._show_context(event, row.key[1])
+        elif row.key is not None and row.key[0] == "smart":
+            self._ctx_smart_id = row.key[1]
+            try:
+                self._smart_menu.tk_popup(event.x_root, event.y_root)
+            finally:
+                self._smart_menu.grab_release()
 
     def _toggle_category(self, cat_id):
-        self._collapsed[cat_id] = not self._collapsed.get(cat_id, False)
-        self.refresh()
+        collapsed = not self._is_collapsed(cat_id)
+        self._collapsed[cat_id] = collapsed
+        if not collapsed and self._load_groups([cat_id]):
+            # Freshly fetched rows may also have refreshed other groups.
+            self._rebuild_items()
+            self._invalidate_all()
+            self._render()
+            return
+        start = self._items.index(("cat", cat_id)) + 1
+        members = self._groups.get(cat_id, [])
+        if self._tag_matches is not None:
+            members = [conn_id for conn_id in members if conn_id in self._tag_matches]
+        if collapsed:
+            del self._items[start:start + len(members)]
+        else:
+            self._items[start:start] = [("conn", conn_id) for conn_id in members]
+        self._invalidate(("cat", cat_id))
+        self._render()
+
+    def _toggle_smart(self, fid: int):
+        self._collapsed[("smart", fid)] = not self._smart_collapsed(fid)
+        self._rebuild_items()
+        self._invalidate(("smart", fid))
+        self._render()
 
     def _select(self, conn_id: int):
+        previous = self._selection | {self._selected_id}
         self._selected_id = conn_id
-        self.refresh()
+        self._selection = {conn_id}
+        for cid in previous | {conn_id}:
+            for row in self._rows_for(cid):
+                self._style_selection(row)
         if self.on_select:
             self.on_select(conn_id)
 
+    def _extend_selection(self, conn_id: int, mode: str):
+        if self._selected_id is None:
+            self._select(conn_id)
+            return
+        self._selection.add(self._selected_id)
+        if mode == "toggle":
+            self._selection ^= {conn_id}
+        else:
+            shown = [ident for kind, ident in self._items if kind == "conn"]
+            if self._selected_id in shown and conn_id in shown:
+                a, b = sorted((shown.index(self._selected_id), shown.index(conn_id)))
+                self._selection = set(shown[a:b + 1])
+            else:
+                self._selection.add(conn_id)
+        for row in self._pool:
+            if row.key is not None and row.key[0] == "conn":
+                self._style_selection(row)
+
     def _double_click(self, conn_id: int):
         if self.on_connect:
             self.on_connect(conn_id)
 
     def _show_context(self, event, conn_id: int):
+        if conn_id in self._selection and len(self.get_selected_ids()) > 1:
+            self._show_bulk_context(event)
+            return
         self._ctx_conn_id = conn_id
         self._select(conn_id)
         try:
@@ -167,6 +869,36 @@ class Sidebar(ctk.CTkFrame):
         finally:
             self._context_menu.grab_release()
 
+    def _show_bulk_context(self, event):
+        # The category list can change between popups, so the submenu is
+        # rebuilt each time.
+        self._move_menu.delete(0, "end")
+        for cat in self._all_categories:
+            self._move_menu.add_command(
+                label=cat["name"], command=lambda cid=cat["id"]: self._bulk_update({"category_id": cid}))
+        self._move_menu.add_separator()
+        self._move_menu.add_command(label="Uncategorized",
+                                    command=lambda: self._bulk_update({"category_id": None}))
+        self._template_menu.delete(0, "end")
+        for template in db.get_templates():
+            self._template_menu.add_command(
+                label=template["name"], command=lambda tid=template["id"]: self._bulk_update({"template_id": tid}))
+        self._template_menu.add_separator()
+        self._template_menu.add_command(label="(None)", command=lambda: self._bulk_update({"template_id": None}))
+        self._bulk_menu.entryconfigure("end", label=f"Delete {len(self.get_selected_ids())} connections")
+        try:
+            self._bulk_menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            self._bulk_menu.grab_release()
+
+    def _bulk_update(self, fields: dict):
+        if self.on_bulk_update:
+            self.on_bulk_update(self.get_selected_ids(), fields)
+
+    def _bulk_delete(self):
+        if self.on_bulk_delete:
+            self.on_bulk_delete(self.get_selected_ids())
+
     def _ctx_connect(self):
         if self._ctx_conn_id and self.on_connect:
             self.on_connect(self._ctx_conn_id)
@@ -183,24 +915,75 @@ class Sidebar(ctk.CTkFrame):
         if self._ctx_conn_id and self.on_duplicate:
             self.on_duplicate(self._ctx_conn_id)
 
-    def _check_status_all(self, connections: list):
-        for conn in connections:
-            t = threading.Thread(
-                target=self._check_single, args=(conn["id"], conn["hostname"]),
-                daemon=True,
-            )
-            t.start()
-
-    def _check_single(self, conn_id: int, hostname: str):
-        alive = ping_host(hostname)
-        self._status_cache[conn_id] = "green" if alive else "red"
-        try:
-            widget = self._widgets.get(conn_id)
-            if widget and widget["dot"].winfo_exists():
-                color = "#22c55e" if alive else "#ef4444"
-                widget["dot"].configure(text_color=color)
-        except Exception:
-            pass
+    def _ctx_edit_smart(self):
+        if self._ctx_smart_id and self.on_edit_smart:
+            self.on_edit_smart(self._ctx_smart_id)
+
+    def _ctx_delete_smart(self):
+        if self._ctx_smart_id and self.on_delete_smart:
+            self.on_delete_smart(self._ctx_smart_id)
+
+    def _probe(self, conn: dict):
+        self._probed.add(conn["id"])
+        self._probe_pool.submit(self._check_single, conn["id"], conn["hostname"], conn["port"],
+                                self._probe_generation)
+
+    def _check_single(self, conn_id: int, hostname: str, port: int, generation: int):
+        # Runs on a probe worker: never touch widgets here, hand the result
+        # to the dispatcher instead. Probes queued before the last full
+        # refresh are skipped.
+        if generation != self._probe_generation:
+            return
+        with span("probe", cat="probe", host=hostname):
+            alive = tcp_probe(hostname, port)
+        self.dispatcher.post(self._apply_status, conn_id, alive, key=("status", conn_id))
+
+    def _apply_status(self, conn_id: int, alive: bool):
+        status = "green" if alive else "red"
+        self._status_cache[conn_id] = status
+        for row in self._rows_for(conn_id):
+            row.dot.configure(text_color=STATUS_COLORS[status])
+        if self._smart_loaded and conn_id in self._all:
+            self._smart_changed(self._smart_update(conn_id))
+
+    def shutdown(self):
+        self._probe_pool.shutdown(wait=False, cancel_futures=True)
 
     def get_selected_id(self) -> int | None:
         return self._selected_id
+
+    def get_selected_ids(self) -> list[int]:
+        ids = set(self._selection)
+        if self._selected_id is not None:
+            ids.add(self._selected_id)
+        return sorted(ids)
+
+    def get_connection(self, conn_id: int) -> dict | None:
+        return self._all.get(conn_id)
+
+    def get_tags(self, conn_id: int) -> list[str]:
+        if self._tags_loaded:
+            return self.tags.tags_of(conn_id)
+        tags = self._tag_cache.get(conn_id)
+        if tags is None:
+            tags = self._tag_cache[conn_id] = db.get_connection_tags(conn_id)
+        return tags
+
+    def first_result(self) -> int | None:
+        return self._ranked[0] if self._filter_text and self._ranked else None
+
+    def move_selection(self, delta: int):
+        items = self._items
+        if 0 <= self._anchor < len(items) and items[self._anchor] == ("conn", self._selected_id):
+            index = self._anchor
+        elif ("conn", self._selected_id) in items:
+            index = items.index(("conn", self._selected_id))
+        else:
+            index = -1 if delta > 0 else len(items)
+        index += delta
+        while 0 <= index < len(items) and items[index][0] != "conn":
+            index += delta
+        if 0 <= index < len(items):
+            self._ensure_visible(index)
+            self._select(items[index][1])
+            self._anchor = index